@@ -0,0 +1,258 @@
+"""
+Recorded census api fixtures for the benchmark suite.
+
+Responses are generated deterministically in the same layouts the
+census api returns and recorded into a `ResponseCache`, the same
+store `CensusAPIEndpoint.response_cache` keeps under
+`RESPONSE_CACHE_DIR`, so the pipeline replays them offline exactly
+as it would a real recording.
+"""
+
+import json
+import random
+from pathlib import Path
+from typing import NamedTuple
+
+from src.dataops.cache import ResponseCache
+from src.dataops.models import CensusAPIEndpoint
+
+
+class Scenario(NamedTuple):
+    name: str
+    url: str
+    # number of geographies (rows) in the data response
+    geographies: int
+    # trailing geography columns the api appends for `for=` queries
+    geo_headers: tuple[str, ...]
+    group: str
+    lines: int
+    # subject tables repeat every line across C01..Cnn columns
+    columns: int = 0
+
+
+SCENARIOS = [
+    Scenario(
+        name="state_group",
+        url="https://api.census.gov/data/2023/acs/acs5?get=group(B19013A)&for=state:*",
+        geographies=52,
+        geo_headers=("state",),
+        group="B19013A",
+        lines=1,
+    ),
+    Scenario(
+        name="county",
+        url="https://api.census.gov/data/2023/acs/acs5?get=group(B01001)&for=county:*",
+        geographies=3_222,
+        geo_headers=("state", "county"),
+        group="B01001",
+        lines=49,
+    ),
+    Scenario(
+        name="tract",
+        url="https://api.census.gov/data/2023/acs/acs5?get=group(B19001)&for=tract:*",
+        geographies=85_396,
+        geo_headers=("state", "county", "tract"),
+        group="B19001",
+        lines=17,
+    ),
+    Scenario(
+        name="subject",
+        url="https://api.census.gov/data/2023/acs/acs5/subject?get=group(S2701)&ucgid=0400000US09",
+        geographies=1,
+        geo_headers=("ucgid",),
+        group="S2701",
+        lines=62,
+        columns=5,
+    ),
+    Scenario(
+        name="pseudo",
+        url="https://api.census.gov/data/2023/acs/acs5?get=group(B19013H)&ucgid=pseudo(0400000US09$0600000)",
+        geographies=169,
+        geo_headers=("ucgid",),
+        group="B19013H",
+        lines=1,
+    ),
+]
+
+# unrelated variables padding each /variables payload to a realistic size
+FILLER_VARIABLES = 28_000
+
+CONCEPTS = {
+    "B19013A": "Median Household Income in the Past 12 Months (in 2023 Inflation-Adjusted Dollars) (White Alone Householder)",
+    "B19013H": "Median Household Income in the Past 12 Months (in 2023 Inflation-Adjusted Dollars) (White Alone, Not Hispanic or Latino Householder)",
+    "B01001": "Sex by Age",
+    "B19001": "Household Income in the Past 12 Months (in 2023 Inflation-Adjusted Dollars)",
+    "S2701": "Selected Characteristics of Health Insurance Coverage in the United States",
+}
+
+
+def variable_stems(scenario: Scenario) -> list[str]:
+    """Variable names of the scenario's group without the E/M suffix."""
+    if scenario.columns:
+        return [
+            f"{scenario.group}_C{column:02d}_{line:03d}"
+            for column in range(1, scenario.columns + 1)
+            for line in range(1, scenario.lines + 1)
+        ]
+    return [f"{scenario.group}_{line:03d}" for line in range(1, scenario.lines + 1)]
+
+
+def geography(scenario: Scenario, index: int) -> tuple[str, str, list[str]]:
+    """GEO_ID, NAME and trailing geography values for one row."""
+    state = index % 56 + 1
+    county = index // 56 % 200 * 2 + 1
+    tract = index * 100 % 999_900 + 100
+
+    if scenario.name == "pseudo":
+        geo_id = f"0600000US09{county:03d}{index:05d}"
+        return geo_id, f"Town {index}, Connecticut", [geo_id]
+    if scenario.name == "subject":
+        return "0400000US09", "Connecticut", ["0400000US09"]
+    if "tract" in scenario.geo_headers:
+        return (
+            f"1400000US{state:02d}{county:03d}{tract:06d}",
+            f"Census Tract {tract / 100:.2f}; County {county}; State {state}",
+            [f"{state:02d}", f"{county:03d}", f"{tract:06d}"],
+        )
+    if "county" in scenario.geo_headers:
+        return (
+            f"0500000US{state:02d}{county:03d}",
+            f"County {county}, State {state}",
+            [f"{state:02d}", f"{county:03d}"],
+        )
+    return f"0400000US{state:02d}", f"State {state}", [f"{state:02d}"]
+
+
+def row_count(scenario: Scenario, scale: float = 1.0) -> int:
+    """Geographies in the scenario's data response at `scale`."""
+    return max(int(scenario.geographies * scale), 1)
+
+
+def data_payload(scenario: Scenario, scale: float = 1.0) -> list[list]:
+    """A `group()` data response: GEO_ID, NAME, E/M/EA/MA per variable, geos."""
+    rng = random.Random(scenario.name)
+    stems = variable_stems(scenario)
+
+    headers = ["GEO_ID", "NAME"]
+    for stem in stems:
+        headers += [f"{stem}E", f"{stem}M", f"{stem}EA", f"{stem}MA"]
+    headers += list(scenario.geo_headers)
+
+    rows = [headers]
+    for index in range(row_count(scenario, scale)):
+        geo_id, name, geo_values = geography(scenario, index)
+        row = [geo_id, name]
+        for _ in stems:
+            if rng.random() < 0.02:
+                # suppressed estimates are dropped by the tidy transform
+                row += ["-666666666", "-222222222", "-", "***"]
+            else:
+                row += [str(rng.randint(0, 250_000)), str(rng.randint(0, 9_000))]
+                row += [None, None]
+        rows.append(row + geo_values)
+
+    return rows
+
+
+def variables_payload(scenarios: list[Scenario]) -> list[list]:
+    """A /variables response covering the scenarios' groups plus filler."""
+    rng = random.Random("variables")
+    rows = [
+        [
+            "name",
+            "label",
+            "concept",
+            "predicateType",
+            "group",
+            "limit",
+            "predicateOnly",
+            "attributes",
+        ],
+        ["for", "Census API FIPS 'for' clause", "Census API Geography Specification"]
+        + ["fips-for", "N/A", "0", "true", None],
+        ["in", "Census API FIPS 'in' clause", "Census API Geography Specification"]
+        + ["fips-in", "N/A", "0", "true", None],
+        [
+            "ucgid",
+            "Uniform Census Geography Identifier clause",
+            "Census API Geography Specification",
+        ]
+        + ["ucgid", "N/A", "0", "true", None],
+        ["GEO_ID", "Geography", None, "string", "N/A", "0", None, "NAME"],
+        ["NAME", "Geographic Area Name", None, "string", "N/A", "0", None, None],
+    ]
+
+    for scenario in scenarios:
+        concept = CONCEPTS[scenario.group]
+        for line, stem in enumerate(variable_stems(scenario), start=1):
+            label = f"Total:!!Line {line % 17}:!!Item {line}"
+            for suffix, kind in [("E", "Estimate"), ("M", "Margin of Error")]:
+                rows.append(
+                    [
+                        f"{stem}{suffix}",
+                        f"{kind}!!{label}",
+                        concept,
+                        "int",
+                        scenario.group,
+                        "0",
+                        None,
+                        f"{stem}{suffix}A",
+                    ]
+                )
+
+    for index in range(FILLER_VARIABLES):
+        group = f"B{rng.randint(20000, 29999)}"
+        rows.append(
+            [
+                f"{group}_{index % 100:03d}E",
+                f"Estimate!!Total:!!Filler {index}",
+                f"Filler concept {group}",
+                "int",
+                group,
+                "0",
+                None,
+                f"{group}_{index % 100:03d}M,{group}_{index % 100:03d}EA",
+            ]
+        )
+
+    return rows
+
+
+def record_fixtures(
+    cache_dir: str | Path,
+    scenarios: list[Scenario] = SCENARIOS,
+    scale: float = 1.0,
+) -> ResponseCache:
+    """
+    Records the scenarios' data and /variables responses into a response
+    cache at `cache_dir`, skipping any already recorded (data responses
+    only at the same `scale`), and returns the cache in offline mode.
+    """
+    cache = ResponseCache(cache_dir, max_bytes=2**40)
+
+    # every known scenario goes into the shared /variables payloads so
+    # recordings made for different subsets stay compatible
+    variable_urls = {}
+    for scenario in dict.fromkeys(SCENARIOS + list(scenarios)):
+        endpoint = CensusAPIEndpoint.from_url(scenario.url)
+        variable_urls.setdefault(endpoint.variable_url, []).append(scenario)
+
+    for scenario in scenarios:
+        endpoint = CensusAPIEndpoint.from_url(scenario.url)
+        recorded = cache.get(endpoint.url_no_key)
+        # the cache is keyed by url alone, so a recording made at another
+        # scale is told apart by its row count (plus the header)
+        expected = row_count(scenario, scale) + 1
+        if recorded is None or len(json.loads(recorded)) != expected:
+            cache.put(
+                endpoint.url_no_key, json.dumps(data_payload(scenario, scale)).encode()
+            )
+
+    for variable_url, url_scenarios in variable_urls.items():
+        if cache.get(variable_url) is None:
+            cache.put(
+                variable_url, json.dumps(variables_payload(url_scenarios)).encode()
+            )
+
+    cache.offline = True
+    return cache
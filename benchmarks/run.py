@@ -0,0 +1,194 @@
+"""
+Benchmark the census fetch-and-tidy pipeline against recorded fixtures.
+
+    python -m benchmarks.run --scale 0.1
+    python -m benchmarks.run --json results.json
+    python -m benchmarks.run --baseline results.json --tolerance 0.25
+
+Each scenario is replayed offline and timed stage by stage: decoding
+the raw json, reshaping the data to the long layout, building and
+filtering the variable labels, the tidy transform, and the whole
+`fetch_tidy_data` call. Wall time, peak RSS and rows/sec are reported
+per stage. With `--baseline` the run exits non-zero when any stage is
+more than `--tolerance` slower than the saved results.
+"""
+
+import argparse
+import gc
+import json
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+import polars as pl
+
+from benchmarks.fixtures import SCENARIOS, Scenario, record_fixtures
+from src.dataops import transport
+from src.dataops.cache import ResponseCache, VariableCache
+from src.dataops.models import CensusAPIEndpoint, variables_to_polars
+
+
+def reset_peak_rss() -> None:
+    """Resets the peak RSS high-water mark where the kernel allows it."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS since the last reset (Linux), or since process start."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(scenario: str, stage: str, fn: Callable):
+    """Runs one stage and returns its result and measurements."""
+    gc.collect()
+    reset_peak_rss()
+
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+
+    rows = result.height if isinstance(result, pl.DataFrame) else len(result) - 1
+    return result, {
+        "scenario": scenario,
+        "stage": stage,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_scenario(scenario: Scenario, cache: ResponseCache) -> list[dict]:
+    """Times every pipeline stage of one scenario."""
+    endpoint = CensusAPIEndpoint.from_url(scenario.url)
+    raw_data = cache.get(endpoint.url_no_key)
+    raw_variables = cache.get(endpoint.variable_url)
+    results = []
+
+    data, result = measure(
+        scenario.name,
+        "decode",
+        lambda: transport.decode_json(raw_data, endpoint.url_no_key),
+    )
+    results.append(result)
+
+    long, result = measure(
+        scenario.name, "parse", lambda: endpoint.data_to_polars(data)
+    )
+    results.append(result)
+
+    def build_labels() -> pl.DataFrame:
+        variables = transport.decode_json(raw_variables, endpoint.variable_url)
+        labels = variables_to_polars(variables, date_pulled=datetime.now())
+        return endpoint.filter_variable_labels(labels)
+
+    labels, result = measure(scenario.name, "labels", build_labels)
+    results.append(result)
+
+    _, result = measure(scenario.name, "tidy", lambda: endpoint.tidy_data(labels, long))
+    results.append(result)
+
+    # end to end, replaying both responses with a cold variable cache
+    previous = CensusAPIEndpoint.variable_cache, CensusAPIEndpoint.response_cache
+    CensusAPIEndpoint.variable_cache = VariableCache()
+    CensusAPIEndpoint.response_cache = cache
+    try:
+        _, result = measure(scenario.name, "end_to_end", endpoint.fetch_tidy_data)
+    finally:
+        CensusAPIEndpoint.variable_cache, CensusAPIEndpoint.response_cache = previous
+    results.append(result)
+
+    return results
+
+
+def run_benchmarks(
+    scenarios: list[Scenario] = SCENARIOS,
+    scale: float = 1.0,
+    cache_dir: str | Path | None = None,
+) -> pl.DataFrame:
+    """
+    Records fixtures (reusing any already in `cache_dir`) and
+    benchmarks each scenario, returning one row per stage.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = record_fixtures(cache_dir or tmp_dir, scenarios, scale=scale)
+        results = [
+            result for scenario in scenarios for result in run_scenario(scenario, cache)
+        ]
+
+    return pl.DataFrame(results)
+
+
+def compare(results: pl.DataFrame, baseline: pl.DataFrame, tolerance: float):
+    """Returns the stages more than `tolerance` slower than the baseline."""
+    return (
+        results.join(
+            baseline.select("scenario", "stage", baseline_seconds="seconds"),
+            on=["scenario", "stage"],
+        )
+        .with_columns(slowdown=pl.col("seconds") / pl.col("baseline_seconds") - 1)
+        .filter(pl.col("slowdown") > tolerance)
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=[scenario.name for scenario in SCENARIOS],
+        help="Scenario to run, may be repeated (default: all).",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Fraction of rows to generate."
+    )
+    parser.add_argument(
+        "--cache-dir", help="Response cache holding (or receiving) the fixtures."
+    )
+    parser.add_argument("--json", help="Write the results to this file.")
+    parser.add_argument("--baseline", help="Results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    scenarios = [
+        scenario
+        for scenario in SCENARIOS
+        if args.scenario is None or scenario.name in args.scenario
+    ]
+    results = run_benchmarks(scenarios, scale=args.scale, cache_dir=args.cache_dir)
+
+    with pl.Config(tbl_rows=-1, tbl_hide_dataframe_shape=True, float_precision=3):
+        print(results)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results.to_dicts(), indent=2))
+
+    if args.baseline:
+        baseline = pl.DataFrame(json.loads(Path(args.baseline).read_text()))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions.height:
+            print("Regressions:")
+            print(regressions.select("scenario", "stage", "seconds", "slowdown"))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+pytest-benchmark suite for the census pipeline, run on demand with
+
+    pytest benchmarks --benchmark-autosave
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:25%
+
+Set `BENCHMARK_SCALE` to replay a fraction of each scenario's rows.
+"""
+
+import os
+from datetime import datetime
+
+import pytest
+
+from benchmarks.fixtures import SCENARIOS, record_fixtures
+from src.dataops import transport
+from src.dataops.cache import VariableCache
+from src.dataops.models import CensusAPIEndpoint, variables_to_polars
+
+pytest.importorskip("pytest_benchmark")
+
+SCALE = float(os.environ.get("BENCHMARK_SCALE", "1.0"))
+
+
+@pytest.fixture(scope="session")
+def response_cache(tmp_path_factory):
+    return record_fixtures(tmp_path_factory.mktemp("fixtures"), scale=SCALE)
+
+
+@pytest.fixture(params=SCENARIOS, ids=lambda scenario: scenario.name)
+def endpoint(request, response_cache, monkeypatch):
+    monkeypatch.setattr(CensusAPIEndpoint, "response_cache", response_cache)
+    return CensusAPIEndpoint.from_url(request.param.url)
+
+
+def test_decode(benchmark, endpoint):
+    content = endpoint.response_cache.get(endpoint.url_no_key)
+    benchmark(transport.decode_json, content, endpoint.url_no_key)
+
+
+def test_parse(benchmark, endpoint):
+    data = endpoint.get_json(endpoint.full_url, endpoint.url_no_key)
+    benchmark(endpoint.data_to_polars, data)
+
+
+def test_labels(benchmark, endpoint):
+    variables = endpoint.get_json(endpoint.variable_url, endpoint.variable_url)
+
+    def labels():
+        frame = variables_to_polars(variables, date_pulled=datetime.now())
+        return endpoint.filter_variable_labels(frame)
+
+    benchmark(labels)
+
+
+def test_tidy(benchmark, endpoint):
+    labels = endpoint.filter_variable_labels(endpoint.download_variable_labels())
+    data = endpoint.fetch_data_to_polars()
+    benchmark(endpoint.tidy_data, labels, data)
+
+
+def test_end_to_end(benchmark, endpoint, monkeypatch):
+    def fetch_cold():
+        monkeypatch.setattr(CensusAPIEndpoint, "variable_cache", VariableCache())
+        return endpoint.fetch_tidy_data()
+
+    benchmark(fetch_cold)
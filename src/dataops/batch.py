@@ -0,0 +1,547 @@
+import asyncio
+import multiprocessing
+import time
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Coroutine, Iterable, Literal, Optional, TypeVar
+from urllib.parse import urlparse
+
+import httpx
+import polars as pl
+
+from . import planner, transport
+from .cache import ResponseCache
+from .catalog import EndpointCatalog
+from .models import TIDY_SCHEMA, CensusAPIEndpoint, tidy_batch, variables_to_polars
+
+T = TypeVar("T")
+
+
+class BatchFetchError(Exception):
+    """
+    Raised when some endpoints of a batch failed. The frames of the
+    endpoints that succeeded are kept on `frames`, and `failed_endpoints`
+    can be passed straight back to the batch fetcher to retry only those.
+    """
+
+    def __init__(
+        self,
+        frames: dict[str, pl.DataFrame],
+        failures: dict[str, Exception],
+        failed_endpoints: list[CensusAPIEndpoint],
+    ):
+        super().__init__(
+            f"{len(failures)} of {len(failures) + len(frames)} endpoints failed: "
+            + "; ".join(f"{url}: {error}" for url, error in failures.items())
+        )
+        self.frames = frames
+        self.failures = failures
+        self.failed_endpoints = failed_endpoints
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests so that each host receives at most
+    `requests_per_second` requests. No limit is applied when
+    `requests_per_second` is None.
+    """
+
+    def __init__(self, requests_per_second: Optional[float] = None):
+        self.interval = 1 / requests_per_second if requests_per_second else 0.0
+        self._next_slot: dict[str, float] = defaultdict(float)
+        self._locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def wait(self, url: str) -> None:
+        """Sleeps until the url's host has a free request slot."""
+        if not self.interval:
+            return
+
+        host = urlparse(url).netloc
+        async with self._locks[host]:
+            now = time.monotonic()
+            slot = max(now, self._next_slot[host])
+            self._next_slot[host] = slot + self.interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def as_endpoints(
+    endpoints: EndpointCatalog | Iterable[CensusAPIEndpoint | str],
+) -> list[CensusAPIEndpoint]:
+    """Accepts a catalog, endpoints or census api urls and returns endpoints."""
+    if isinstance(endpoints, EndpointCatalog):
+        return endpoints.to_endpoints()
+
+    return [
+        endpoint
+        if isinstance(endpoint, CensusAPIEndpoint)
+        else CensusAPIEndpoint.from_url(endpoint)
+        for endpoint in endpoints
+    ]
+
+
+async def _get_json(
+    client: httpx.AsyncClient,
+    url: str,
+    semaphore: asyncio.Semaphore,
+    limiter: HostRateLimiter,
+    log_url: Optional[str] = None,
+    policy: Optional[transport.RetryPolicy] = None,
+    cache: Optional[ResponseCache] = None,
+    decode: bool = True,
+):
+    log_url = log_url or url
+    content = cache.get(log_url) if cache is not None else None
+
+    if content is None:
+        if cache is not None:
+            cache.raise_if_offline(log_url)
+
+        async with semaphore:
+            await limiter.wait(url)
+            response = await transport.arequest(
+                client, "GET", url, policy=policy, log_url=log_url
+            )
+        content = response.content
+
+        if cache is not None:
+            cache.put(log_url, content)
+
+    if not decode:
+        return content
+    return transport.decode_json(content, log_url)
+
+
+async def _fetch_metadata(
+    client: httpx.AsyncClient,
+    endpoints: list[CensusAPIEndpoint],
+    semaphore: asyncio.Semaphore,
+    limiter: HostRateLimiter,
+    policy: Optional[transport.RetryPolicy] = None,
+) -> tuple[dict[tuple[int, str], pl.DataFrame], dict[tuple[int, str], Exception]]:
+    """
+    Requests the variable metadata of every (year, dataset) not already
+    in the endpoints' variable cache, once each, and stores it there.
+
+    Returns the metadata of every (year, dataset), held for the batch
+    so entries the cache evicts meanwhile aren't downloaded again, and
+    the errors of the datasets that failed.
+    """
+
+    metadata = {}
+    metadata_endpoints = {}
+    for endpoint in endpoints:
+        key = (endpoint.year, endpoint.dataset)
+        if key in metadata or key in metadata_endpoints:
+            continue
+        labels = endpoint.variable_cache.get(*key)
+        if labels is None:
+            metadata_endpoints[key] = endpoint
+        else:
+            metadata[key] = labels
+
+    payloads = await asyncio.gather(
+        *(
+            _get_json(
+                client,
+                endpoint.variable_url,
+                semaphore,
+                limiter,
+                policy=policy,
+                cache=endpoint.response_cache,
+            )
+            for endpoint in metadata_endpoints.values()
+        ),
+        return_exceptions=True,
+    )
+
+    failures = {}
+    for (key, endpoint), payload in zip(metadata_endpoints.items(), payloads):
+        if isinstance(payload, Exception):
+            failures[key] = payload
+            continue
+        metadata[key] = variables_to_polars(payload, date_pulled=datetime.now())
+        endpoint.variable_cache.put(*key, metadata[key])
+
+    return metadata, failures
+
+
+async def _fetch_requests(
+    client: httpx.AsyncClient,
+    requests: list[planner.CoalescedRequest],
+    semaphore: asyncio.Semaphore,
+    limiter: HostRateLimiter,
+    policy: Optional[transport.RetryPolicy] = None,
+    decode: bool = True,
+) -> list:
+    """
+    Responses of the planned requests, decoded or as raw bytes, or
+    their errors.
+    """
+    return await asyncio.gather(
+        *(
+            _get_json(
+                client,
+                request.endpoint.full_url,
+                semaphore,
+                limiter,
+                log_url=request.endpoint.url_no_key,
+                policy=policy,
+                cache=request.endpoint.response_cache,
+                decode=decode,
+            )
+            for request in requests
+        ),
+        return_exceptions=True,
+    )
+
+
+def _tidy_request(
+    request: planner.CoalescedRequest, payload
+) -> dict[str, pl.DataFrame | Exception]:
+    """
+    The tidy frame (or error) of every resolved member of a request,
+    keyed by `url_no_key`, from its decoded or raw response. Runs in
+    pool workers, so it only touches what is pickled along.
+    """
+
+    if isinstance(payload, bytes):
+        try:
+            payload = transport.decode_json(payload, request.endpoint.url_no_key)
+        except transport.InvalidResponseError as e:
+            payload = e
+    if isinstance(payload, Exception):
+        return dict.fromkeys(request.columns, payload)
+
+    try:
+        frames = request.split(payload)
+    except Exception as e:
+        return dict.fromkeys(request.columns, e)
+
+    tidied = {}
+    for member in request.members:
+        if not member.is_resolved:
+            continue
+        try:
+            tidied[member.url_no_key] = member.tidy_data(
+                member.labels, frames[member.url_no_key], member.concept
+            )
+        except Exception as e:
+            tidied[member.url_no_key] = e
+    return tidied
+
+
+async def _tidy_requests(
+    requests: list[planner.CoalescedRequest],
+    payloads: list,
+    executor: Literal["serial", "batched", "process"] | Executor,
+    max_workers: Optional[int],
+) -> dict[str, pl.DataFrame | Exception]:
+    """
+    Tidies every request's response in this thread, one endpoint at a
+    time (`serial`) or all in one query (`batched`), in a new process
+    pool (`process`) or in the given executor. Endpoints whose response
+    can't be tidied get the error instead of a frame.
+    """
+
+    tidied = {}
+    if executor == "serial":
+        for request, payload in zip(requests, payloads):
+            tidied.update(_tidy_request(request, payload))
+        return tidied
+
+    if executor == "batched":
+        frames = {}
+        for request, payload in zip(requests, payloads):
+            if isinstance(payload, Exception):
+                tidied.update(dict.fromkeys(request.columns, payload))
+                continue
+            try:
+                frames.update(request.split(payload))
+            except Exception as e:
+                tidied.update(dict.fromkeys(request.columns, e))
+
+        members = [
+            member
+            for request in requests
+            for member in request.members
+            if member.is_resolved and member.url_no_key in frames
+        ]
+        try:
+            tidy = tidy_batch(members, frames)
+        except Exception as e:
+            # one query for all of them, so one error for all of them
+            tidied.update((member.url_no_key, e) for member in members)
+            return tidied
+        for member in members:
+            tidied[member.url_no_key] = pl.DataFrame(schema=TIDY_SCHEMA)
+        tidied.update(
+            (url, frame)
+            for (url,), frame in tidy.partition_by(
+                "full_url", as_dict=True, maintain_order=True
+            ).items()
+        )
+        return tidied
+
+    # forked children can deadlock on the parent's polars thread pool
+    pool = (
+        ProcessPoolExecutor(
+            max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        if executor == "process"
+        else executor
+    )
+    try:
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(pool, _tidy_request, request, payload)
+                for request, payload in zip(requests, payloads)
+            ),
+            return_exceptions=True,
+        )
+        for request, result in zip(requests, results):
+            # e.g. a worker that died or a result that couldn't be pickled
+            if isinstance(result, Exception):
+                result = dict.fromkeys(request.columns, result)
+            tidied.update(result)
+    finally:
+        if pool is not executor:
+            pool.shutdown()
+
+    return tidied
+
+
+def _run(coroutine: Coroutine[Any, Any, T]) -> T:
+    """
+    Runs a coroutine from blocking code. `asyncio.run` refuses to start
+    inside a running event loop (e.g. in Jupyter), so there the
+    coroutine gets its own loop in a worker thread and the caller
+    blocks until it's done; `await` the `_async` variant to avoid that.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    with ThreadPoolExecutor(1) as thread:
+        return thread.submit(asyncio.run, coroutine).result()
+
+
+def _client(
+    client: Optional[httpx.AsyncClient],
+    max_concurrency: int,
+    timeout: Optional[float],
+) -> httpx.AsyncClient:
+    return client or transport.shared_pool().async_client(
+        max_connections=max_concurrency, timeout=timeout
+    )
+
+
+async def prefetch_async(
+    endpoints: EndpointCatalog | Iterable[CensusAPIEndpoint | str],
+    max_concurrency: int = 8,
+    requests_per_second: Optional[float] = None,
+    timeout: Optional[float] = None,
+    client: Optional[httpx.AsyncClient] = None,
+    policy: Optional[transport.RetryPolicy] = None,
+) -> dict[str, Exception]:
+    """
+    Resolves the labels and concept of many endpoints, requesting the
+    variable metadata concurrently and only once per (year, dataset).
+
+    Returns the errors of endpoints that couldn't be resolved, keyed by
+    `url_no_key`; those endpoints are left unresolved.
+    """
+
+    endpoints = as_endpoints(endpoints)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = HostRateLimiter(requests_per_second)
+
+    http_client = _client(client, max_concurrency, timeout)
+    try:
+        metadata, metadata_failures = await _fetch_metadata(
+            http_client, endpoints, semaphore, limiter, policy=policy
+        )
+    finally:
+        if client is None:
+            await http_client.aclose()
+
+    failures = {}
+    for endpoint in endpoints:
+        key = (endpoint.year, endpoint.dataset)
+        error = metadata_failures.get(key)
+        if error is None:
+            try:
+                endpoint.resolve(labels=metadata[key])
+            except Exception as e:
+                # e.g. a group that isn't in the metadata
+                error = e
+        if error is not None:
+            failures[endpoint.url_no_key] = error
+
+    return failures
+
+
+def prefetch(
+    endpoints: EndpointCatalog | Iterable[CensusAPIEndpoint | str],
+    max_concurrency: int = 8,
+    requests_per_second: Optional[float] = None,
+    timeout: Optional[float] = None,
+    policy: Optional[transport.RetryPolicy] = None,
+) -> dict[str, Exception]:
+    """Blocking wrapper around `prefetch_async`."""
+    return _run(
+        prefetch_async(
+            endpoints,
+            max_concurrency=max_concurrency,
+            requests_per_second=requests_per_second,
+            timeout=timeout,
+            policy=policy,
+        )
+    )
+
+
+async def fetch_tidy_batch_async(
+    endpoints: EndpointCatalog | Iterable[CensusAPIEndpoint | str],
+    max_concurrency: int = 8,
+    requests_per_second: Optional[float] = None,
+    concat: bool = True,
+    timeout: Optional[float] = None,
+    client: Optional[httpx.AsyncClient] = None,
+    policy: Optional[transport.RetryPolicy] = None,
+    coalesce: bool = False,
+    executor: Literal["serial", "batched", "process"] | Executor = "serial",
+    max_workers: Optional[int] = None,
+) -> pl.DataFrame | dict[str, pl.DataFrame]:
+    """
+    Fetches the tidy data of many endpoints concurrently.
+
+    Data and variable metadata are requested over one pooled
+    `httpx.AsyncClient`, with at most `max_concurrency` requests in
+    flight and `requests_per_second` per host. Metadata is requested
+    once per (year, dataset) and stored in the endpoints' variable
+    cache. Returns a single concatenated frame, or a dict of frames
+    keyed by each endpoint's `url_no_key` when `concat` is False.
+
+    Requests are retried according to `policy`. Endpoints that still
+    fail, or whose response can't be tidied, don't stop the others;
+    a `BatchFetchError` carrying the successful frames and the failed
+    endpoints is raised at the end.
+
+    With `coalesce`, endpoints that differ only in their variables are
+    merged into as few api calls as possible (see `planner`), after the
+    metadata has been fetched.
+
+    Responses are decoded and tidied in this thread by default, one
+    endpoint at a time, or with `executor="batched"` all in a single
+    query (see `models.tidy_batch`). With `executor="process"` the
+    raw response bodies are handed to a pool
+    of `max_workers` processes instead, so decoding and the tidy
+    transform run on every core; an `Executor` can be passed to reuse
+    a pool across batches. Worker start-up costs about a second, so
+    this pays off for hundreds of endpoints rather than a handful.
+    """
+
+    endpoints = as_endpoints(endpoints)
+    decode = executor in ("serial", "batched")
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = HostRateLimiter(requests_per_second)
+
+    http_client = _client(client, max_concurrency, timeout)
+    try:
+        if coalesce:
+            # groups are expanded through the metadata while planning
+            metadata, metadata_failures = await _fetch_metadata(
+                http_client, endpoints, semaphore, limiter, policy=policy
+            )
+            requests = planner.plan_requests(
+                (
+                    endpoint
+                    for endpoint in endpoints
+                    if (endpoint.year, endpoint.dataset) not in metadata_failures
+                ),
+                metadata=metadata,
+            )
+            payloads = await _fetch_requests(
+                http_client, requests, semaphore, limiter, policy, decode
+            )
+        else:
+            requests = [planner.CoalescedRequest.single(e) for e in endpoints]
+            (metadata, metadata_failures), payloads = await asyncio.gather(
+                _fetch_metadata(
+                    http_client, endpoints, semaphore, limiter, policy=policy
+                ),
+                _fetch_requests(
+                    http_client, requests, semaphore, limiter, policy, decode
+                ),
+            )
+    finally:
+        if client is None:
+            await http_client.aclose()
+
+    # endpoints that can't be resolved are left out of the tidy step
+    failures = {}
+    for endpoint in endpoints:
+        key = (endpoint.year, endpoint.dataset)
+        error = metadata_failures.get(key)
+        if error is None:
+            try:
+                endpoint.resolve(labels=metadata[key])
+            except Exception as e:
+                error = e
+        if error is not None:
+            failures[endpoint.url_no_key] = error
+
+    # each endpoint's tidy frame, or the error that prevented it
+    results = await _tidy_requests(requests, payloads, executor, max_workers)
+
+    frames = {}
+    failed_endpoints = []
+    for endpoint in endpoints:
+        result = failures.get(endpoint.url_no_key, results.get(endpoint.url_no_key))
+        if isinstance(result, Exception):
+            failures[endpoint.url_no_key] = result
+            failed_endpoints.append(endpoint)
+            continue
+
+        frames[endpoint.url_no_key] = result
+
+    if failures:
+        raise BatchFetchError(frames, failures, failed_endpoints)
+
+    if concat:
+        if not frames:
+            return pl.DataFrame(schema=TIDY_SCHEMA)
+        return pl.concat(frames.values(), how="vertical_relaxed")
+
+    return frames
+
+
+def fetch_tidy_batch(
+    endpoints: EndpointCatalog | Iterable[CensusAPIEndpoint | str],
+    max_concurrency: int = 8,
+    requests_per_second: Optional[float] = None,
+    concat: bool = True,
+    timeout: Optional[float] = None,
+    policy: Optional[transport.RetryPolicy] = None,
+    coalesce: bool = False,
+    executor: Literal["serial", "batched", "process"] | Executor = "serial",
+    max_workers: Optional[int] = None,
+) -> pl.DataFrame | dict[str, pl.DataFrame]:
+    """Blocking wrapper around `fetch_tidy_batch_async`."""
+    return _run(
+        fetch_tidy_batch_async(
+            endpoints,
+            max_concurrency=max_concurrency,
+            requests_per_second=requests_per_second,
+            concat=concat,
+            timeout=timeout,
+            policy=policy,
+            coalesce=coalesce,
+            executor=executor,
+            max_workers=max_workers,
+        )
+    )
@@ -0,0 +1,186 @@
+import re
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+from polars.io.plugins import register_io_source
+
+# codes that can be labelled: integers, decimals, and BLANK for empty fields
+_CODE = re.compile(r"^(\d+(\.\d+)?|BLANK)$")
+
+# layout of a fixed-width field, per variable
+SPEC_SCHEMA = pl.Schema(
+    {
+        "variable": pl.String,
+        "label": pl.String,
+        "start": pl.Int32,
+        "width": pl.Int32,
+        "type": pl.String,
+    }
+)
+
+
+def column_spec(codebook: pl.DataFrame) -> pl.DataFrame:
+    """
+    The position and width of every variable of a codebook parsed by
+    `codebook.read_codebook`, in file order. Variables without a name
+    or column position are left out.
+    """
+
+    return (
+        codebook.drop_nulls(["variable", "start", "end"])
+        .unique("variable", keep="first", maintain_order=True)
+        .select(
+            "variable",
+            "label",
+            "start",
+            width=pl.col("end") - pl.col("start") + 1,
+            type="type",
+        )
+        .sort("start", maintain_order=True)
+        .cast(dict(SPEC_SCHEMA))
+    )
+
+
+def value_labels(codebook: pl.DataFrame) -> dict[str, dict[str, str]]:
+    """
+    Maps the codes of every categorical variable to their labels.
+    A variable is categorical when each of its values is a single code;
+    variables with ranges (`1 - 76`) or other values are measurements,
+    whose special codes stay numeric. `BLANK` maps empty fields.
+    """
+
+    labels: dict[str, dict[str, str]] = {}
+    skip = set()
+    for variable, value, label in codebook.select(
+        "variable", "value", "value_label"
+    ).iter_rows():
+        if variable is None or variable in skip or value is None:
+            continue
+        if not _CODE.match(value):
+            skip.add(variable)
+            labels.pop(variable, None)
+            continue
+        labels.setdefault(variable, {})[value] = label
+    return labels
+
+
+def _decoder(
+    variable: str, type: Optional[str], labels: Optional[dict[str, str]]
+) -> tuple[pl.Expr, pl.DataType]:
+    """Trims and decodes the sliced `variable` column, with its dtype."""
+
+    raw = pl.col(variable).str.strip_chars()
+    raw = pl.when(raw != "").then(raw)
+    numeric = type != "Char"
+
+    if labels is None:
+        if numeric:
+            return raw.cast(pl.Float64).alias(variable), pl.Float64
+        return raw.alias(variable), pl.String
+
+    labels = dict(labels)
+    blank = labels.pop("BLANK", None)
+    categories = [*labels.values(), *([blank] if blank is not None else [])]
+    dtype = pl.Enum(list(dict.fromkeys(categories)))
+    if numeric:
+        # fields are zero padded (`01`), codes in the codebook aren't
+        raw = raw.cast(pl.Float64)
+        labels = {float(code): label for code, label in labels.items()}
+
+    field = raw.replace_strict(labels, default=None, return_dtype=dtype)
+    if blank is not None:
+        field = pl.when(raw.is_null()).then(pl.lit(blank, dtype)).otherwise(field)
+    return field.alias(variable), dtype
+
+
+def scan_brfss(
+    path: str | Path,
+    codebook: pl.DataFrame,
+    columns: Optional[Iterable[str]] = None,
+    labels: bool = True,
+) -> pl.LazyFrame:
+    """
+    Lazily reads a BRFSS fixed-width ASCII data file (`LLCP*.ASC`)
+    using the column positions of its parsed codebook.
+
+    The file is streamed by the batched csv reader as one string per
+    respondent, so only a batch of lines is held in memory at a time.
+    Each variable is a vectorized byte slice of those lines, and only
+    the `columns` requested (or selected later on the frame) are
+    sliced and decoded. Numeric
+    variables become Float64 and character ones strings; empty
+    fields are null. With `labels`, categorical variables are mapped
+    to their value labels as Enums. The codebook counts every code
+    found in the data, so no code should be left without a label.
+    """
+
+    spec = column_spec(codebook)
+    if columns is not None:
+        columns = list(columns)
+        missing = set(columns) - set(spec["variable"])
+        if missing:
+            raise ValueError(f"Not in the codebook: {', '.join(sorted(missing))}")
+
+    mappings = value_labels(codebook) if labels else {}
+    positions, decoders, schema = {}, {}, {}
+    for variable, _, start, width, type in spec.iter_rows():
+        positions[variable] = (start - 1, start - 1 + width)
+        decoders[variable], schema[variable] = _decoder(
+            variable, type, mappings.get(variable)
+        )
+
+    def source(
+        with_columns: Optional[list[str]],
+        predicate: Optional[pl.Expr],
+        n_rows: Optional[int],
+        batch_size: Optional[int],
+    ) -> Iterator[pl.DataFrame]:
+        names = list(schema) if with_columns is None else with_columns
+        batch_size = batch_size or 100_000
+        reader = pl.read_csv_batched(
+            path,
+            has_header=False,
+            separator="\x1f",
+            quote_char=None,
+            new_columns=["line"],
+            schema_overrides={"column_1": pl.String},
+            encoding="utf8-lossy",
+            batch_size=batch_size,
+            n_rows=n_rows,
+        )
+        while batches := reader.next_batches(1):
+            # arrow slices bytes; polars' `str.slice` walks every line's
+            # characters up to the offset, which is slow for wide records
+            lines = batches[0]["line"].to_arrow().cast(pa.large_binary())
+            for offset in range(0, len(lines), batch_size):
+                batch = lines.slice(offset, batch_size)
+                fields = pl.DataFrame(
+                    {
+                        name: pc.binary_slice(batch, *positions[name]).cast(
+                            pa.large_string()
+                        )
+                        for name in names
+                    }
+                ).select(decoders[name] for name in names)
+                if predicate is not None:
+                    fields = fields.filter(predicate)
+                yield fields
+
+    # enums come back from the io source as categoricals
+    enums = {name: dtype for name, dtype in schema.items() if dtype == pl.Enum}
+    scan = register_io_source(source, schema=pl.Schema(schema)).cast(enums)
+    return scan if columns is None else scan.select(columns)
+
+
+def read_brfss(
+    path: str | Path,
+    codebook: pl.DataFrame,
+    columns: Optional[Iterable[str]] = None,
+    labels: bool = True,
+) -> pl.DataFrame:
+    """Reads a BRFSS fixed-width data file, see `scan_brfss`."""
+
+    return scan_brfss(path, codebook, columns=columns, labels=labels).collect()
@@ -0,0 +1,271 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+
+import polars as pl
+
+from .transport import RequestFailedError
+
+
+class OfflineCacheMissError(RequestFailedError):
+    """Raised in offline mode when a response was never recorded."""
+
+
+class VariableCache:
+    """
+    Caches census variable metadata keyed by (year, dataset).
+
+    Frames are held in an in-process LRU and, when a cache directory
+    is given, persisted as parquet so later runs can reuse them until
+    the time-to-live runs out.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 32,
+        ttl: Optional[timedelta] = timedelta(days=1),
+        cache_dir: Optional[str | Path] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: OrderedDict[tuple[int, str], tuple[datetime, pl.DataFrame]] = (
+            OrderedDict()
+        )
+        self._lock = threading.RLock()
+        self._fetch_locks: dict[tuple[int, str], threading.Lock] = {}
+
+    @classmethod
+    def from_settings(cls, settings) -> "VariableCache":
+        """Builds a cache from the variable cache fields of `ApplicationSettings`."""
+        return cls(
+            ttl=timedelta(hours=settings.variable_cache_ttl_hours),
+            cache_dir=settings.variable_cache_dir or None,
+        )
+
+    @staticmethod
+    def _key(year: int, dataset: str) -> tuple[int, str]:
+        return int(year), dataset.strip("/")
+
+    def _path(self, key: tuple[int, str]) -> Path:
+        year, dataset = key
+        return self.cache_dir / str(year) / f"{dataset.replace('/', '__')}.parquet"
+
+    def _is_expired(self, stored_at: datetime) -> bool:
+        return self.ttl is not None and datetime.now() - stored_at > self.ttl
+
+    def get(self, year: int, dataset: str) -> Optional[pl.DataFrame]:
+        """Returns the cached metadata frame, or None on a miss or expiry."""
+        key = self._key(year, dataset)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, frame = entry
+                if not self._is_expired(stored_at):
+                    self._entries.move_to_end(key)
+                    return frame
+                del self._entries[key]
+
+            if self.cache_dir is None:
+                return None
+
+            path = self._path(key)
+            if not path.exists():
+                return None
+
+            try:
+                stored_at = datetime.fromtimestamp(path.stat().st_mtime)
+                if self._is_expired(stored_at):
+                    path.unlink(missing_ok=True)
+                    return None
+                frame = pl.read_parquet(path)
+            except (OSError, pl.exceptions.PolarsError):
+                # removed or left unreadable by another process, a miss
+                return None
+
+            self._remember(key, stored_at, frame)
+            return frame
+
+    def put(self, year: int, dataset: str, frame: pl.DataFrame) -> None:
+        """Stores a metadata frame in memory and, if configured, on disk."""
+        key = self._key(year, dataset)
+
+        with self._lock:
+            self._remember(key, datetime.now(), frame)
+
+            if self.cache_dir is not None:
+                path = self._path(key)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # other processes sharing the dir only see whole files
+                tmp_path = path.with_suffix(
+                    f".{os.getpid()}.{threading.get_ident()}.tmp"
+                )
+                frame.write_parquet(tmp_path)
+                tmp_path.replace(path)
+
+    def get_or_fetch(
+        self, year: int, dataset: str, fetch: Callable[[], pl.DataFrame]
+    ) -> pl.DataFrame:
+        """
+        Returns the cached metadata frame, calling `fetch` only on a
+        miss. Concurrent callers for the same key wait for a single
+        fetch; fetches of different keys run in parallel.
+        """
+        key = self._key(year, dataset)
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+
+        with fetch_lock:
+            frame = self.get(year, dataset)
+            if frame is None:
+                frame = fetch()
+                self.put(year, dataset, frame)
+            return frame
+
+    def invalidate(
+        self, year: Optional[int] = None, dataset: Optional[str] = None
+    ) -> None:
+        """
+        Drops cached entries. With no arguments everything is dropped,
+        otherwise only the entries matching the given year and/or dataset.
+        """
+
+        def matches(key: tuple[int, str]) -> bool:
+            return (year is None or key[0] == int(year)) and (
+                dataset is None or key[1] == dataset.strip("/")
+            )
+
+        with self._lock:
+            for key in [key for key in self._entries if matches(key)]:
+                del self._entries[key]
+
+            if self.cache_dir is None or not self.cache_dir.exists():
+                return
+
+            for path in self.cache_dir.glob("*/*.parquet"):
+                key = (int(path.parent.name), path.stem.replace("__", "/"))
+                if matches(key):
+                    path.unlink(missing_ok=True)
+
+    def _remember(
+        self, key: tuple[int, str], stored_at: datetime, frame: pl.DataFrame
+    ) -> None:
+        self._entries[key] = (stored_at, frame)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class ResponseCache:
+    """
+    Records raw api response bodies on disk, gzip compressed and
+    addressed by a hash of the url. Callers key responses by urls
+    without api keys (`url_no_key`, `variable_url`) so keys never
+    reach the cache.
+
+    The least recently used responses are evicted once the cache
+    grows past `max_bytes`. In `offline` mode nothing is fetched and
+    a miss raises `OfflineCacheMissError`, which replays earlier runs
+    deterministically without network access.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        max_bytes: int = 1024**3,
+        offline: bool = False,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings) -> "ResponseCache":
+        """Builds a cache from the response cache fields of `ApplicationSettings`."""
+        return cls(
+            cache_dir=settings.response_cache_dir,
+            max_bytes=int(settings.response_cache_max_mb * 1024**2),
+            offline=settings.census_offline,
+        )
+
+    def path(self, url: str) -> Path:
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / digest[:2] / f"{digest}.json.gz"
+
+    def get(self, url: str) -> Optional[bytes]:
+        """Returns the recorded response body, or None if there isn't one."""
+        path = self.path(url)
+        try:
+            content = gzip.decompress(path.read_bytes())
+        except FileNotFoundError:
+            return None
+
+        # mark as recently used for eviction
+        os.utime(path)
+        return content
+
+    def put(self, url: str, content: bytes) -> None:
+        """Records a response body and evicts old ones if over budget."""
+        path = self.path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        compressed = gzip.compress(content)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(compressed)
+
+        with self._lock:
+            previous = path.stat().st_size if path.exists() else 0
+            tmp_path.replace(path)
+
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += len(compressed) - previous
+
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def fetch(self, url: str, download: Callable[[], bytes]) -> bytes:
+        """Returns the recorded body for url, recording `download()` on a miss."""
+        content = self.get(url)
+        if content is not None:
+            return content
+
+        self.raise_if_offline(url)
+        content = download()
+        self.put(url, content)
+        return content
+
+    def raise_if_offline(self, url: str) -> None:
+        """Raises `OfflineCacheMissError` for a missed url in offline mode."""
+        if self.offline:
+            raise OfflineCacheMissError(
+                f"No recorded response for {url} in offline mode.", url=url
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self.cache_dir.glob("*/*.json.gz"):
+                path.unlink(missing_ok=True)
+            self._size = 0
+
+    def _disk_usage(self) -> int:
+        return sum(path.stat().st_size for path in self.cache_dir.glob("*/*.json.gz"))
+
+    def _evict(self) -> None:
+        paths = sorted(
+            self.cache_dir.glob("*/*.json.gz"), key=lambda path: path.stat().st_mtime
+        )
+        for path in paths:
+            if self._size <= self.max_bytes:
+                break
+            self._size -= path.stat().st_size
+            path.unlink(missing_ok=True)
@@ -0,0 +1,291 @@
+import os
+from typing import Iterable, Iterator, Optional
+from urllib.parse import quote_plus, unquote_plus
+
+import polars as pl
+
+from .models import CensusAPIEndpoint
+
+# census api query parameters that name the geography, in the order
+# `CensusAPIEndpoint.from_url` looks for them
+GEO_KEYS = ["for", "in", "ucgid"]
+
+BASE_URL = str(CensusAPIEndpoint.model_fields["base_url"].default)
+
+ENDPOINT_FIELDS = ["year", "dataset", "variables", "geography", "within", "api_key"]
+
+CATALOG_COLUMNS = [
+    "url",
+    "year",
+    "dataset",
+    "variables",
+    "geography",
+    "within",
+    "api_key",
+    "url_no_key",
+    "variable_url",
+    "table_type",
+]
+
+
+def _map_unique(expr: pl.Expr, fn, pattern: str) -> pl.Expr:
+    """
+    Applies a python string function to the values matching `pattern`
+    through a lookup of the distinct values, so it runs once per
+    distinct value rather than once per row.
+    """
+
+    def apply(s: pl.Series) -> pl.Series:
+        values = s.filter(s.str.contains(pattern)).unique()
+        return s.replace({value: fn(value) for value in values})
+
+    return expr.map_batches(apply, return_dtype=pl.String)
+
+
+def _query_param(name: str) -> pl.Expr:
+    """First value of a query parameter, percent-decoded, or null."""
+    return _map_unique(
+        pl.col("query").str.extract(rf"(?:^|&){name}=([^&#]*)"),
+        unquote_plus,
+        r"[%+]",
+    ).alias(name)
+
+
+def _quote(expr: pl.Expr) -> pl.Expr:
+    """Encodes query values the way `requests` does."""
+    return _map_unique(expr, quote_plus, r"[^A-Za-z0-9_.~-]")
+
+
+class EndpointCatalog:
+    """
+    A columnar collection of census api endpoints.
+
+    Urls are parsed and validated for the whole column at once with
+    polars string expressions, giving one row per endpoint with the
+    same year, dataset, variables, geography and `url_no_key` that
+    `CensusAPIEndpoint.from_url` would produce. Rows that fail
+    validation are kept apart on `errors`.
+    """
+
+    def __init__(self, frame: pl.DataFrame, errors: Optional[pl.DataFrame] = None):
+        self.frame = frame
+        self.errors = (
+            errors
+            if errors is not None
+            else pl.DataFrame(schema={"url": pl.String, "error": pl.String})
+        )
+
+    @classmethod
+    def from_urls(
+        cls, urls: Iterable[str] | pl.Series, strict: bool = True
+    ) -> "EndpointCatalog":
+        """
+        Builds a catalog from census api urls. With `strict`, a
+        `ValueError` listing every invalid url is raised, otherwise
+        invalid urls are only reported on `errors`.
+        """
+
+        parsed = (
+            pl.DataFrame({"url": pl.Series(list(urls), dtype=pl.String)})
+            .with_columns(pl.col("url").str.strip_chars())
+            .with_columns(
+                pl.col("url")
+                .str.extract_groups(
+                    r"^https?://[^/?#]+/data/(?<year>\d+)/(?<dataset>[^?#]+?)/?(?:\?(?<query>[^#]*))?$"
+                )
+                .struct.unnest()
+            )
+            .with_columns(
+                pl.col("year").cast(pl.Int32),
+                _query_param("get"),
+                _query_param("key"),
+                *(_query_param(key) for key in GEO_KEYS),
+            )
+            .with_columns(
+                geo_key=pl.coalesce(
+                    pl.when(pl.col(key).is_not_null()).then(pl.lit(key))
+                    for key in GEO_KEYS
+                ),
+                geo_value=pl.coalesce(GEO_KEYS),
+                # every `in=` value, narrowing a `for=` geography
+                within=pl.col("query")
+                .str.extract_all(r"(?:^|&)in=[^&#]*")
+                .list.eval(pl.element().str.replace(r"^&?in=", ""))
+                .list.join("+"),
+            )
+            .with_columns(
+                error=pl.when(pl.col("dataset").is_null())
+                .then(
+                    pl.lit(
+                        "URL path does not match expected '/data/{year}/{dataset...}' structure."
+                    )
+                )
+                .when(pl.col("year") <= 1999)
+                .then(pl.lit("year must be greater than 1999."))
+                .when(pl.col("get").fill_null("") == "")
+                .then(
+                    pl.lit("Could not find 'get' parameter for variables in URL query.")
+                )
+                .when(pl.col("geo_key").is_null())
+                .then(
+                    pl.lit(
+                        "Could not find a recognized geography parameter ('for', 'in', 'ucgid') in URL."
+                    )
+                )
+            )
+        )
+
+        errors = parsed.filter(pl.col("error").is_not_null()).select("url", "error")
+        if strict and errors.height:
+            raise ValueError(
+                f"{errors.height} invalid census api urls: "
+                + "; ".join(f"'{url}': {error}" for url, error in errors.iter_rows())
+            )
+
+        url_path = pl.format("{}/{}/{}", pl.lit(BASE_URL), "year", "dataset")
+        within = (
+            pl.when(pl.col("geo_key") == "for", pl.col("within") != "")
+            .then(_map_unique(pl.col("within"), unquote_plus, r"[%+]"))
+            .alias("within")
+        )
+        dataset_parts = pl.col("dataset").str.split("/")
+
+        frame = (
+            parsed.filter(pl.col("error").is_null())
+            .with_columns(
+                pl.col("dataset").str.strip_chars("/"),
+                pl.col("key")
+                .fill_null(pl.lit(os.getenv("CENSUS_API_KEY"), dtype=pl.String))
+                .alias("api_key"),
+                pl.col("get").str.split(",").alias("variables"),
+                pl.format("{}:{}", "geo_key", "geo_value").alias("geography"),
+                within,
+                pl.concat_str(
+                    pl.format(
+                        "{}?get={}&{}={}",
+                        url_path,
+                        _quote(pl.col("get")),
+                        "geo_key",
+                        _quote(pl.col("geo_value")),
+                    ),
+                    pl.lit("&in=") + _quote(within),
+                    ignore_nulls=True,
+                ).alias("url_no_key"),
+                pl.format("{}/variables", url_path).alias("variable_url"),
+                pl.when(dataset_parts.list.last() == dataset_parts.list.get(1))
+                .then(pl.lit("not_table"))
+                .otherwise(dataset_parts.list.last())
+                .alias("table_type"),
+            )
+            .select(CATALOG_COLUMNS)
+        )
+
+        return cls(frame, errors)
+
+    @classmethod
+    def from_portal(
+        cls, df: pl.DataFrame, column: str = "endpoint", strict: bool = True
+    ) -> "EndpointCatalog":
+        """
+        Builds a catalog from a portal table, such as the one returned
+        by `portal.fetch_data`, whose `column` holds the endpoint urls
+        either as strings or as the portal's url struct.
+        """
+
+        urls = df.get_column(column)
+        if urls.dtype == pl.Struct:
+            urls = urls.struct.unnest().to_series()
+
+        return cls.from_urls(urls, strict=strict)
+
+    def __len__(self) -> int:
+        return self.frame.height
+
+    def __iter__(self) -> Iterator[CensusAPIEndpoint]:
+        return iter(self.to_endpoints())
+
+    def __repr__(self) -> str:
+        return (
+            f"EndpointCatalog(endpoints={len(self)}, invalid={self.errors.height}, "
+            f"datasets={self.frame.select('year', 'dataset').n_unique()})"
+        )
+
+    def to_endpoints(self) -> list[CensusAPIEndpoint]:
+        """
+        Creates an endpoint per row. The urls are already parsed and
+        the api key already filled in, so this only runs the model's
+        field validation.
+        """
+
+        return [
+            CensusAPIEndpoint.model_validate(row)
+            for row in self.frame.select(ENDPOINT_FIELDS).iter_rows(named=True)
+        ]
+
+    def group_by_dataset(self) -> Iterator[tuple[tuple[int, str], "EndpointCatalog"]]:
+        """
+        Yields `((year, dataset), catalog)` for every dataset, so each
+        group shares one variable metadata request.
+        """
+
+        for key, frame in self.frame.group_by(["year", "dataset"], maintain_order=True):
+            yield key, EndpointCatalog(frame)
+
+    def duplicates(self) -> pl.DataFrame:
+        """Rows requesting exactly the same data as an earlier row."""
+
+        return self.frame.filter(pl.col("url_no_key").is_duplicated())
+
+    def unique(self) -> "EndpointCatalog":
+        """The catalog without duplicate requests, first occurrence kept."""
+
+        return EndpointCatalog(
+            self.frame.unique("url_no_key", keep="first", maintain_order=True),
+            self.errors,
+        )
+
+    def overlaps(self) -> pl.DataFrame:
+        """
+        Pairs of distinct requests for the same year, dataset and
+        geography that ask for some of the same variables, either
+        directly or because one requests the other's whole `group()`.
+        One row per overlapping variable or group.
+        """
+
+        variables = (
+            self.frame.unique("url_no_key", maintain_order=True)
+            .select("url_no_key", "year", "dataset", "geography", "within", "variables")
+            .explode("variables")
+            .rename({"variables": "variable"})
+            .with_columns(group=pl.col("variable").str.extract(r"^group\((.+)\)$"))
+            .with_columns(
+                table=pl.coalesce(
+                    "group", pl.col("variable").str.extract(r"^([A-Z0-9]+)_")
+                )
+            )
+        )
+
+        return (
+            variables.join(
+                variables,
+                on=["year", "dataset", "geography", "within", "table"],
+                suffix="_other",
+                nulls_equal=True,
+            )
+            .filter(
+                pl.col("url_no_key") < pl.col("url_no_key_other"),
+                (pl.col("variable") == pl.col("variable_other"))
+                | pl.col("group").is_not_null()
+                | pl.col("group_other").is_not_null(),
+            )
+            .select(
+                "year",
+                "dataset",
+                "geography",
+                "within",
+                "url_no_key",
+                "url_no_key_other",
+                "variable",
+                "variable_other",
+            )
+        )
@@ -0,0 +1,178 @@
+import io
+import re
+import zipfile
+from pathlib import Path
+from typing import IO, Iterator, Optional
+
+import polars as pl
+from lxml import etree
+
+from . import instrumentation, transport
+
+# one row per value of every variable in a BRFSS codebook
+CODEBOOK_SCHEMA = pl.Schema(
+    {
+        "label": pl.String,
+        "section": pl.String,
+        "variable": pl.String,
+        "column": pl.String,
+        "start": pl.Int32,
+        "end": pl.Int32,
+        "type": pl.String,
+        "value": pl.String,
+        "value_label": pl.String,
+    }
+)
+
+# header fields of a variable's table, by their label in the codebook
+HEADER_FIELDS = {
+    "Label": "label",
+    "Section Name": "section",
+    "SAS Variable Name": "variable",
+    "Column": "column",
+    "Type of Variable": "type",
+}
+
+_HEADER_LINE = re.compile(r"^([A-Za-z][A-Za-z ]*?) ?: ?(.*)$")
+
+# compiled once, applied to every table
+_header_cell = etree.XPath(".//td[contains(@class, 'linecontent')][1]")
+_body_rows = etree.XPath("./tbody/tr")
+_data_cells = etree.XPath(
+    "./*[contains(concat(' ', normalize-space(@class), ' '), ' data ')]"
+)
+_other_cells = etree.XPath("./td[not(contains(@class, 'linecontent'))]")
+
+
+def _text(element: etree._Element) -> str:
+    return " ".join("".join(element.itertext()).split())
+
+
+def _header(cell: etree._Element) -> dict[str, Optional[str]]:
+    """
+    Reads the `Key: value` lines of a table's first cell, which are
+    separated by `<br>`s. Lines without a key continue the previous one.
+    """
+
+    fields = dict.fromkeys(HEADER_FIELDS.values())
+    key = None
+    for line in cell.itertext():
+        line = " ".join(line.split())
+        match = _HEADER_LINE.match(line)
+        if match is not None:
+            key = HEADER_FIELDS.get(match.group(1))
+            if key is not None:
+                fields[key] = match.group(2)
+        elif key is not None and line:
+            fields[key] = f"{fields[key]} {line}".strip()
+    return fields
+
+
+def _tables(source: IO[bytes], encoding: Optional[str]) -> Iterator[etree._Element]:
+    """
+    Yields every variable table of a codebook as it is parsed, then
+    frees it and everything before it, so memory stays flat however
+    long the codebook is.
+    """
+
+    for _, table in etree.iterparse(
+        source, events=("end",), tag="table", html=True, encoding=encoding
+    ):
+        if table.get("summary") == "Procedure Report: Report":
+            yield table
+
+        table.clear(keep_tail=True)
+        for element in (table, *table.iterancestors()):
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def parse_codebook(source: IO[bytes], encoding: Optional[str] = None) -> pl.DataFrame:
+    """
+    Parses a BRFSS codebook (the `LLCP` html report) in a single
+    streaming pass, returning one row per value of every variable
+    following `CODEBOOK_SCHEMA`. `start` and `end` are the 1-based,
+    inclusive positions of the variable in the fixed-width data file.
+    Variables whose table lists no values get a single row with a
+    null `value`.
+    """
+
+    columns = {name: [] for name in CODEBOOK_SCHEMA if name not in ("start", "end")}
+
+    def add(fields: dict, value: Optional[str], value_label: Optional[str]) -> None:
+        for name, field in fields.items():
+            columns[name].append(field)
+        columns["value"].append(value)
+        columns["value_label"].append(value_label)
+
+    for table in _tables(source, encoding):
+        cell = _header_cell(table)
+        if not cell:
+            continue
+        fields = _header(cell[0])
+
+        rows = 0
+        for row in _body_rows(table):
+            cells = _data_cells(row) or _other_cells(row)
+            if len(cells) >= 2:
+                add(fields, _text(cells[0]), _text(cells[1]))
+                rows += 1
+        if not rows:
+            add(fields, None, None)
+
+    positions = pl.col("column").str.extract_groups(r"^\s*(\d+)\s*(?:-\s*(\d+))?\s*$")
+    return (
+        pl.DataFrame(columns, schema={name: pl.String for name in columns})
+        .with_columns(
+            start=positions.struct[0].cast(pl.Int32),
+            end=pl.coalesce(positions.struct[1], positions.struct[0]).cast(pl.Int32),
+        )
+        .select(CODEBOOK_SCHEMA.names())
+    )
+
+
+def read_codebook(
+    source: str | Path | bytes | IO[bytes],
+    member: Optional[str] = None,
+    encoding: Optional[str] = None,
+) -> pl.DataFrame:
+    """
+    Reads a BRFSS codebook from an html file or the zip it is
+    published in, given as a path, bytes or binary file. Zipped
+    codebooks are streamed straight from the archive without being
+    extracted; `member` picks the html file when the zip holds more
+    than one. See `parse_codebook` for the result.
+    """
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    with instrumentation.span("codebook") as span:
+        if zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                if member is None:
+                    member = next(
+                        name
+                        for name in archive.namelist()
+                        if name.lower().endswith((".html", ".htm"))
+                    )
+                with archive.open(member) as html:
+                    codebook = parse_codebook(html, encoding)
+        elif isinstance(source, (str, Path)):
+            with open(source, "rb") as html:
+                codebook = parse_codebook(html, encoding)
+        else:
+            source.seek(0)
+            codebook = parse_codebook(source, encoding)
+
+        span.set(rows=codebook.height)
+    return codebook
+
+
+def fetch_codebook(
+    url: str, member: Optional[str] = None, encoding: Optional[str] = None
+) -> pl.DataFrame:
+    """Downloads a codebook (html or zip) and parses it in memory."""
+
+    response = transport.request("GET", url)
+    return read_codebook(response.content, member=member, encoding=encoding)
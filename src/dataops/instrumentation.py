@@ -0,0 +1,318 @@
+import itertools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, Iterator, NamedTuple, Optional, Protocol
+
+import polars as pl
+
+try:
+    from opentelemetry import trace
+except ImportError:  # optional, only needed by `OpenTelemetrySink`
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+# attributes with their own column in `SpanRecorder.frame`
+SPAN_SCHEMA = pl.Schema(
+    {
+        "span_id": pl.UInt64,
+        "parent_id": pl.UInt64,
+        "stage": pl.String,
+        "start": pl.Datetime("us"),
+        "seconds": pl.Float64,
+        "url": pl.String,
+        "bytes": pl.Int64,
+        "rows": pl.Int64,
+        "retries": pl.Int64,
+        "error": pl.String,
+        "attributes": pl.String,
+    }
+)
+
+
+@dataclass
+class Span:
+    """
+    One timed stage of a run, such as an http request, decoding a
+    response or a tidy transform. Attributes conventionally include
+    the `url` (without api key) the stage worked on, `bytes`
+    transferred, `rows` produced and `retries` needed.
+    """
+
+    stage: str
+    span_id: int
+    parent_id: Optional[int] = None
+    start: float = 0.0
+    seconds: float = 0.0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "stage": self.stage,
+            "start": self.start,
+            "seconds": self.seconds,
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class Sink(Protocol):
+    def emit(self, span: Span) -> None: ...
+
+
+class _NoopSpan:
+    """Stands in for a span while nothing is listening."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+_sinks: tuple[Sink, ...] = ()
+_sinks_lock = threading.Lock()
+_span_ids = itertools.count(1)
+_current: ContextVar[Optional[int]] = ContextVar("current_span", default=None)
+
+
+class _SpanContext:
+    def __init__(self, stage: str, attributes: dict[str, Any]):
+        self.span = Span(stage, next(_span_ids), attributes=attributes)
+
+    def __enter__(self) -> Span:
+        self.span.parent_id = _current.get()
+        self._token = _current.set(self.span.span_id)
+        self.span.start = time.time()
+        self._started = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.span.seconds = time.perf_counter() - self._started
+        _current.reset(self._token)
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+
+        for sink in _sinks:
+            try:
+                sink.emit(self.span)
+            except Exception:
+                logger.exception("Span sink %r failed", sink)
+
+
+def span(stage: str, **attributes) -> _SpanContext | _NoopSpan:
+    """
+    Times the enclosed block as a span of `stage`. While no sink is
+    registered this returns a shared no-op, so instrumented code
+    costs one function call.
+
+        with instrumentation.span("parse", url=url) as s:
+            frame = ...
+            s.set(rows=frame.height)
+    """
+
+    if not _sinks:
+        return _NOOP
+    return _SpanContext(stage, attributes)
+
+
+def enabled() -> bool:
+    return bool(_sinks)
+
+
+def add_sink(sink: Sink) -> Sink:
+    """Starts sending every finished span to `sink`."""
+    global _sinks
+    with _sinks_lock:
+        _sinks = (*_sinks, sink)
+    return sink
+
+
+def remove_sink(sink: Sink) -> None:
+    global _sinks
+    with _sinks_lock:
+        _sinks = tuple(s for s in _sinks if s is not sink)
+
+
+# --- Sinks ---
+
+
+class LoggingSink:
+    """Logs every span, at debug level by default."""
+
+    def __init__(
+        self, log: Optional[logging.Logger] = None, level: int = logging.DEBUG
+    ):
+        self.log = log or logger
+        self.level = level
+
+    def emit(self, span: Span) -> None:
+        self.log.log(
+            self.level,
+            "%s took %.3fs %s%s",
+            span.stage,
+            span.seconds,
+            span.attributes,
+            f" ({span.error})" if span.error else "",
+        )
+
+
+class JsonLinesSink:
+    """Appends every span as one JSON object per line to a file."""
+
+    def __init__(self, file: str | Path | IO[str]):
+        if isinstance(file, (str, Path)):
+            self.file = open(file, "a", encoding="utf-8")
+            self._owned = True
+        else:
+            self.file = file
+            self._owned = False
+        self._lock = threading.Lock()
+
+    def emit(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self.file.write(line + "\n")
+
+    def close(self) -> None:
+        if self._owned:
+            self.file.close()
+
+
+class OpenTelemetrySink:
+    """
+    Exports spans through an OpenTelemetry tracer, keeping their
+    timings and attributes. Requires the `otel` extra (`opentelemetry-api`);
+    spans go wherever the application's tracer provider sends them.
+    """
+
+    def __init__(self, tracer=None):
+        if trace is None:
+            raise ImportError(
+                "OpenTelemetrySink requires the opentelemetry-api package."
+            )
+        self.tracer = tracer or trace.get_tracer("dataops")
+
+    def emit(self, span: Span) -> None:
+        start_ns = int(span.start * 1e9)
+        attributes = {
+            f"dataops.{key}": value
+            if isinstance(value, (str, bool, int, float))
+            else str(value)
+            for key, value in span.attributes.items()
+        }
+        otel_span = self.tracer.start_span(
+            span.stage, start_time=start_ns, attributes=attributes
+        )
+        if span.error:
+            otel_span.set_status(trace.Status(trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=start_ns + int(span.seconds * 1e9))
+
+
+class RunSummary(NamedTuple):
+    stages: pl.DataFrame
+    endpoints: pl.DataFrame
+
+
+class SpanRecorder:
+    """Keeps spans in memory, to summarize a run once it is done."""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def emit(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def frame(self) -> pl.DataFrame:
+        """One row per span, common attributes in their own columns."""
+        columns = {"url", "bytes", "rows", "retries"}
+        rows = [
+            {
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "stage": span.stage,
+                "start": datetime.fromtimestamp(span.start),
+                "seconds": span.seconds,
+                **{key: span.attributes.get(key) for key in columns},
+                "error": span.error,
+                "attributes": json.dumps(
+                    {k: v for k, v in span.attributes.items() if k not in columns},
+                    default=str,
+                ),
+            }
+            for span in self.spans
+        ]
+        return pl.DataFrame(rows, schema=SPAN_SCHEMA)
+
+    def summary(self, top: int = 10) -> RunSummary:
+        """
+        The time spent per stage, and the `top` urls by total time
+        across their stages (http, decode, parse, tidy, ...).
+        """
+
+        spans = self.frame()
+
+        def totals(bytes: pl.Expr) -> list[pl.Expr]:
+            return [
+                pl.len().alias("spans"),
+                pl.col("seconds").sum(),
+                bytes.sum(),
+                pl.col("rows").sum(),
+                pl.col("retries").sum(),
+                pl.col("error").count().alias("errors"),
+            ]
+
+        stages = (
+            spans.group_by("stage")
+            .agg(
+                *totals(pl.col("bytes")),
+                pl.col("seconds").max().alias("max_seconds"),
+            )
+            .sort("seconds", descending=True)
+        )
+        # decode spans count the same body again, so a url's bytes are
+        # only those of its http spans
+        endpoints = (
+            spans.drop_nulls("url")
+            .group_by("url")
+            .agg(*totals(pl.col("bytes").filter(pl.col("stage") == "http")))
+            .sort("seconds", descending=True)
+            .head(top)
+        )
+        return RunSummary(stages, endpoints)
+
+
+@contextmanager
+def recording() -> Iterator[SpanRecorder]:
+    """
+    Records the spans of a block:
+
+        with instrumentation.recording() as recorder:
+            fetch_tidy_batch(urls)
+        print(recorder.summary().stages)
+    """
+
+    recorder = add_sink(SpanRecorder())
+    try:
+        yield recorder
+    finally:
+        remove_sink(recorder)
@@ -1,5 +1,7 @@
+import bisect
+import hashlib
 import os
-import sys
+import threading
 import requests
 import polars as pl
 from pydantic import (
@@ -9,13 +11,22 @@ from pydantic import (
     field_validator,
     model_validator,
     computed_field,
+    PrivateAttr,
     ValidationError,
 )
+from polars.io.plugins import register_io_source
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List, Optional, Annotated
+from pathlib import Path
+from typing import Annotated, ClassVar, Iterable, Iterator, List, Mapping, Optional
 from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
 from datetime import datetime
+
+from . import instrumentation, transport
+from .cache import ResponseCache, VariableCache
 # import re
 
 load_dotenv()
@@ -38,6 +49,297 @@ class ApplicationSettings(BaseSettings):
     socrata_user: str = Field("", env="SOCRATA_USER")
     socrata_pass: str = Field("", env="SOCRATA_PASS")
     socrata_token: str = Field("", env="SOCRATA_TOKEN")
+    variable_cache_dir: str = Field("", env="VARIABLE_CACHE_DIR")
+    variable_cache_ttl_hours: float = Field(24, env="VARIABLE_CACHE_TTL_HOURS")
+    response_cache_dir: str = Field("", env="RESPONSE_CACHE_DIR")
+    response_cache_max_mb: float = Field(1024, env="RESPONSE_CACHE_MAX_MB")
+    census_offline: bool = Field(False, env="CENSUS_OFFLINE")
+    warehouse_dir: str = Field("", env="WAREHOUSE_DIR")
+    http_pool_size: int = Field(32, env="HTTP_POOL_SIZE")
+    http_timeout: float = Field(30, env="HTTP_TIMEOUT")
+    http2: bool = Field(True, env="HTTP2")
+
+
+# column layout of the long frames returned by `fetch_data_to_polars`
+GEO_COLUMNS = ["geo_id", "ucgid", "geo_name"]
+LONG_COLUMNS = ["headers", "records", "geo_id", "ucgid", "geo_name", "date_pulled"]
+LONG_SCHEMA = pl.Schema(
+    {
+        **{col: pl.String for col in LONG_COLUMNS[:-1]},
+        "date_pulled": pl.Datetime("us"),
+    }
+)
+
+# column layout of the tidy frames returned by `fetch_tidy_data`
+TIDY_SCHEMA = pl.Schema(
+    {
+        "row_id": pl.UInt32,
+        "dataset": pl.String,
+        "year": pl.Int32,
+        "concept": pl.String,
+        "geo_id": pl.String,
+        "ucgid": pl.String,
+        "geo_name": pl.String,
+        "variable_id": pl.String,
+        "variable_name": pl.String,
+        "value": pl.Float32,
+        "value_type": pl.String,
+        "full_url": pl.String,
+        "date_pulled": pl.Datetime("us"),
+    }
+)
+
+# census value type suffixes of `variable_id`, see `_tidy_plan`
+VALUE_TYPES = {
+    "E": "estimate",
+    "M": "margin_of_error",
+    "P": "percent_estimate",
+    "PM": "percent_margin_of_error",
+    "N": "count",
+}
+VALUE_TYPE = pl.Enum([*VALUE_TYPES.values(), "other"])
+
+
+def value_type(variable_id: pl.Expr) -> pl.Expr:
+    """The value type of census variable ids, from their suffix."""
+    return variable_id.str.slice(-2).str.replace_all(r"\d", "").replace(VALUE_TYPES)
+
+
+# the tidy layout with `compact=True`: repeated strings are dictionary
+# encoded, and values are kept as Float64, exact for any census count
+COMPACT_TIDY_SCHEMA = pl.Schema(
+    {
+        **TIDY_SCHEMA,
+        **{
+            col: pl.Categorical()
+            for col in [
+                "dataset",
+                "concept",
+                "geo_id",
+                "ucgid",
+                "geo_name",
+                "variable_id",
+                "variable_name",
+                "full_url",
+            ]
+        },
+        "year": pl.Int16,
+        "value": pl.Float64,
+        "value_type": VALUE_TYPE,
+    }
+)
+
+# lowercased census headers that describe geography rather than data
+GEO_HEADERS = {"geo_id": "geo_id", "ucgid": "ucgid", "name": "geo_name"}
+
+
+def records_to_long(data: List[list], date_pulled: datetime) -> pl.DataFrame:
+    """
+    Reshapes a census api json response (a header row followed by
+    one row per geography) into the long headers/records layout
+    in a single columnar pass.
+    """
+
+    headers = data[0]
+
+    # positional names so repeated headers don't collide
+    columns = [f"column_{i}" for i in range(len(headers))]
+    wide = pl.DataFrame(
+        data[1:],
+        schema={col: pl.String for col in columns},
+        orient="row",
+        strict=False,
+    ).with_row_index("row_nr")
+
+    # the first matching header wins for each geo column
+    geo_exprs = {}
+    value_cols = {}
+    for col, header in zip(columns, headers):
+        geo_name = GEO_HEADERS.get(str(header).lower())
+        if geo_name is None:
+            value_cols[col] = header
+        elif geo_name not in geo_exprs:
+            geo_exprs[geo_name] = pl.col(col).alias(geo_name)
+
+    geo_exprs = [
+        geo_exprs.get(geo_name, pl.lit("unknown", dtype=pl.String).alias(geo_name))
+        for geo_name in GEO_COLUMNS
+    ]
+
+    return (
+        wide.select("row_nr", *geo_exprs, *value_cols)
+        .unpivot(
+            index=["row_nr", *GEO_COLUMNS],
+            on=list(value_cols),
+            variable_name="headers",
+            value_name="records",
+        )
+        # unpivot is column-major, keep the record-by-record order
+        .sort("row_nr", maintain_order=True)
+        .with_columns(
+            pl.col("headers").replace_strict(value_cols, return_dtype=pl.String),
+            pl.lit(date_pulled).alias("date_pulled"),
+        )
+        .select(LONG_COLUMNS)
+        # with only geography columns there is nothing to unpivot and
+        # `records` would come back Null-typed
+        .cast(dict(LONG_SCHEMA))
+    )
+
+
+# scalar fields of the variables.json mapping, in /variables column order
+VARIABLE_FIELDS = [
+    "label",
+    "concept",
+    "predicateType",
+    "group",
+    "limit",
+    "predicateOnly",
+    "attributes",
+    "required",
+]
+
+
+def variables_to_polars(data: List[list] | dict, date_pulled: datetime) -> pl.DataFrame:
+    """
+    Converts a decoded census api /variables response into
+    a Polars DataFrame with one row per variable.
+
+    Both the /variables header-and-rows layout and the variables.json
+    `{"variables": {name: {...}}}` mapping are built column by column,
+    with every column read as a string.
+    """
+
+    if isinstance(data, dict):
+        variables = data.get("variables", data)
+        entries = list(variables.values())
+        fields = [
+            field
+            for field in VARIABLE_FIELDS
+            if any(field in entry for entry in entries)
+        ]
+        columns = {"name": list(variables)}
+        for field in fields:
+            columns[field] = [entry.get(field) for entry in entries]
+
+        frame = pl.DataFrame(
+            columns, schema={col: pl.String for col in columns}, strict=False
+        )
+
+    else:
+        frame = pl.DataFrame(
+            data[1:],
+            schema={col: pl.String for col in data[0]},
+            orient="row",
+            strict=False,
+        )
+
+    return frame.with_columns(date_pulled=date_pulled)
+
+
+class VariableIndex:
+    """
+    Hash lookups into a dataset's variable metadata, by exact name,
+    by group (or the table id before the first underscore, for
+    metadata without groups) and by name prefix.
+
+    Indexes are reused per metadata frame through `for_labels`, and
+    each lookup table is built on first use, so resolving many
+    endpoints of a dataset pays for one pass over its variables
+    rather than a substring scan per endpoint.
+    """
+
+    maxsize: ClassVar[int] = 32
+    _instances: ClassVar[OrderedDict[int, "VariableIndex"]] = OrderedDict()
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, labels: pl.DataFrame):
+        self.labels = labels
+
+    @classmethod
+    def for_labels(cls, labels: pl.DataFrame) -> "VariableIndex":
+        """The index of a metadata frame, created on first use."""
+        with cls._lock:
+            index = cls._instances.get(id(labels))
+            if index is None or index.labels is not labels:
+                index = cls._instances[id(labels)] = cls(labels)
+            cls._instances.move_to_end(id(labels))
+            while len(cls._instances) > cls.maxsize:
+                cls._instances.popitem(last=False)
+            return index
+
+    @cached_property
+    def names(self) -> dict[str, int]:
+        """Metadata row of every variable name."""
+        names = self.labels["name"].to_list()
+        return dict(zip(reversed(names), range(len(names) - 1, -1, -1)))
+
+    @cached_property
+    def groups(self) -> dict[str, list[int]]:
+        """Metadata rows of every group and table id."""
+        names = self.labels["name"].to_list()
+        groups = (
+            self.labels["group"].to_list()
+            if "group" in self.labels.columns
+            else [None] * len(names)
+        )
+
+        rows = {}
+        for row, (name, group) in enumerate(zip(names, groups)):
+            table, underscore, _ = name.partition("_")
+            if underscore:
+                rows.setdefault(table, []).append(row)
+            if group is not None and group != table:
+                rows.setdefault(group, []).append(row)
+        return rows
+
+    @cached_property
+    def sorted_names(self) -> list[str]:
+        return sorted(self.names)
+
+    def rows(self, variables: Iterable[str]) -> list[int]:
+        """
+        Metadata rows of the requested variables, in metadata order:
+        every member of a `group(X)`, every name starting with the
+        prefix of a `X*` wildcard, and exact names otherwise.
+        """
+
+        rows = set()
+        for variable in variables:
+            if variable.startswith("group(") and variable.endswith(")"):
+                rows.update(self.groups.get(variable[6:-1], ()))
+            elif variable.endswith("*"):
+                prefix = variable[:-1]
+                start = bisect.bisect_left(self.sorted_names, prefix)
+                for name in self.sorted_names[start:]:
+                    if not name.startswith(prefix):
+                        break
+                    rows.add(self.names[name])
+            elif variable in self.names:
+                rows.add(self.names[variable])
+
+        return sorted(rows)
+
+    def lookup(self, variables: Iterable[str]) -> pl.DataFrame:
+        """The metadata rows of the requested variables."""
+        return self.labels.select(pl.all().gather(self.rows(variables)))
+
+
+@dataclass(frozen=True, eq=False)
+class EndpointMetadata:
+    """Variable labels and concept resolved for one endpoint."""
+
+    labels: pl.DataFrame
+    concept: str
+
+    def __eq__(self, other):
+        if not isinstance(other, EndpointMetadata):
+            return NotImplemented
+        return self.concept == other.concept and self.labels.equals(other.labels)
+
+
+# read once on import to configure the caches shared by every endpoint
+_settings = ApplicationSettings()
 
 
 class CensusAPIEndpoint(BaseModel):
@@ -68,12 +370,29 @@ class CensusAPIEndpoint(BaseModel):
             description="The geography specification (e.g., 'state:*', 'ucgid:0400000US09')."
         ),
     ]
+    within: Optional[str] = Field(
+        default=None,
+        description="The `in=` clause narrowing a `for` geography (e.g., 'state:09 county:001').",
+    )
     api_key: Optional[str] = Field(
         default=None,
         repr=False,
         description="Your Census API key. If not provided, it's sourced from the CENSUS_API_KEY environment variable.",
     )
 
+    # variable metadata shared by all endpoints for the same year and dataset,
+    # kept on disk under `VARIABLE_CACHE_DIR` when it is set
+    variable_cache: ClassVar[VariableCache] = VariableCache.from_settings(_settings)
+
+    # raw responses recorded under `RESPONSE_CACHE_DIR` and replayed from it
+    # (only replayed with `CENSUS_OFFLINE`), disabled unless the dir is set
+    response_cache: ClassVar[Optional[ResponseCache]] = (
+        ResponseCache.from_settings(_settings) if _settings.response_cache_dir else None
+    )
+
+    # filled at most once per instance by `resolve()`
+    _metadata: Optional[EndpointMetadata] = PrivateAttr(default=None)
+
     # --- Alternative Constructor from URL ---
     @classmethod
     def from_url(cls, url: str) -> "CensusAPIEndpoint":
@@ -103,12 +422,18 @@ class CensusAPIEndpoint(BaseModel):
                     "Could not find a recognized geography parameter ('for', 'in', 'ucgid') in URL."
                 )
             geography = f"{geo_key}:{query_params[geo_key][0]}"
+            within = (
+                " ".join(query_params["in"])
+                if geo_key == "for" and "in" in query_params
+                else None
+            )
             api_key = query_params.get("key", [None])[0]
             return cls(
                 year=year,
                 dataset=dataset,
                 variables=variables,
                 geography=geography,
+                within=within,
                 api_key=api_key,
             )
         except (ValueError, IndexError, TypeError) as e:
@@ -142,6 +467,8 @@ class CensusAPIEndpoint(BaseModel):
         url_path = f"{self.base_url}/{self.year}/{self.dataset}"
         geo_key, geo_value = self.geography.split(":", 1)
         params = {"get": get_params, geo_key: geo_value}
+        if self.within:
+            params["in"] = self.within
         if self.api_key:
             params["key"] = self.api_key
         req = requests.Request("GET", url_path, params=params)
@@ -155,6 +482,8 @@ class CensusAPIEndpoint(BaseModel):
         url_path = f"{self.base_url}/{self.year}/{self.dataset}"
         geo_key, geo_value = self.geography.split(":", 1)
         params = {"get": get_params, geo_key: geo_value}
+        if self.within:
+            params["in"] = self.within
         req = requests.Request("GET", url_path, params=params)
         return req.prepare().url
 
@@ -178,16 +507,42 @@ class CensusAPIEndpoint(BaseModel):
 
     @computed_field
     @property
-    def concept(self) -> str:
-        """Endpoint concept"""
+    def concept(self) -> Optional[str]:
+        """
+        Endpoint concept, or None until the endpoint is resolved.
+        Never fetches, so dumping or printing an endpoint stays offline.
+        """
 
-        if self.table_type != "not_table":
-            return (
-                self.fetch_variable_labels().select(pl.col("concept").unique()).item()
+        return self._metadata.concept if self._metadata else None
+
+    @property
+    def labels(self) -> Optional[pl.DataFrame]:
+        """Filtered variable labels, or None until the endpoint is resolved."""
+
+        return self._metadata.labels if self._metadata else None
+
+    @property
+    def is_resolved(self) -> bool:
+        return self._metadata is not None
+
+    def resolve(self, labels: Optional[pl.DataFrame] = None) -> "CensusAPIEndpoint":
+        """
+        Fetches the endpoint's variable labels and concept once and
+        keeps them on the instance. Later calls are free. `labels` are
+        all of the dataset's labels when they are already at hand,
+        skipping `variable_cache`. Use `batch.prefetch` to resolve many
+        endpoints concurrently.
+        """
+
+        if self._metadata is None:
+            if labels is None:
+                labels = self.fetch_all_variable_labels()
+            labels = self.filter_variable_labels(labels)
+            self._metadata = EndpointMetadata(
+                labels=labels, concept=self.concept_from_labels(labels)
             )
 
-        else:
-            return "no_concept"
+        return self
 
     def __repr__(self):
         return (
@@ -198,289 +553,433 @@ class CensusAPIEndpoint(BaseModel):
             f"\tyear='{self.year}', \n"
             f"\tvariables='{self.variables}', \n"
             f"\tgeography='{self.geography}', \n"
+            f"\twithin='{self.within}', \n"
             f"\turl_no_key='{self.url_no_key}', \n"
             f"\tvariable_url='{self.variable_url}',\n)"
         )
 
     # --- Data Fetching Methods ---
 
+    def get_json(self, url: str, cache_url: str):
+        """
+        GETs and decodes a census api response. When `response_cache`
+        is set the raw body is recorded or replayed under `cache_url`,
+        which must not contain the api key.
+        """
+
+        def download() -> bytes:
+            return transport.request("GET", url, log_url=cache_url).content
+
+        if self.response_cache is None:
+            content = download()
+        else:
+            content = self.response_cache.fetch(cache_url, download)
+
+        return transport.decode_json(content, cache_url)
+
+    def download_variable_labels(self) -> pl.DataFrame:
+        """
+        Downloads every variable label found at the related
+        api endpoint, bypassing the variable cache.
+        """
+
+        data = self.get_json(self.variable_url, self.variable_url)
+
+        with instrumentation.span("variables", url=self.variable_url) as span:
+            labels = variables_to_polars(data, date_pulled=datetime.now())
+            span.set(rows=labels.height)
+        return labels
+
     def fetch_all_variable_labels(self) -> pl.DataFrame:
         """
         Fetches all the variable labels found at
         the related api endpoint and returns it as a
-        Polars DataFrame.
+        Polars DataFrame. Labels are shared through
+        `variable_cache` by every endpoint with the
+        same year and dataset.
         """
 
-        response = requests.get(self.variable_url, timeout=30)
-        response.raise_for_status()
-
-        data = response.json()
-        data = (
-            pl.from_dicts(data)
-            .transpose(column_names="column_0")
-            .with_columns(date_pulled=datetime.now())
+        return self.variable_cache.get_or_fetch(
+            self.year, self.dataset, self.download_variable_labels
         )
-        return data
 
     def fetch_variable_labels(self) -> pl.DataFrame:
         """
         Fetches the variable labels related to the specific
         api endpoint, filters it to only the relevant variables
-        and returns it as a Polars DataFrame.
+        and returns it as a Polars DataFrame. The labels are
+        resolved once and kept on the instance.
         """
 
-        response = requests.get(self.variable_url, timeout=30)
-        response.raise_for_status()
+        return self.resolve().labels
 
-        # create var search list
-        vars = (
-            pl.DataFrame({"vars": self.variables})
-            .with_columns(
-                pl.col("vars")
-                .str.replace_all("\\(|\\)", " ")
-                .str.strip_chars()
-                .str.split(by=" ")
-            )
-            .select("vars")
-            .to_series()
-            .explode()
-            .to_list()
-        )
+    def filter_variable_labels(self, labels: pl.DataFrame) -> pl.DataFrame:
+        """
+        Filters a frame of all the dataset's variable labels
+        to only the variables requested by this endpoint, through
+        the frame's `VariableIndex`.
+        """
 
-        data = response.json()
+        return VariableIndex.for_labels(labels).lookup(self.variables)
 
-        # filter endpoint variables to only those in search list
-        data = (
-            pl.from_dicts(data)
-            .transpose(column_names="column_0")
-            .lazy()
-            .filter(pl.col("name").str.contains_any(vars))
-            .with_columns(date_pulled=datetime.now())
-            .collect()
-        )
-        return data
+    def fetch_data_to_polars(self, shard: bool = False) -> pl.DataFrame:
+        """
+        Fetches data and returns it as a Polars DataFrame.
 
-    # TODO: fix bugs tomorrow :c
-    def fetch_data_to_polars(self) -> pl.DataFrame:
-        """Fetches data and returns it as a Polars DataFrame."""
-        try:
-            response = requests.get(self.full_url, timeout=30)
-            response.raise_for_status()
+        Throttling, server and connection errors are retried with
+        backoff; a `transport.RequestFailedError` is raised once a
+        request can't succeed. With `shard`, large tract and block
+        group geographies are fetched as concurrent per-state or
+        per-county requests (see `sharding.fetch_sharded`).
+        """
 
-            data = response.json()
+        if shard:
+            from .sharding import fetch_sharded
 
-        except requests.exceptions.HTTPError as http_err:
-            print(
-                f"HTTP error occurred for {self.dataset}: {http_err} | Content: {response.text}"
-            )
-            sys.exit(1)
-
-        except Exception as e:
-            print(f"An unexpected error occurred for {self.dataset}: {e}")
-            sys.exit(1)
-
-        # polars expressions
-        # column selection
-        geo_cols = ["geo_id", "ucgid", "geo_name"]
-        all_cols = ["headers", "records", "geo_id", "ucgid", "geo_name", "date_pulled"]
-        geo_expr = pl.col(geo_cols)
-        all_expr = pl.col(all_cols)
-
-        # used for capturing geo rows
-        def ensure_column_exists(
-            df: pl.DataFrame,
-            column_name: List[str] = ["geo_id", "ucgid", "geo_name"],
-            default_value: any = "unknown",
-        ) -> pl.DataFrame:
-            for col_name in column_name:
-                if col_name not in df.columns:
-                    df = df.with_columns(pl.lit(default_value).alias(col_name))
-
-            return df
+            return fetch_sharded(self)
 
-        if not data or len(data) < 2:
-            print(f"Warning: API for {self.dataset} returned unexpected format.")
-            df = pl.DataFrame(
-                {"headers": "unknown", "records": "unknown"}
-            ).with_columns(date_pulled=datetime.now())
+        data = self.get_json(self.full_url, self.url_no_key)
 
-            df = ensure_column_exists(df).select(all_expr)
+        return self.data_to_polars(data)
 
-            return df
+    def scan_data(self, shard: bool = False) -> pl.LazyFrame:
+        """
+        Lazily fetches the long data frame. Nothing is requested until
+        the frame is collected, so many endpoints can be combined into
+        one streaming query that fetches each one as it is reached.
+        """
 
-        if len(data) == 2:
-            # typed table data usually comes in a list of 2 LONG lists
-            lf = (
-                pl.DataFrame({"headers": data[0], "records": data[1]})
-                .with_columns(date_pulled=datetime.now())
-                .lazy()
-            )
-            # ensure geos are formatted the same way for everything
-            geos = (
-                lf.select(pl.col("headers").str.to_lowercase(), pl.col("records"))
-                .filter(
-                    (pl.col("headers").eq("geo_id"))
-                    | (pl.col("headers").eq("name"))
-                    | (pl.col("headers").eq("ucgid"))
-                )
-                .with_columns(
-                    pl.when(pl.col("headers").eq("name"))
-                    .then(pl.lit("geo_name"))
-                    .otherwise(pl.col("headers"))
-                    .alias("headers")
-                )
-                .collect()
-                .transpose(column_names="headers")
-            )
-            geos = ensure_column_exists(geos).select(geo_expr).lazy()
+        def source(
+            with_columns: Optional[list[str]],
+            predicate: Optional[pl.Expr],
+            n_rows: Optional[int],
+            batch_size: Optional[int],
+        ) -> Iterator[pl.DataFrame]:
+            data = self.fetch_data_to_polars(shard=shard)
+            if with_columns is not None:
+                data = data.select(with_columns)
+            if predicate is not None:
+                data = data.filter(predicate)
+            if n_rows is not None:
+                data = data.head(n_rows)
+            yield data
+
+        return register_io_source(source, schema=LONG_SCHEMA)
+
+    def data_to_polars(self, data: List[list]) -> pl.DataFrame:
+        """
+        Converts a decoded census api data response into the
+        long headers/records Polars DataFrame.
+        """
 
-            df = (
-                (
-                    pl.concat([lf, geos], how="horizontal")
-                    .fill_null(strategy="forward")
-                    .select(all_expr)
-                )
-                .filter(
-                    (pl.col("headers").str.to_lowercase().ne("geo_id"))
-                    & (pl.col("headers").str.to_lowercase().ne("name"))
-                    & (pl.col("headers").str.to_lowercase().ne("ucgid"))
+        if not data or len(data) < 2:
+            print(f"Warning: API for {self.dataset} returned unexpected format.")
+            return (
+                pl.DataFrame({"headers": "unknown", "records": "unknown"})
+                .with_columns(
+                    pl.lit("unknown").alias(col_name) for col_name in GEO_COLUMNS
                 )
-                .collect()
+                .with_columns(date_pulled=datetime.now())
+                .select(LONG_COLUMNS)
             )
 
-            return df
+        with instrumentation.span("parse", url=self.url_no_key) as span:
+            long = records_to_long(data, date_pulled=datetime.now())
+            span.set(rows=long.height)
+        return long
 
-        if len(data) > 2:
-            # other data are a list of headers, and then a list of arrays
+    def fetch_tidy_data(
+        self, shard: bool = False, lazy: bool = False, compact: bool = False
+    ) -> pl.DataFrame | pl.LazyFrame:
+        """
+        Fetch a tidy, human-readable dataset
+        from the census api endpoint and return
+        as a polars dataframe.
 
-            all_frames = []
-            headers = data[0]
+        With `lazy`, only the variable labels are fetched and the
+        unexecuted tidy plan is returned; the data is requested when
+        the plan is collected or sunk. With `compact` the result
+        follows `COMPACT_TIDY_SCHEMA`.
+        """
 
-            for record in data[1:]:
-                lf = (
-                    pl.DataFrame({"headers": headers, "records": record})
-                    .with_columns(date_pulled=datetime.now())
-                    .lazy()
-                )
+        self.resolve()
+        data = (
+            self.scan_data(shard=shard)
+            if lazy
+            else self.fetch_data_to_polars(shard=shard)
+        )
+        return self.tidy_data(
+            self.labels, data, self.concept, lazy=lazy, compact=compact
+        )
 
-                # ensure geos are formatted the same way for everything
-                geos = (
-                    lf.select(pl.col("headers").str.to_lowercase(), pl.col("records"))
-                    .filter(
-                        (pl.col("headers").eq("geo_id"))
-                        | (pl.col("headers").eq("name"))
-                        | (pl.col("headers").eq("ucgid"))
-                    )
-                    .with_columns(
-                        pl.when(pl.col("headers").eq("name"))
-                        .then(pl.lit("geo_name"))
-                        .otherwise(pl.col("headers"))
-                        .alias("headers")
-                    )
-                    .collect()
-                    .transpose(column_names="headers")
-                )
+    def sink_tidy_parquet(
+        self, path: str | Path, shard: bool = False, compact: bool = False
+    ) -> None:
+        """Streams the tidy dataset into a parquet file at `path`."""
 
-                geos = ensure_column_exists(geos).select(geo_expr).lazy()
-
-                lf = (
-                    pl.concat([lf, geos], how="horizontal")
-                    .filter(
-                        (pl.col("headers").str.to_lowercase().ne("geo_id"))
-                        & (pl.col("headers").str.to_lowercase().ne("name"))
-                        & (pl.col("headers").str.to_lowercase().ne("ucgid"))
-                    )
-                    .fill_null(strategy="forward")
-                    .select(all_expr)
-                )
+        self.fetch_tidy_data(shard=shard, lazy=True, compact=compact).sink_parquet(
+            path, mkdir=True
+        )
 
-                all_frames.append(lf)
+    def concept_from_labels(self, labels: pl.DataFrame) -> str:
+        """Derives the endpoint concept from its filtered variable labels."""
 
-            df = pl.concat(all_frames).collect()
+        if self.table_type != "not_table":
+            return labels.select(pl.col("concept").unique()).item()
 
-            return df
+        else:
+            return "no_concept"
 
-    def fetch_tidy_data(self) -> pl.DataFrame:
+    def tidy_data(
+        self,
+        labels: pl.DataFrame,
+        data: pl.DataFrame | pl.LazyFrame,
+        concept: Optional[str] = None,
+        lazy: bool = False,
+        compact: bool = False,
+    ) -> pl.DataFrame | pl.LazyFrame:
         """
-        Fetch a tidy, human-readable dataset
-        from the census api endpoint and return
-        as a polars dataframe.
+        Joins the endpoint's filtered variable labels onto its
+        long data frame and returns the tidy, human-readable result.
+        The concept is derived from `labels` unless given. With
+        `lazy` the plan is returned without being collected, with
+        `compact` it follows `COMPACT_TIDY_SCHEMA`.
         """
 
-        labels = self.fetch_variable_labels().lazy()  # .drop("date_pulled").lazy()
-        data = self.fetch_data_to_polars().lazy()  # .drop("date_pulled").lazy()
-
-        all_cols = [
-            "row_id",
-            "dataset",
-            "year",
-            "concept",
-            "geo_id",
-            "ucgid",
-            "geo_name",
-            "variable_id",
-            "variable_name",
-            "value",
-            "value_type",
-            "full_url",
-            "date_pulled",
+        if concept is None:
+            concept = self.concept_from_labels(labels)
+
+        tidy = _tidy_plan([(self, labels, concept, data)], compact=compact)
+        if lazy:
+            return tidy
+
+        with instrumentation.span("tidy", url=self.url_no_key) as span:
+            tidy = tidy.collect()
+            span.set(rows=tidy.height)
+        return tidy
+
+
+def compact_tidy(tidy: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """
+    Casts a tidy frame to `COMPACT_TIDY_SCHEMA`. Value types other
+    than the known ones become "other"; their suffix is still part
+    of `variable_id`. Frames compacted separately are re-encoded when
+    concatenated, unless built under a `pl.StringCache()`.
+    """
+
+    return tidy.with_columns(
+        pl.when(pl.col("value_type").is_in(VALUE_TYPE.categories.implode()))
+        .then(pl.col("value_type"))
+        .otherwise(pl.lit("other"))
+        .alias("value_type"),
+    ).cast(dict(COMPACT_TIDY_SCHEMA))
+
+
+def split_endpoint_dimension(
+    tidy: pl.DataFrame,
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Moves `full_url` and `concept` out of a tidy frame into a
+    dimension table with one row per endpoint (per concept, for
+    endpoints spanning several), keyed by an `endpoint_id` that is
+    stable across runs. Returns `(facts, endpoints)`; joining them on
+    `endpoint_id` restores the tidy columns.
+    """
+
+    endpoints = tidy.select("full_url", "concept").unique(maintain_order=True)
+    endpoint_ids = [
+        int.from_bytes(hashlib.sha256(f"{url}\x1f{concept}".encode()).digest()[:8])
+        for url, concept in endpoints.iter_rows()
+    ]
+    endpoints = endpoints.select(
+        pl.Series("endpoint_id", endpoint_ids, dtype=pl.UInt64), "full_url", "concept"
+    )
+
+    facts = tidy.join(
+        endpoints,
+        on=["full_url", "concept"],
+        how="left",
+        nulls_equal=True,
+        maintain_order="left",
+    ).select("endpoint_id", pl.exclude("endpoint_id", "full_url", "concept"))
+    return facts, endpoints
+
+
+def _tidy_plan(
+    parts: list[
+        tuple[
+            CensusAPIEndpoint,
+            pl.DataFrame | pl.LazyFrame,
+            str,
+            pl.DataFrame | pl.LazyFrame,
         ]
+    ],
+    compact: bool = False,
+) -> pl.LazyFrame:
+    """
+    The tidy plan of one or more `(endpoint, labels, concept, long
+    data)` parts as a single query. Labels are cleaned per endpoint,
+    as the concept to strip differs, while the data of all parts is
+    joined, filled and numbered at once.
+    """
 
-        all_expr = pl.col(all_cols)
+    batched = len(parts) > 1
 
-        # ensure data are presented same way everytime
-        tidy = (
-            data.join(
-                labels,
-                left_on="headers",
-                right_on="name",
-                how="left",
-            )
-            .with_columns(
+    def fill_forward(column: str) -> pl.Expr:
+        filled = pl.col(column).fill_null(strategy="forward")
+        if not batched:
+            return filled
+
+        # parts are contiguous, so a value may only be carried forward
+        # from the same part; cheaper than a window over "part"
+        source = (
+            pl.when(pl.col(column).is_not_null())
+            .then(pl.col("part"))
+            .fill_null(strategy="forward")
+        )
+        return pl.when(source == pl.col("part")).then(filled).alias(column)
+
+    row_id = pl.int_range(pl.len(), dtype=pl.UInt32)
+    if batched:
+        row_id = row_id.over("part")
+
+    labels = pl.concat(
+        [
+            labels.lazy().select(
+                pl.lit(part, dtype=pl.UInt32).alias("part"),
+                "name",
+                pl.col("concept").str.to_lowercase(),
                 pl.col("label")
                 .str.replace_all("!|:", " ")
                 .str.replace_all(r"\s+", " ")
                 .str.strip_chars()
                 .str.to_lowercase()
-                .alias("variable_name"),
-                pl.col("concept").str.to_lowercase(),
-                pl.col("records").cast(pl.Float32, strict=False).alias("value"),
-            )
-            .with_columns(
-                pl.col("variable_name").fill_null(strategy="forward"),
-                pl.col("headers")
-                .str.slice(-2)
-                .str.replace_all(r"\d", "")
-                .alias("value_type"),
-                pl.col("headers").alias("variable_id"),
-            )
-            .filter(pl.col("value") > -555555555)  # drop suppressed rows
-            .drop_nulls(pl.col("value"))  # drops rows like "***" or (X) post-cast
-            .with_row_index(name="row_id")
-            .with_columns(
-                pl.col("variable_name")
-                .str.replace(self.concept, "")
+                .str.replace(concept, "")
                 .str.replace("estimates", "")
                 .str.strip_chars()
                 .alias("variable_name"),
-                pl.when(pl.col("value_type") == pl.lit("E"))
-                .then(pl.lit("estimate"))
-                .when(pl.col("value_type") == pl.lit("M"))
-                .then(pl.lit("margin_of_error"))
-                .when(pl.col("value_type") == pl.lit("P"))
-                .then(pl.lit("percent_estimate"))
-                .when(pl.col("value_type") == pl.lit("PM"))
-                .then(pl.lit("percent_margin_of_error"))
-                .when(pl.col("value_type") == pl.lit("N"))
-                .then(pl.lit("count"))
-                .otherwise(pl.col("value_type"))
-                .alias("value_type"),
-                pl.lit(self.dataset).alias("dataset"),
-                pl.lit(self.year).alias("year"),
-                pl.lit(self.url_no_key).alias("full_url"),
             )
-            .fill_null(strategy="forward")  # fill concept forward
-            .select(all_expr)  # enforce order
-            .collect()
+            for part, (endpoint, labels, concept, _) in enumerate(parts)
+        ]
+    )
+    data = pl.concat(
+        [
+            data.lazy().with_columns(
+                pl.lit(part, dtype=pl.UInt32).alias("part"),
+                pl.lit(endpoint.dataset).alias("dataset"),
+                pl.lit(endpoint.year, dtype=pl.Int32).alias("year"),
+                pl.lit(endpoint.url_no_key).alias("full_url"),
+            )
+            for part, (endpoint, _, _, data) in enumerate(parts)
+        ]
+    )
+
+    # ensure data are presented same way everytime
+    tidy = (
+        data.join(
+            labels,
+            left_on=["part", "headers"],
+            right_on=["part", "name"],
+            how="left",
+            maintain_order="left",
+        )
+        .with_columns(
+            fill_forward("variable_name"),
+            pl.col("records")
+            .cast(pl.Float64 if compact else pl.Float32, strict=False)
+            .alias("value"),
+            value_type(pl.col("headers")).alias("value_type"),
+            pl.col("headers").alias("variable_id"),
+        )
+        .filter(pl.col("value") > -555555555)  # drop suppressed rows
+        .drop_nulls(pl.col("value"))  # drops rows like "***" or (X) post-cast
+        .with_columns(row_id.alias("row_id"))
+        .select(
+            # fill concept forward, in the same order every time
+            fill_forward(column)
+            for column in TIDY_SCHEMA
+        )
+    )
+    return compact_tidy(tidy) if compact else tidy
+
+
+def tidy_batch(
+    endpoints: Iterable[CensusAPIEndpoint],
+    data: Mapping[str, pl.DataFrame | pl.LazyFrame],
+    lazy: bool = False,
+    compact: bool = False,
+) -> pl.DataFrame | pl.LazyFrame:
+    """
+    Tidies the long frames of many resolved endpoints, keyed by
+    `url_no_key` in `data`, in one query rather than one per
+    endpoint, so planning is paid once and Polars parallelizes over
+    the whole batch. The result equals the concatenated
+    `tidy_data` of every endpoint, in order.
+    """
+
+    parts = {}
+    for endpoint in endpoints:
+        if endpoint.url_no_key in parts:
+            continue
+        endpoint.resolve()
+        parts[endpoint.url_no_key] = (
+            endpoint,
+            endpoint.labels,
+            endpoint.concept,
+            data[endpoint.url_no_key],
         )
+
+    if not parts:
+        tidy = pl.LazyFrame(schema=COMPACT_TIDY_SCHEMA if compact else TIDY_SCHEMA)
+    else:
+        tidy = _tidy_plan(list(parts.values()), compact=compact)
+
+    if lazy:
         return tidy
+
+    with instrumentation.span("tidy_batch", endpoints=len(parts)) as span:
+        tidy = tidy.collect()
+        span.set(rows=tidy.height)
+    return tidy
+
+
+def scan_tidy(
+    endpoints: Iterable[CensusAPIEndpoint], shard: bool = False, compact: bool = False
+) -> pl.LazyFrame:
+    """
+    Unions the lazy tidy plans of many endpoints. Each endpoint's
+    labels are resolved now (see `batch.prefetch` to do that in bulk),
+    while its data is only requested when the plan runs.
+    """
+
+    return pl.concat(
+        [
+            endpoint.fetch_tidy_data(shard=shard, lazy=True, compact=compact)
+            for endpoint in endpoints
+        ],
+        how="vertical_relaxed",
+    )
+
+
+def sink_tidy_parquet(
+    endpoints: Iterable[CensusAPIEndpoint],
+    path: str | Path,
+    partition_by: Optional[tuple[str, ...]] = ("dataset", "year"),
+    shard: bool = False,
+    compact: bool = False,
+) -> None:
+    """
+    Streams the tidy data of many endpoints into parquet with Polars'
+    streaming engine, hive partitioned under `path` by `partition_by`
+    (e.g. `dataset=acs%2Facs5/year=2023/`), or into the single file
+    `path` when `partition_by` is None. Endpoints are fetched as the
+    engine reaches them, so memory stays bounded by a few endpoints
+    rather than the whole run. With `compact` the files follow
+    `COMPACT_TIDY_SCHEMA`.
+    """
+
+    plan = scan_tidy(endpoints, shard=shard, compact=compact)
+    if partition_by:
+        plan.sink_parquet(pl.PartitionByKey(path, by=list(partition_by)), mkdir=True)
+    else:
+        plan.sink_parquet(path, mkdir=True)
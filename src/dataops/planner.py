@@ -0,0 +1,245 @@
+import logging
+import re
+from typing import Iterable, Optional
+
+import polars as pl
+from pydantic import BaseModel
+
+from .models import CensusAPIEndpoint, VariableIndex
+
+logger = logging.getLogger(__name__)
+
+# the census api rejects a `get=` with more variables than this
+MAX_VARIABLES = 50
+
+GROUP_PATTERN = re.compile(r"^group\((.+)\)$")
+
+
+def expand_variables(
+    endpoint: CensusAPIEndpoint, labels: Optional[pl.DataFrame] = None
+) -> list[str]:
+    """
+    The columns an endpoint's `get=` returns, with each `group()`
+    expanded through the dataset's variable metadata (`labels`, or
+    read from the variable cache) into GEO_ID, NAME and every variable
+    of the group followed by its annotation attributes. Groups missing
+    from the metadata are left as is.
+    """
+
+    groups = [
+        match.group(1)
+        for match in map(GROUP_PATTERN.match, endpoint.variables)
+        if match
+    ]
+    if not groups:
+        return list(dict.fromkeys(endpoint.variables))
+
+    if labels is None:
+        labels = endpoint.fetch_all_variable_labels()
+    attributes = (
+        pl.col("attributes").fill_null("").str.split(",")
+        if "attributes" in labels.columns
+        else pl.lit([], dtype=pl.List(pl.String))
+    )
+    # members are found as for `resolve`, by the table id when the
+    # metadata has no `group` column
+    index = VariableIndex.for_labels(labels)
+    columns_by_group = {}
+    for group in dict.fromkeys(groups):
+        rows = index.groups.get(group)
+        if rows is not None:
+            columns_by_group[group] = (
+                labels[rows]
+                .sort("name")
+                .select(
+                    pl.concat_list(pl.col("name"), attributes)
+                    .list.eval(pl.element().filter(pl.element() != ""))
+                    .explode()
+                )
+                .to_series()
+                .drop_nulls()
+                .to_list()
+            )
+
+    columns = []
+    for variable in endpoint.variables:
+        match = GROUP_PATTERN.match(variable)
+        if match and match.group(1) in columns_by_group:
+            columns += ["GEO_ID", "NAME", *columns_by_group[match.group(1)]]
+        else:
+            columns.append(variable)
+
+    return list(dict.fromkeys(columns))
+
+
+class CoalescedRequest(BaseModel):
+    """
+    One census api call standing in for one or more endpoints that
+    share a year, dataset and geography. `columns` holds the columns
+    each member endpoint asked for, keyed by its `url_no_key`.
+    """
+
+    endpoint: CensusAPIEndpoint
+    members: list[CensusAPIEndpoint]
+    columns: dict[str, list[str]]
+
+    @classmethod
+    def single(
+        cls, endpoint: CensusAPIEndpoint, columns: Optional[list[str]] = None
+    ) -> "CoalescedRequest":
+        """A request for one endpoint, sent unchanged."""
+        return cls(
+            endpoint=endpoint,
+            members=[endpoint],
+            columns={endpoint.url_no_key: columns or endpoint.variables},
+        )
+
+    @property
+    def is_coalesced(self) -> bool:
+        return len(self.members) > 1
+
+    def split(self, data: list[list]) -> dict[str, pl.DataFrame]:
+        """
+        Splits the decoded response of `endpoint` into the long
+        headers/records frame each member would have received on its
+        own, keyed by the member's `url_no_key`.
+        """
+
+        if not self.is_coalesced:
+            member = self.members[0]
+            return {member.url_no_key: member.data_to_polars(data)}
+
+        long = self.endpoint.data_to_polars(data)
+        if not data or len(data) < 2:
+            return {member.url_no_key: long for member in self.members}
+
+        # geography columns the api appends after the requested ones
+        requested = set(self.endpoint.variables)
+        geo_headers = [header for header in data[0] if header not in requested]
+
+        frames = {}
+        for member in self.members:
+            columns = self.columns[member.url_no_key]
+            frame = long.filter(pl.col("headers").is_in(columns + geo_headers))
+
+            # the api only fills these when they're part of the `get=`
+            frame = frame.with_columns(
+                pl.lit("unknown").alias(geo_name)
+                for header, geo_name in [("GEO_ID", "geo_id"), ("NAME", "geo_name")]
+                if header not in columns
+            )
+            frames[member.url_no_key] = frame
+
+        return frames
+
+
+def plan_requests(
+    endpoints: Iterable[CensusAPIEndpoint],
+    max_variables: int = MAX_VARIABLES,
+    metadata: Optional[dict[tuple[int, str], pl.DataFrame]] = None,
+) -> list[CoalescedRequest]:
+    """
+    Merges endpoints that differ only in their variables into the
+    fewest api calls of at most `max_variables` variables each.
+
+    Endpoints are packed whole, largest first, into the first call for
+    their year, dataset and geography with room for them; endpoints
+    that don't fit into a single call are requested unchanged. Groups
+    are expanded through the variable metadata, taken from `metadata`
+    by (year, dataset) or fetched (or read from the variable cache)
+    once per dataset.
+    """
+
+    metadata = metadata or {}
+
+    buckets: dict[tuple, list[tuple[CensusAPIEndpoint, list[str]]]] = {}
+    requests = []
+    for endpoint in _unique(endpoints):
+        columns = expand_variables(
+            endpoint, metadata.get((endpoint.year, endpoint.dataset))
+        )
+        if len(columns) > max_variables or any(map(GROUP_PATTERN.match, columns)):
+            requests.append(CoalescedRequest.single(endpoint, columns))
+            continue
+
+        key = (
+            str(endpoint.base_url),
+            endpoint.year,
+            endpoint.dataset,
+            endpoint.geography,
+            endpoint.within,
+        )
+        buckets.setdefault(key, []).append((endpoint, columns))
+
+    for members in buckets.values():
+        calls: list[tuple[list, dict]] = []
+        for endpoint, columns in sorted(members, key=lambda m: -len(m[1])):
+            for call_members, call_columns in calls:
+                new_columns = [c for c in columns if c not in call_columns]
+                if len(call_columns) + len(new_columns) <= max_variables:
+                    break
+            else:
+                call_members, call_columns = [], {}
+                calls.append((call_members, call_columns))
+
+            call_members.append((endpoint, columns))
+            call_columns.update(dict.fromkeys(columns))
+
+        for call_members, call_columns in calls:
+            if len(call_members) == 1:
+                requests.append(CoalescedRequest.single(*call_members[0]))
+                continue
+
+            first = call_members[0][0]
+            requests.append(
+                CoalescedRequest(
+                    endpoint=CensusAPIEndpoint(
+                        base_url=first.base_url,
+                        year=first.year,
+                        dataset=first.dataset,
+                        variables=list(call_columns),
+                        geography=first.geography,
+                        within=first.within,
+                        api_key=first.api_key,
+                    ),
+                    members=[endpoint for endpoint, _ in call_members],
+                    columns={
+                        endpoint.url_no_key: columns
+                        for endpoint, columns in call_members
+                    },
+                )
+            )
+
+    merged = sum(len(request.members) for request in requests)
+    logger.info("Planned %d api calls for %d endpoints", len(requests), merged)
+    return requests
+
+
+def _unique(endpoints: Iterable[CensusAPIEndpoint]) -> list[CensusAPIEndpoint]:
+    unique = {}
+    for endpoint in endpoints:
+        unique.setdefault(endpoint.url_no_key, endpoint)
+    return list(unique.values())
+
+
+def fetch_coalesced(
+    endpoints: Iterable[CensusAPIEndpoint],
+    max_variables: int = MAX_VARIABLES,
+    plan: Optional[list[CoalescedRequest]] = None,
+) -> dict[str, pl.DataFrame]:
+    """
+    Fetches many endpoints with as few api calls as possible and
+    returns each endpoint's long frame, as `fetch_data_to_polars`
+    would, keyed by its `url_no_key`.
+    """
+
+    plan = plan if plan is not None else plan_requests(endpoints, max_variables)
+
+    frames = {}
+    for request in plan:
+        endpoint = request.endpoint
+        frames.update(
+            request.split(endpoint.get_json(endpoint.full_url, endpoint.url_no_key))
+        )
+
+    return frames
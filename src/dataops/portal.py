@@ -1,16 +1,35 @@
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, Optional
+
 from .models import ApplicationSettings
+from . import instrumentation, transport
 import polars as pl
+from polars.io.plugins import register_io_source
+from pydantic import BaseModel, computed_field
 from sodapy import Socrata
 
+logger = logging.getLogger(__name__)
+
 
 def fetch_data(
     source: str | None = None,
     settings: ApplicationSettings | None = None,
     lazy: bool = True,
+    stream: bool = False,
+    select: str | None = None,
+    where: str | None = None,
+    page_size: int = 50_000,
 ) -> pl.LazyFrame | pl.DataFrame:
     """
     Retrieve portal data as polars dataframe.
     Environmental variables are used as defaults unless otherwise specified.
+
+    `select` and `where` are SoQL clauses applied by the portal. With
+    `stream=True` the data is read page by page through `scan_data`
+    instead of being downloaded up front.
     """
     if settings is None:
         settings = ApplicationSettings()
@@ -18,14 +37,21 @@ def fetch_data(
     if source is None:
         source = settings.source_id
 
-    with Socrata(
-        settings.domain,
-        settings.socrata_token,
-        settings.socrata_user,
-        settings.socrata_pass,
-    ) as client:
-        data = client.get_all(source)
-        data = pl.LazyFrame(data)
+    if stream:
+        data = scan_data(
+            source, settings, select=select, where=where, page_size=page_size
+        )
+
+        if not lazy:
+            return data.collect()
+
+        return data
+
+    client = transport.shared_pool().socrata(settings)
+    with instrumentation.span("portal.get_all", source=source) as span:
+        data = pl.DataFrame(client.get_all(source, select=select, where=where))
+        span.set(rows=data.height)
+    data = data.lazy()
 
     if not lazy:
         return data.collect()
@@ -33,6 +59,98 @@ def fetch_data(
     return data
 
 
+def fetch_page(
+    client: Socrata, source: str, params: dict[str, str | int]
+) -> pl.DataFrame:
+    """
+    Retrieve one page of a portal dataset through the csv export
+    and decode it straight into a polars dataframe of strings.
+    """
+    url = f"{client.uri_prefix}{client.domain}/resource/{source}.csv"
+    params = {key: value for key, value in params.items() if value is not None}
+
+    response = transport.request(
+        "GET", url, session=client.session, params=params, timeout=client.timeout
+    )
+
+    if not response.content.strip():
+        return pl.DataFrame()
+
+    return pl.read_csv(io.BytesIO(response.content), infer_schema=False)
+
+
+def scan_data(
+    source: str | None = None,
+    settings: ApplicationSettings | None = None,
+    select: str | None = None,
+    where: str | None = None,
+    page_size: int = 50_000,
+) -> pl.LazyFrame:
+    """
+    Lazily scan a portal dataset, paging through the SODA api with
+    `$limit`/`$offset` only when the frame is collected.
+
+    Column selections on the returned frame are pushed down to the
+    portal as `$select` (unless a `select` clause is given), filters are
+    applied to each page as it arrives, and `head` stops paging early,
+    so memory is bounded by the page size rather than the dataset.
+    All columns are read as strings.
+    """
+    if settings is None:
+        settings = ApplicationSettings()
+
+    if source is None:
+        source = settings.source_id
+
+    socrata = transport.shared_pool().socrata(settings)
+
+    def schema() -> pl.Schema:
+        page = fetch_page(
+            socrata, source, {"$select": select, "$where": where, "$limit": 1}
+        )
+        return pl.Schema({column: pl.String for column in page.columns})
+
+    def pages(
+        with_columns: Optional[list[str]],
+        predicate: Optional[pl.Expr],
+        n_rows: Optional[int],
+        batch_size: Optional[int],
+    ) -> Iterator[pl.DataFrame]:
+        params = {
+            "$select": select,
+            "$where": where,
+            # a stable order is needed for $offset paging
+            "$order": ":id",
+            "$limit": page_size,
+        }
+        # an empty projection (e.g. only counting rows) reads every column
+        if select is None and with_columns:
+            params["$select"] = ",".join(with_columns)
+
+        offset = 0
+        while n_rows is None or n_rows > 0:
+            page = fetch_page(socrata, source, {**params, "$offset": offset})
+            page_height = page.height
+            if page_height == 0:
+                return
+
+            if with_columns:
+                page = page.select(with_columns)
+            if predicate is not None:
+                page = page.filter(predicate)
+            if n_rows is not None:
+                page = page.head(n_rows)
+                n_rows -= page.height
+
+            yield page
+
+            if page_height < page_size:
+                return
+            offset += page_size
+
+    return register_io_source(pages, schema=schema)
+
+
 def pull_endpoints(df: pl.DataFrame) -> list[str] | pl.DataFrame:
     """Retrieve a list of api endpoints from a dataframe."""
 
@@ -42,23 +160,300 @@ def pull_endpoints(df: pl.DataFrame) -> list[str] | pl.DataFrame:
     return df
 
 
+class PublishReport(BaseModel):
+    """Summary of the rows and batches sent to a portal dataset."""
+
+    target: str
+    rows: int = 0
+    batches: int = 0
+    rows_created: int = 0
+    rows_updated: int = 0
+    rows_deleted: int = 0
+    errors: int = 0
+    seconds: float = 0
+
+    @computed_field
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def add(self, rows: int, result: dict) -> None:
+        """Adds one batch and the portal's upsert result to the report."""
+        self.rows += rows
+        self.batches += 1
+        self.rows_created += int(result.get("Rows Created", 0))
+        self.rows_updated += int(result.get("Rows Updated", 0))
+        self.rows_deleted += int(result.get("Rows Deleted", 0))
+        self.errors += int(result.get("Errors", 0))
+
+
+def send_batch(
+    client: Socrata,
+    target: str,
+    data: pl.DataFrame,
+    method: str = "POST",
+    policy: transport.RetryPolicy | None = None,
+) -> dict:
+    """
+    Send one batch to a portal dataset as csv, serialized straight
+    from polars. POST upserts the rows, PUT replaces the dataset.
+    Failed batches are retried according to `policy`.
+    """
+    url = f"{client.uri_prefix}{client.domain}/resource/{target}.json"
+
+    with instrumentation.span(
+        "portal.send_batch", target=target, method=method, rows=data.height
+    ) as span:
+        buffer = io.BytesIO()
+        data.write_csv(buffer)
+        span.set(bytes=buffer.tell())
+
+        response = transport.request(
+            method,
+            url,
+            session=client.session,
+            policy=policy,
+            data=buffer.getvalue(),
+            headers={"Content-Type": "text/csv"},
+            timeout=client.timeout,
+        )
+        return transport.decode_json(response.content, url)
+
+
+def _upsert_batches(
+    client: Socrata,
+    target: str,
+    data: pl.DataFrame,
+    report: PublishReport,
+    batch_size: int,
+    max_workers: int,
+    policy: transport.RetryPolicy | None,
+    started: float,
+) -> None:
+    total_rows = report.rows + data.height
+    batches = [
+        data.slice(offset, batch_size) for offset in range(0, data.height, batch_size)
+    ]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(send_batch, client, target, batch, "POST", policy): batch.height
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            report.add(futures[future], future.result())
+            report.seconds = time.perf_counter() - started
+            logger.info(
+                "%s: %d/%d rows sent (%.0f rows/s)",
+                target,
+                report.rows,
+                total_rows,
+                report.rows_per_second,
+            )
+
+
+def upsert_data(
+    data: pl.DataFrame,
+    target: str | None = None,
+    settings: ApplicationSettings | None = None,
+    batch_size: int = 10_000,
+    max_workers: int = 1,
+    policy: transport.RetryPolicy | None = None,
+) -> PublishReport:
+    """
+    Upsert data into a portal dataset in batches of `batch_size` rows,
+    sending up to `max_workers` batches at once.
+    Environmental variables are used as defaults unless otherwise specified.
+    """
+    if settings is None:
+        settings = ApplicationSettings()
+
+    if target is None:
+        target = settings.target_id
+
+    report = PublishReport(target=target)
+    started = time.perf_counter()
+
+    client = transport.shared_pool().socrata(settings)
+    with instrumentation.span("portal.upsert", target=target, rows=data.height):
+        _upsert_batches(
+            client, target, data, report, batch_size, max_workers, policy, started
+        )
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
 def replace_data(
     data: pl.DataFrame,
     target: str | None = None,
     settings: ApplicationSettings | None = None,
-):
+    batch_size: int | None = None,
+    max_workers: int = 1,
+    policy: transport.RetryPolicy | None = None,
+) -> PublishReport:
+    """
+    Replace the contents of a portal dataset with data.
+    Environmental variables are used as defaults unless otherwise specified.
+
+    Without a `batch_size` everything is sent in one request. Otherwise
+    the first batch replaces the dataset and the remaining batches are
+    upserted, up to `max_workers` at a time. Upserted batches should
+    only be retried against datasets with a row identifier, or a
+    timed-out batch that did land may be inserted twice.
+    """
+    if settings is None:
+        settings = ApplicationSettings()
+
+    if target is None:
+        target = settings.target_id
+
+    if batch_size is None:
+        batch_size = max(data.height, 1)
+
+    report = PublishReport(target=target)
+    started = time.perf_counter()
+
+    client = transport.shared_pool().socrata(settings)
+    with instrumentation.span("portal.replace", target=target, rows=data.height):
+        first = data.head(batch_size)
+        report.add(first.height, send_batch(client, target, first, "PUT", policy))
+
+        _upsert_batches(
+            client,
+            target,
+            data.slice(batch_size),
+            report,
+            batch_size,
+            max_workers,
+            policy,
+            started,
+        )
+
+    report.seconds = time.perf_counter() - started
+    logger.info(
+        "%s: replaced with %d rows in %d batches (%.0f rows/s)",
+        target,
+        report.rows,
+        report.batches,
+        report.rows_per_second,
+    )
+    return report
+
+
+def with_row_hash(
+    data: pl.DataFrame, key: str, hash_column: str = "row_hash"
+) -> pl.DataFrame:
+    """
+    Add a hash of every non-key column, stored as text so it
+    round-trips through the portal.
+
+    Polars doesn't guarantee hashes are stable across its versions;
+    after an upgrade the next delta publish rewrites every row once.
+    """
+    value_columns = [col for col in data.columns if col not in (key, hash_column)]
+
+    return data.with_columns(
+        pl.struct(value_columns)
+        .hash(seed=0, seed_1=1, seed_2=2, seed_3=3)
+        .cast(pl.String)
+        .alias(hash_column)
+    )
+
+
+def diff_data(
+    data: pl.DataFrame,
+    current: pl.DataFrame,
+    key: str,
+    hash_column: str = "row_hash",
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Compare hashed new data against the key and hash columns currently
+    published. Returns the rows to upsert (new or changed) and the
+    `:deleted` rows for keys that are no longer present.
+    """
+    new_keys = data.select(pl.col(key).cast(pl.String).alias("_key"), hash_column)
+    current = current.select(
+        pl.col(key).cast(pl.String).alias("_key"),
+        pl.col(hash_column).alias("_current_hash"),
+    )
+
+    changed = (
+        new_keys.join(current, on="_key", how="left")
+        .filter(
+            pl.col("_current_hash").is_null()
+            | (pl.col("_current_hash") != pl.col(hash_column))
+        )
+        .select("_key")
+    )
+    upserts = data.join(
+        changed, left_on=pl.col(key).cast(pl.String), right_on="_key", how="semi"
+    )
+
+    deletes = current.join(new_keys, on="_key", how="anti").select(
+        pl.col("_key").alias(key), pl.lit(True).alias(":deleted")
+    )
+
+    return upserts, deletes
+
+
+def publish_delta(
+    data: pl.DataFrame,
+    key: str,
+    target: str | None = None,
+    settings: ApplicationSettings | None = None,
+    hash_column: str = "row_hash",
+    batch_size: int = 10_000,
+    max_workers: int = 1,
+    policy: transport.RetryPolicy | None = None,
+) -> PublishReport:
+    """
+    Publish only the rows that changed since the last publish.
+    Environmental variables are used as defaults unless otherwise specified.
+
+    The target dataset must use `key` as its row identifier and have a
+    text `hash_column`, which this function fills. Only the key and
+    hash columns of the target are read back; new and changed rows are
+    upserted and rows whose key disappeared are sent as `:deleted`.
+    """
     if settings is None:
         settings = ApplicationSettings()
 
     if target is None:
         target = settings.target_id
 
-    dict_data = data.to_dicts()
+    data = with_row_hash(data, key, hash_column)
+    current = scan_data(
+        target,
+        settings,
+        select=f"{key},{hash_column}",
+        page_size=max(batch_size, 50_000),
+    ).collect()
+
+    upserts, deletes = diff_data(data, current, key, hash_column)
+    logger.info(
+        "%s: %d rows to upsert, %d rows to delete, %d unchanged",
+        target,
+        upserts.height,
+        deletes.height,
+        data.height - upserts.height,
+    )
+
+    report = PublishReport(target=target)
+    started = time.perf_counter()
+
+    client = transport.shared_pool().socrata(settings)
+    for changes in (upserts, deletes):
+        _upsert_batches(
+            client,
+            target,
+            changes,
+            report,
+            batch_size,
+            max_workers,
+            policy,
+            started,
+        )
 
-    with Socrata(
-        settings.domain,
-        settings.socrata_token,
-        settings.socrata_user,
-        settings.socrata_pass,
-    ) as client:
-        client.replace(target, dict_data)
+    report.seconds = time.perf_counter() - started
+    return report
@@ -0,0 +1,213 @@
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+
+import polars as pl
+
+from . import transport
+from .models import CensusAPIEndpoint
+
+if TYPE_CHECKING:
+    from .warehouse import TidyWarehouse
+
+logger = logging.getLogger(__name__)
+
+# the census api's DCAT catalog, listing every dataset with its `modified` date
+DATA_CATALOG_URL = "https://api.census.gov/data.json"
+
+STATE_SCHEMA = pl.Schema(
+    {
+        "url_no_key": pl.String,
+        "year": pl.Int32,
+        "dataset": pl.String,
+        "version": pl.String,
+        "date_pulled": pl.Datetime("us"),
+        "checked_at": pl.Datetime("us"),
+    }
+)
+
+
+def catalog_versions(catalog: dict) -> dict[tuple[int, str], str]:
+    """
+    Maps `(year, dataset)` to the `modified` timestamp of every
+    vintage in a decoded `/data.json` catalog. Timeseries datasets,
+    which have no vintage, are left out.
+    """
+
+    versions = {}
+    for entry in catalog.get("dataset", []):
+        vintage, parts = entry.get("c_vintage"), entry.get("c_dataset")
+        if vintage is None or not parts or not entry.get("modified"):
+            continue
+        versions[(int(vintage), "/".join(parts))] = str(entry["modified"])
+    return versions
+
+
+class FreshnessScheduler:
+    """
+    Refetches endpoints only when their upstream data may have changed.
+
+    An endpoint's version is its dataset's `modified` timestamp in the
+    census `/data.json` catalog or, for datasets missing from it, the
+    `ETag` or `Last-Modified` header of its variables url. The version
+    and pull date of every fetched endpoint are recorded in a parquet
+    state file, and later runs skip endpoints whose version hasn't
+    changed. Endpoints whose version can't be determined are always
+    refetched.
+    """
+
+    def __init__(
+        self,
+        state_path: str | Path,
+        catalog_url: str = DATA_CATALOG_URL,
+        policy: Optional[transport.RetryPolicy] = None,
+    ):
+        self.state_path = Path(state_path)
+        self.catalog_url = catalog_url
+        self.policy = policy
+
+    @property
+    def state(self) -> pl.DataFrame:
+        """One row per endpoint pulled, with its version at the time."""
+        if not self.state_path.exists():
+            return pl.DataFrame(schema=STATE_SCHEMA)
+        return pl.read_parquet(self.state_path)
+
+    def upstream_versions(
+        self, endpoints: Iterable[CensusAPIEndpoint]
+    ) -> dict[tuple[int, str], Optional[str]]:
+        """
+        The current upstream version of each `(year, dataset)` among
+        the endpoints, None where no signal is available. The catalog
+        is downloaded once; the variables url is only asked for
+        datasets the catalog doesn't list.
+        """
+
+        datasets: dict[tuple[int, str], CensusAPIEndpoint] = {}
+        for endpoint in endpoints:
+            datasets.setdefault((endpoint.year, endpoint.dataset), endpoint)
+
+        catalog = self._catalog_versions()
+        return {
+            key: catalog.get(key) or self._variables_version(endpoint)
+            for key, endpoint in datasets.items()
+        }
+
+    def stale(
+        self,
+        endpoints: Iterable[CensusAPIEndpoint],
+        versions: Optional[dict[tuple[int, str], Optional[str]]] = None,
+    ) -> list[CensusAPIEndpoint]:
+        """
+        The endpoints never pulled, or pulled at an older or unknown
+        version, de-duplicated by `url_no_key`.
+        """
+
+        endpoints = list(
+            {endpoint.url_no_key: endpoint for endpoint in endpoints}.values()
+        )
+        if versions is None:
+            versions = self.upstream_versions(endpoints)
+
+        recorded = dict(self.state.select("url_no_key", "version").iter_rows())
+        stale = [
+            endpoint
+            for endpoint in endpoints
+            if (version := versions.get((endpoint.year, endpoint.dataset))) is None
+            or recorded.get(endpoint.url_no_key) != version
+        ]
+
+        logger.info("%d of %d endpoints changed upstream", len(stale), len(endpoints))
+        return stale
+
+    def refresh(
+        self, endpoints: Iterable[CensusAPIEndpoint], shard: bool = False
+    ) -> Iterator[tuple[CensusAPIEndpoint, pl.DataFrame]]:
+        """
+        Fetches the tidy data of every stale endpoint, one at a time.
+        Each pull is recorded once the caller has consumed it, so an
+        interrupted run resumes where it stopped.
+        """
+
+        endpoints = list(endpoints)
+        versions = self.upstream_versions(endpoints)
+        for endpoint in self.stale(endpoints, versions):
+            data = endpoint.fetch_tidy_data(shard=shard)
+            yield endpoint, data
+            self.record(
+                endpoint,
+                versions.get((endpoint.year, endpoint.dataset)),
+                data["date_pulled"].max() if data.height else None,
+            )
+
+    def run(
+        self,
+        endpoints: Iterable[CensusAPIEndpoint],
+        warehouse: "TidyWarehouse",
+        shard: bool = False,
+    ) -> pl.DataFrame:
+        """
+        Refreshes the stale endpoints into `warehouse` and returns
+        their state rows. A run where nothing changed upstream only
+        costs the version checks.
+        """
+
+        pulled = []
+        for endpoint, data in self.refresh(endpoints, shard=shard):
+            warehouse.write(data)
+            pulled.append(endpoint.url_no_key)
+
+        return self.state.filter(pl.col("url_no_key").is_in(pulled))
+
+    def record(
+        self,
+        endpoint: CensusAPIEndpoint,
+        version: Optional[str],
+        date_pulled: Optional[datetime] = None,
+    ) -> None:
+        """Records that the endpoint was pulled at the given version."""
+
+        now = datetime.now()
+        entry = pl.DataFrame(
+            {
+                "url_no_key": endpoint.url_no_key,
+                "year": endpoint.year,
+                "dataset": endpoint.dataset,
+                "version": version,
+                "date_pulled": date_pulled or now,
+                "checked_at": now,
+            },
+            schema=STATE_SCHEMA,
+        )
+        state = self.state.filter(pl.col("url_no_key") != endpoint.url_no_key)
+
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(f".{os.getpid()}.tmp")
+        pl.concat([state, entry]).write_parquet(tmp_path)
+        tmp_path.replace(self.state_path)
+
+    def _catalog_versions(self) -> dict[tuple[int, str], str]:
+        try:
+            response = transport.request("GET", self.catalog_url, policy=self.policy)
+            return catalog_versions(
+                transport.decode_json(response.content, self.catalog_url)
+            )
+        except transport.RequestFailedError as e:
+            logger.warning("Could not read the dataset catalog: %s", e)
+            return {}
+
+    def _variables_version(self, endpoint: CensusAPIEndpoint) -> Optional[str]:
+        try:
+            response = transport.request(
+                "HEAD", endpoint.variable_url, policy=self.policy
+            )
+        except transport.RequestFailedError as e:
+            logger.warning("Could not check %s: %s", endpoint.variable_url, e)
+            return None
+
+        version = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if version is None:
+            logger.info("No version signal for %s", endpoint.variable_url)
+        return version
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import re
+from typing import Optional
+
+import httpx
+import polars as pl
+
+from . import transport
+from .batch import HostRateLimiter, _client, _get_json, _run
+from .models import CensusAPIEndpoint
+
+logger = logging.getLogger(__name__)
+
+# `for=` levels too large to request for a whole state or the nation,
+# and the `in=` levels they are split by, outermost first
+SHARDED_LEVELS = {
+    "tract": ["state", "county"],
+    "block group": ["state", "county"],
+}
+
+# ucgid summary levels of tracts and block groups, and the level each
+# `pseudo()` parent is split into (nation into states, state into counties)
+PSEUDO_CHILDREN = {"1400000", "1500000"}
+PSEUDO_PARENTS = {"0100000": "0400000", "0400000": "0500000"}
+
+PSEUDO_PATTERN = re.compile(r"^pseudo\(([0-9A-Z]+)\$(\d{7})\)$")
+
+
+def parse_within(within: Optional[str]) -> dict[str, str]:
+    """Parses an `in=` clause such as 'state:09 county:001' into a dict."""
+    return dict(re.findall(r"([a-z][a-z ]*?):(\S+)", within or ""))
+
+
+def format_within(within: dict[str, str]) -> Optional[str]:
+    return " ".join(f"{level}:{code}" for level, code in within.items()) or None
+
+
+class ShardPlan:
+    """
+    How one large geography request is split: `discovery` lists the
+    parent geographies in its `parent_column`, and `shard_geography`
+    maps one parent to the fields narrowing `endpoint` to it.
+    """
+
+    def __init__(
+        self,
+        endpoint: CensusAPIEndpoint,
+        discovery: CensusAPIEndpoint,
+        parent_column: str,
+        shard_geography,
+    ):
+        self.endpoint = endpoint
+        self.discovery = discovery
+        self.parent_column = parent_column
+        self.shard_geography = shard_geography
+
+    def shards(self, data: list[list]) -> list[CensusAPIEndpoint]:
+        """One endpoint per distinct parent in the discovery response."""
+        if not data:
+            return []
+
+        index = data[0].index(self.parent_column)
+        parents = dict.fromkeys(row[index] for row in data[1:])
+
+        return [
+            self.endpoint.model_copy(update=self.shard_geography(parent))
+            for parent in parents
+        ]
+
+
+def plan_shards(endpoint: CensusAPIEndpoint) -> Optional[ShardPlan]:
+    """
+    Returns how to split the endpoint's geography into parallel
+    requests, or None if it is small enough to request at once.
+
+    `for=tract:*` and `for=block group:*` are split by state when the
+    state is missing or a wildcard, otherwise by county. A ucgid
+    `pseudo()` of tracts or block groups is split into one `pseudo()`
+    per state (of the nation) or county (of a state).
+    """
+
+    geo_key, geo_value = endpoint.geography.split(":", 1)
+    discovery = {
+        "base_url": endpoint.base_url,
+        "year": endpoint.year,
+        "dataset": endpoint.dataset,
+        "api_key": endpoint.api_key,
+    }
+
+    if geo_key == "for":
+        level, _ = geo_value.rsplit(":", 1)
+        within = parse_within(endpoint.within)
+        parents = SHARDED_LEVELS.get(level, [])
+        parent = next(
+            (parent for parent in parents if within.get(parent, "*") == "*"), None
+        )
+        if parent is None:
+            return None
+
+        outer = parents[: parents.index(parent)]
+        return ShardPlan(
+            endpoint,
+            CensusAPIEndpoint(
+                **discovery,
+                variables=["NAME"],
+                geography=f"for:{parent}:*",
+                within=format_within({key: within[key] for key in outer}),
+            ),
+            parent_column=parent,
+            shard_geography=lambda code: {
+                "within": format_within({**within, parent: code})
+            },
+        )
+
+    match = PSEUDO_PATTERN.match(geo_value) if geo_key == "ucgid" else None
+    if match is None:
+        return None
+
+    parent_id, child_level = match.groups()
+    parent_level = PSEUDO_PARENTS.get(parent_id[:7])
+    if child_level not in PSEUDO_CHILDREN or parent_level is None:
+        return None
+
+    return ShardPlan(
+        endpoint,
+        CensusAPIEndpoint(
+            **discovery,
+            variables=["GEO_ID"],
+            geography=f"ucgid:pseudo({parent_id}${parent_level})",
+        ),
+        parent_column="GEO_ID",
+        shard_geography=lambda geo_id: {
+            "geography": f"ucgid:pseudo({geo_id}${child_level})"
+        },
+    )
+
+
+async def fetch_sharded_async(
+    endpoint: CensusAPIEndpoint,
+    max_concurrency: int = 8,
+    requests_per_second: Optional[float] = None,
+    timeout: Optional[float] = None,
+    client: Optional[httpx.AsyncClient] = None,
+    policy: Optional[transport.RetryPolicy] = None,
+) -> pl.DataFrame:
+    """
+    Fetches a large geography as concurrent sub-requests, one per
+    parent geography (see `plan_shards`), and returns the same long
+    frame as `fetch_data_to_polars`.
+
+    Each shard is converted to a frame as soon as it arrives, so only
+    one raw response per in-flight request is held. Parents are
+    de-duplicated and the shards are disjoint, so no geography is
+    returned twice. Endpoints that don't need sharding are fetched
+    with a single request.
+    """
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = HostRateLimiter(requests_per_second)
+
+    async def fetch(shard: CensusAPIEndpoint) -> pl.DataFrame:
+        data = await _get_json(
+            http_client,
+            shard.full_url,
+            semaphore,
+            limiter,
+            log_url=shard.url_no_key,
+            policy=policy,
+            cache=shard.response_cache,
+        )
+        return shard.data_to_polars(data)
+
+    http_client = _client(client, max_concurrency, timeout)
+    try:
+        plan = plan_shards(endpoint)
+        if plan is None:
+            return await fetch(endpoint)
+
+        parents = await _get_json(
+            http_client,
+            plan.discovery.full_url,
+            semaphore,
+            limiter,
+            log_url=plan.discovery.url_no_key,
+            policy=policy,
+            cache=plan.discovery.response_cache,
+        )
+        shards = plan.shards(parents)
+        logger.info("Fetching %s in %d shards", endpoint.url_no_key, len(shards))
+
+        frames = await asyncio.gather(*(fetch(shard) for shard in shards))
+    finally:
+        if client is None:
+            await http_client.aclose()
+
+    if not frames:
+        return endpoint.data_to_polars([])
+
+    return pl.concat(frames, how="vertical_relaxed")
+
+
+def fetch_sharded(
+    endpoint: CensusAPIEndpoint,
+    max_concurrency: int = 8,
+    requests_per_second: Optional[float] = None,
+    timeout: Optional[float] = None,
+    policy: Optional[transport.RetryPolicy] = None,
+) -> pl.DataFrame:
+    """Blocking wrapper around `fetch_sharded_async`."""
+    return _run(
+        fetch_sharded_async(
+            endpoint,
+            max_concurrency=max_concurrency,
+            requests_per_second=requests_per_second,
+            timeout=timeout,
+            policy=policy,
+        )
+    )
@@ -0,0 +1,458 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from pydantic import BaseModel, Field
+from requests.adapters import HTTPAdapter
+from sodapy import Socrata
+
+from . import instrumentation
+
+try:
+    import orjson
+except ImportError:  # optional, installed with the `fast` extra
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# httpx speaks HTTP/2 only with `h2`, installed with the `http2` extra
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+# --- Exceptions ---
+
+
+class RequestFailedError(Exception):
+    """Raised when an HTTP request fails and should not be retried."""
+
+    def __init__(
+        self,
+        message: str,
+        url: str,
+        status_code: Optional[int] = None,
+        content: Optional[str] = None,
+        attempts: int = 1,
+    ):
+        super().__init__(message)
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.attempts = attempts
+
+    def __reduce__(self):
+        # keep errors picklable, so they can cross process pool boundaries
+        return (self.__class__, (str(self), self.url), self.__dict__)
+
+
+class TransientRequestError(RequestFailedError):
+    """
+    Raised when a request keeps failing with a throttling, server
+    or connection error after every retry has been used.
+    """
+
+    def __init__(self, *args, retry_after: Optional[float] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(RequestFailedError):
+    """Raised without sending a request while a host's circuit is open."""
+
+
+class InvalidResponseError(RequestFailedError):
+    """Raised when a successful response body can't be decoded."""
+
+
+# --- Retry Policy ---
+
+
+class RetryPolicy(BaseModel):
+    """
+    Exponential backoff with full jitter, honoring `Retry-After`
+    when the server sends one.
+    """
+
+    max_attempts: int = Field(5, ge=1)
+    backoff_base: float = Field(0.5, ge=0, description="Seconds before retry 1.")
+    backoff_max: float = Field(60, ge=0, description="Longest single wait.")
+    jitter: bool = True
+    retry_statuses: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait after the given (1-based) failed attempt."""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+
+        delay = min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a `Retry-After` header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+# --- Circuit Breaker ---
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive transient failures per host. After
+    `failure_threshold` failures the host's circuit opens and requests
+    fail fast for `reset_timeout` seconds, after which a single trial
+    request is let through.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures: dict[str, int] = {}
+        self._opened_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlparse(url).netloc
+
+    def before_request(self, url: str) -> None:
+        """Raises `CircuitOpenError` if the url's host is failing fast."""
+        host = self.host(url)
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return
+
+            remaining = opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(
+                    f"Circuit for {host} is open for another {remaining:.1f}s.",
+                    url=url,
+                )
+
+            # half-open: let this request through as the trial
+            self._opened_at[host] = time.monotonic()
+
+    def record_success(self, url: str) -> None:
+        host = self.host(url)
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+
+    def record_failure(self, url: str) -> None:
+        host = self.host(url)
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.failure_threshold:
+                if host not in self._opened_at:
+                    logger.warning("Opening circuit for %s", host)
+                self._opened_at[host] = time.monotonic()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._failures.clear()
+            self._opened_at.clear()
+
+
+# --- Connection Pool ---
+
+
+class ConnectionPool:
+    """
+    Keep-alive connections shared by every census and portal request,
+    so only the first request to a host pays for TCP and TLS setup.
+
+    The `requests` session and the Socrata clients (one per domain and
+    credentials) are created on first use and reused by all threads
+    until `close`; `requests` asks for and decodes gzip responses on
+    its own. httpx clients are bound to an event loop, so
+    `async_client` builds one per batch with the same limits, over
+    HTTP/2 when `http2` is set and the `h2` package is installed.
+    """
+
+    def __init__(self, pool_size: int = 32, timeout: float = 30, http2: bool = True):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.http2 = http2
+        self._session: Optional[requests.Session] = None
+        self._socrata: dict[tuple[str, ...], Socrata] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings) -> "ConnectionPool":
+        """Builds a pool from the http fields of `ApplicationSettings`."""
+        return cls(
+            pool_size=settings.http_pool_size,
+            timeout=settings.http_timeout,
+            http2=settings.http2,
+        )
+
+    def mount(self, session: requests.Session) -> requests.Session:
+        """Sizes the session's connection pools to `pool_size`."""
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                self._session = self.mount(requests.Session())
+            return self._session
+
+    def socrata(self, settings) -> Socrata:
+        """The shared Socrata client for the domain and credentials of `settings`."""
+        key = (
+            settings.domain,
+            settings.socrata_token,
+            settings.socrata_user,
+            settings.socrata_pass,
+        )
+        with self._lock:
+            client = self._socrata.get(key)
+            if client is None:
+                client = Socrata(*key, timeout=self.timeout)
+                self.mount(client.session)
+                self._socrata[key] = client
+            return client
+
+    def async_client(
+        self, max_connections: Optional[int] = None, timeout: Optional[float] = None
+    ) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=self.http2 and HTTP2_AVAILABLE,
+            timeout=self.timeout if timeout is None else timeout,
+            limits=httpx.Limits(max_connections=max_connections or self.pool_size),
+        )
+
+    def close(self) -> None:
+        """Closes every pooled connection; the next request opens new ones."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            for client in self._socrata.values():
+                client.close()
+            self._socrata.clear()
+
+    def __enter__(self) -> "ConnectionPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+# shared by every request unless one is passed explicitly
+default_retry_policy = RetryPolicy()
+circuit_breaker = CircuitBreaker()
+
+# built from `ApplicationSettings` on first use, see `shared_pool`
+connection_pool: Optional[ConnectionPool] = None
+_connection_pool_lock = threading.Lock()
+
+
+def shared_pool() -> ConnectionPool:
+    """
+    The pool used by every request made without its own session or
+    client. It is configured from `ApplicationSettings`
+    (`HTTP_POOL_SIZE`, `HTTP_TIMEOUT`, `HTTP2`) when first used;
+    assign `connection_pool` to replace it.
+    """
+
+    global connection_pool
+    with _connection_pool_lock:
+        if connection_pool is None:
+            from .models import ApplicationSettings
+
+            connection_pool = ConnectionPool.from_settings(ApplicationSettings())
+        return connection_pool
+
+
+def _classify(
+    url: str, response: requests.Response | httpx.Response, policy: RetryPolicy
+) -> Optional[RequestFailedError]:
+    """Maps an HTTP status to the exception it should raise, if any."""
+    status_code = response.status_code
+    if status_code < 400:
+        return None
+
+    message = f"HTTP {status_code} for {url}"
+    if status_code in policy.retry_statuses:
+        return TransientRequestError(
+            message,
+            url=url,
+            status_code=status_code,
+            content=response.text,
+            retry_after=parse_retry_after(response.headers.get("Retry-After")),
+        )
+
+    return RequestFailedError(
+        message, url=url, status_code=status_code, content=response.text
+    )
+
+
+def request(
+    method: str,
+    url: str,
+    session: Optional[requests.Session] = None,
+    policy: Optional[RetryPolicy] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    log_url: Optional[str] = None,
+    **kwargs,
+) -> requests.Response:
+    """
+    Sends a request with `requests`, retrying throttling, server and
+    connection errors. `log_url` replaces `url` in errors and logs so
+    api keys aren't leaked. Without a `session` the request goes
+    through the `shared_pool`.
+    """
+
+    pool = shared_pool()
+    policy = policy or default_retry_policy
+    breaker = breaker or circuit_breaker
+    sender = session or pool.session
+    log_url = log_url or url
+    kwargs.setdefault("timeout", pool.timeout)
+
+    with instrumentation.span("http", method=method, url=log_url) as span:
+        return _send(sender, method, url, log_url, policy, breaker, span, **kwargs)
+
+
+def _send(sender, method, url, log_url, policy, breaker, span, **kwargs):
+    for attempt in range(1, policy.max_attempts + 1):
+        span.set(retries=attempt - 1)
+        breaker.before_request(url)
+
+        try:
+            response = sender.request(method, url, **kwargs)
+            error = _classify(log_url, response, policy)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = TransientRequestError(f"{e!r} for {log_url}", url=log_url)
+
+        if error is None:
+            breaker.record_success(url)
+            span.set(status=response.status_code, bytes=len(response.content))
+            return response
+
+        error.attempts = attempt
+        if not isinstance(error, TransientRequestError):
+            breaker.record_success(url)
+            raise error
+
+        breaker.record_failure(url)
+        if attempt == policy.max_attempts:
+            raise error
+
+        delay = policy.delay(attempt, error.retry_after)
+        logger.warning(
+            "Attempt %d/%d failed (%s), retrying in %.1fs",
+            attempt,
+            policy.max_attempts,
+            error,
+            delay,
+        )
+        time.sleep(delay)
+
+
+async def arequest(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    policy: Optional[RetryPolicy] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    log_url: Optional[str] = None,
+    **kwargs,
+) -> httpx.Response:
+    """Async counterpart of `request` for an `httpx.AsyncClient`."""
+
+    policy = policy or default_retry_policy
+    breaker = breaker or circuit_breaker
+    log_url = log_url or url
+
+    with instrumentation.span("http", method=method, url=log_url) as span:
+        return await _asend(
+            client, method, url, log_url, policy, breaker, span, **kwargs
+        )
+
+
+async def _asend(client, method, url, log_url, policy, breaker, span, **kwargs):
+    for attempt in range(1, policy.max_attempts + 1):
+        span.set(retries=attempt - 1)
+        breaker.before_request(url)
+
+        try:
+            response = await client.request(method, url, **kwargs)
+            error = _classify(log_url, response, policy)
+        except httpx.TransportError as e:
+            error = TransientRequestError(f"{e!r} for {log_url}", url=log_url)
+
+        if error is None:
+            breaker.record_success(url)
+            span.set(status=response.status_code, bytes=len(response.content))
+            return response
+
+        error.attempts = attempt
+        if not isinstance(error, TransientRequestError):
+            breaker.record_success(url)
+            raise error
+
+        breaker.record_failure(url)
+        if attempt == policy.max_attempts:
+            raise error
+
+        delay = policy.delay(attempt, error.retry_after)
+        logger.warning(
+            "Attempt %d/%d failed (%s), retrying in %.1fs",
+            attempt,
+            policy.max_attempts,
+            error,
+            delay,
+        )
+        await asyncio.sleep(delay)
+
+
+def decode_json(content: bytes, log_url: str):
+    """
+    Decodes a response body, raising `InvalidResponseError` if it isn't
+    JSON. Uses orjson when it is installed.
+    """
+    try:
+        with instrumentation.span("decode", url=log_url, bytes=len(content)):
+            if orjson is not None:
+                return orjson.loads(content)
+            return json.loads(content)
+    except ValueError as e:
+        raise InvalidResponseError(
+            f"Response from {log_url} is not valid JSON: {e}",
+            url=log_url,
+            content=content[:500].decode(errors="replace"),
+        ) from e
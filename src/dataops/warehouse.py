@@ -0,0 +1,237 @@
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Literal, Optional
+from urllib.parse import quote
+
+import polars as pl
+
+from .models import TIDY_SCHEMA, ApplicationSettings, CensusAPIEndpoint, value_type
+
+logger = logging.getLogger(__name__)
+
+PARTITION_COLUMNS = ["dataset", "year"]
+
+# the tidy columns, with values stored as Float64 so the exact values
+# of compact frames (see `compact_tidy`) are kept
+WAREHOUSE_SCHEMA = pl.Schema({**TIDY_SCHEMA, "value": pl.Float64})
+
+# partition columns live in the directory names, not in the files
+FILE_SCHEMA = pl.Schema(
+    {
+        col: dtype
+        for col, dtype in WAREHOUSE_SCHEMA.items()
+        if col not in PARTITION_COLUMNS
+    }
+)
+HIVE_SCHEMA = pl.Schema({col: WAREHOUSE_SCHEMA[col] for col in PARTITION_COLUMNS})
+
+MANIFEST_SCHEMA = pl.Schema(
+    {
+        "url_no_key": pl.String,
+        "dataset": pl.String,
+        "year": pl.Int32,
+        "file": pl.String,
+        "rows": pl.UInt32,
+        "date_pulled": pl.Datetime("us"),
+        "written_at": pl.Datetime("us"),
+    }
+)
+
+
+class TidyWarehouse:
+    """
+    A local store of tidy census pulls.
+
+    Rows are kept as parquet, hive partitioned by dataset and year
+    (`dataset=acs%2Facs5/year=2023/`), with one file per write of a
+    pull. A manifest records which pulls (by `url_no_key`, the tidy
+    `full_url` column) are stored, in which files and when they were
+    pulled. Writing a pull again replaces its rows (`upsert`) or adds
+    to them (`append`).
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.manifest_path = self.root / "_manifest.parquet"
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: ApplicationSettings | None = None):
+        """Opens the warehouse at `WAREHOUSE_DIR`."""
+        if settings is None:
+            settings = ApplicationSettings()
+        if not settings.warehouse_dir:
+            raise ValueError("WAREHOUSE_DIR is not set.")
+        return cls(settings.warehouse_dir)
+
+    @property
+    def manifest(self) -> pl.DataFrame:
+        """One row per stored file, oldest first."""
+        if not self.manifest_path.exists():
+            return pl.DataFrame(schema=MANIFEST_SCHEMA)
+        return pl.read_parquet(self.manifest_path)
+
+    def pulls(self) -> pl.DataFrame:
+        """One row per stored pull with its row count and latest pull date."""
+        return self.manifest.group_by(
+            "url_no_key", "dataset", "year", maintain_order=True
+        ).agg(
+            pl.col("rows").sum(),
+            pl.col("date_pulled").max(),
+            pl.col("written_at").max(),
+        )
+
+    def contains(self, url_no_key: str) -> bool:
+        return url_no_key in self.manifest["url_no_key"]
+
+    def partition_dir(self, dataset: str, year: int) -> Path:
+        return self.root / f"dataset={quote(dataset, safe='')}" / f"year={year}"
+
+    def write(
+        self,
+        data: pl.DataFrame | pl.LazyFrame,
+        mode: Literal["upsert", "append"] = "upsert",
+    ) -> pl.DataFrame:
+        """
+        Stores tidy or compact tidy rows, one file per pull (`full_url`)
+        they contain, cast to `WAREHOUSE_SCHEMA`. With `upsert` the
+        earlier files of those pulls are dropped, with `append` they
+        are kept. Returns the new manifest rows.
+        """
+
+        if mode not in ("upsert", "append"):
+            raise ValueError(f"mode must be 'upsert' or 'append', not {mode!r}")
+
+        if isinstance(data, pl.LazyFrame):
+            data = data.collect()
+        # compact frames (see `compact_tidy`) only name the known value
+        # types, the raw one is restored from the variable id
+        if isinstance(data.schema["value_type"], pl.Enum):
+            data = data.with_columns(
+                value_type=value_type(pl.col("variable_id").cast(pl.String))
+            )
+        data = data.cast(dict(WAREHOUSE_SCHEMA))
+
+        written_at = datetime.now()
+        entries = []
+        for (url, dataset, year), pull in data.group_by(
+            "full_url", *PARTITION_COLUMNS, maintain_order=True
+        ):
+            digest = hashlib.sha256(url.encode()).hexdigest()[:16]
+            directory = self.partition_dir(dataset, year)
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"{digest}-{written_at:%Y%m%dT%H%M%S%f}.parquet"
+
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            pull.select(FILE_SCHEMA.names()).write_parquet(tmp_path)
+            tmp_path.replace(path)
+
+            entries.append(
+                {
+                    "url_no_key": url,
+                    "dataset": dataset,
+                    "year": year,
+                    "file": path.relative_to(self.root).as_posix(),
+                    "rows": pull.height,
+                    "date_pulled": pull["date_pulled"].max(),
+                    "written_at": written_at,
+                }
+            )
+
+        entries = pl.DataFrame(entries, schema=MANIFEST_SCHEMA)
+        with self._lock:
+            manifest = self.manifest
+            if mode == "upsert":
+                replaced = manifest.filter(
+                    pl.col("url_no_key").is_in(entries["url_no_key"].implode())
+                )
+                manifest = manifest.join(replaced, on="file", how="anti")
+
+            # the manifest goes first, so a failed write never leaves it
+            # pointing at files that are already gone
+            self._write_manifest(pl.concat([manifest, entries]))
+            if mode == "upsert":
+                self._remove_files(replaced["file"])
+
+        logger.info("Stored %d pulls (%d rows)", entries.height, data.height)
+        return entries
+
+    def delete(self, url_no_keys: Iterable[str]) -> int:
+        """Removes pulls from the warehouse, returning the rows removed."""
+        url_no_keys = list(url_no_keys)
+        with self._lock:
+            manifest = self.manifest
+            removed = manifest.filter(pl.col("url_no_key").is_in(url_no_keys))
+            self._write_manifest(manifest.join(removed, on="file", how="anti"))
+            self._remove_files(removed["file"])
+        return removed["rows"].sum()
+
+    def sync(
+        self,
+        endpoints: Iterable[CensusAPIEndpoint],
+        refresh: bool = False,
+        shard: bool = False,
+    ) -> pl.DataFrame:
+        """
+        Fetches and upserts every endpoint not already stored (or every
+        endpoint with `refresh`), one at a time so memory stays bounded
+        by a single pull. Returns the new manifest rows.
+        """
+
+        stored = set() if refresh else set(self.manifest["url_no_key"])
+        entries = [
+            self.write(endpoint.fetch_tidy_data(shard=shard))
+            for endpoint in endpoints
+            if endpoint.url_no_key not in stored
+        ]
+        if not entries:
+            return pl.DataFrame(schema=MANIFEST_SCHEMA)
+        return pl.concat(entries)
+
+    def scan(
+        self,
+        dataset: Optional[str | list[str]] = None,
+        year: Optional[int | list[int]] = None,
+    ) -> pl.LazyFrame:
+        """
+        Lazily scans the stored rows (`WAREHOUSE_SCHEMA`). Filters on
+        `dataset` and `year`, given here or applied to the returned
+        frame, prune whole partitions; other filters are pushed down
+        to the parquet row groups.
+        """
+
+        files = self.manifest["file"]
+        if files.is_empty():
+            return pl.LazyFrame(schema=WAREHOUSE_SCHEMA)
+
+        frame = pl.scan_parquet(
+            [self.root / file for file in files],
+            hive_partitioning=True,
+            hive_schema=HIVE_SCHEMA,
+            schema=FILE_SCHEMA,
+            # files written before values were kept as Float64
+            cast_options=pl.ScanCastOptions(float_cast="upcast"),
+        )
+
+        if dataset is not None:
+            datasets = [dataset] if isinstance(dataset, str) else dataset
+            frame = frame.filter(pl.col("dataset").is_in(datasets))
+        if year is not None:
+            years = [year] if isinstance(year, int) else year
+            frame = frame.filter(pl.col("year").is_in(years))
+
+        return frame.select(WAREHOUSE_SCHEMA.names())
+
+    def _write_manifest(self, manifest: pl.DataFrame) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        manifest.write_parquet(tmp_path)
+        tmp_path.replace(self.manifest_path)
+
+    def _remove_files(self, files: pl.Series) -> None:
+        for file in files:
+            (self.root / file).unlink(missing_ok=True)
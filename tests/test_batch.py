@@ -0,0 +1,263 @@
+import asyncio
+from datetime import datetime
+
+import httpx
+import polars as pl
+import pytest
+
+from src.dataops import transport
+from src.dataops.batch import (
+    BatchFetchError,
+    HostRateLimiter,
+    as_endpoints,
+    fetch_tidy_batch_async,
+    prefetch,
+    prefetch_async,
+)
+from src.dataops.cache import VariableCache
+from src.dataops.models import TIDY_SCHEMA, CensusAPIEndpoint, variables_to_polars
+
+VARIABLES = [
+    ["name", "label", "concept", "predicateType", "group", "limit"],
+    [
+        "B19013A_001E",
+        "Estimate!!Median household income",
+        "Median Household Income (White Alone Householder)",
+        "int",
+        "B19013A",
+        "0",
+    ],
+    [
+        "B19013B_001E",
+        "Estimate!!Median household income",
+        "Median Household Income (Black Alone Householder)",
+        "int",
+        "B19013B",
+        "0",
+    ],
+]
+
+
+def census_transport(calls: list[str]) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path.endswith("/variables"):
+            return httpx.Response(200, json=VARIABLES)
+        table = request.url.params["get"][len("group(") : -1]
+        return httpx.Response(
+            200,
+            json=[
+                ["GEO_ID", "NAME", f"{table}_001E", "ucgid"],
+                ["0400000US09", "Connecticut", "91000", "0400000US09"],
+            ],
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def test_fetch_tidy_batch_dedupes_metadata(mocker):
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", VariableCache())
+    urls = [
+        f"https://api.census.gov/data/2023/acs/acs5?get=group({table})&ucgid=0400000US09"
+        for table in ["B19013A", "B19013B"]
+    ]
+    calls = []
+
+    async def run():
+        async with httpx.AsyncClient(transport=census_transport(calls)) as client:
+            return await fetch_tidy_batch_async(urls, concat=False, client=client)
+
+    frames = asyncio.run(run())
+
+    assert calls.count("/data/2023/acs/acs5/variables") == 1
+    assert len(calls) == 3
+    assert set(frames) == {CensusAPIEndpoint.from_url(url).url_no_key for url in urls}
+    for frame in frames.values():
+        assert frame.height == 1
+        assert frame["geo_name"].item() == "Connecticut"
+        assert frame["value_type"].item() == "estimate"
+
+    tidy = pl.concat(frames.values())
+    assert tidy["variable_id"].to_list() == ["B19013A_001E", "B19013B_001E"]
+
+
+def test_host_rate_limiter_spaces_requests():
+    limiter = HostRateLimiter(requests_per_second=20)
+
+    async def run():
+        start = asyncio.get_running_loop().time()
+        await asyncio.gather(
+            *(limiter.wait("https://api.census.gov/data") for _ in range(4))
+        )
+        return asyncio.get_running_loop().time() - start
+
+    assert asyncio.run(run()) >= 0.14
+
+
+def test_fetch_tidy_batch_reports_failed_endpoints(mocker):
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", VariableCache())
+    calls = []
+    healthy = census_transport(calls)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if "B19013B" in request.url.params.get("get", ""):
+            return httpx.Response(400, text="error: unknown variable")
+        return healthy.handle_request(request)
+
+    urls = [
+        f"https://api.census.gov/data/2023/acs/acs5?get=group({table})&ucgid=0400000US09"
+        for table in ["B19013A", "B19013B"]
+    ]
+
+    async def run():
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await fetch_tidy_batch_async(urls, client=client)
+
+    with pytest.raises(BatchFetchError) as error:
+        asyncio.run(run())
+
+    assert list(error.value.frames) == [CensusAPIEndpoint.from_url(urls[0]).url_no_key]
+    assert [e.variables for e in error.value.failed_endpoints] == [["group(B19013B)"]]
+    assert (
+        error.value.failures[error.value.failed_endpoints[0].url_no_key].status_code
+        == 400
+    )
+
+
+def test_prefetch_resolves_endpoints_in_bulk(mocker):
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", VariableCache())
+    endpoints = [
+        CensusAPIEndpoint.from_url(
+            f"https://api.census.gov/data/2023/acs/acs5?get=group({table})&ucgid=0400000US09"
+        )
+        for table in ["B19013A", "B19013B"]
+    ]
+    calls = []
+
+    async def run():
+        async with httpx.AsyncClient(transport=census_transport(calls)) as client:
+            return await prefetch_async(endpoints, client=client)
+
+    assert asyncio.run(run()) == {}
+    assert calls == ["/data/2023/acs/acs5/variables"]
+    assert [endpoint.labels["name"].to_list() for endpoint in endpoints] == [
+        ["B19013A_001E"],
+        ["B19013B_001E"],
+    ]
+    assert all(endpoint.concept == "no_concept" for endpoint in endpoints)
+
+
+def test_fetch_tidy_batch_executors_agree(mocker):
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", VariableCache())
+    urls = [
+        f"https://api.census.gov/data/2023/acs/acs5?get=group({table})&ucgid=0400000US09"
+        for table in ["B19013A", "B19013B"]
+    ]
+
+    async def run(**kwargs):
+        transport = census_transport([])
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await fetch_tidy_batch_async(urls, client=client, **kwargs)
+
+    serial = asyncio.run(run()).drop("date_pulled")
+    batched = asyncio.run(run(executor="batched")).drop("date_pulled")
+    pooled = asyncio.run(run(executor="process", max_workers=2))
+
+    assert batched.equals(serial)
+    assert pooled.drop("date_pulled").equals(serial)
+
+
+@pytest.mark.parametrize("executor", ["serial", "batched", "process"])
+def test_fetch_tidy_batch_reports_tidy_errors(mocker, executor):
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", VariableCache())
+    healthy = census_transport([])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if "B19013B" in request.url.params.get("get", ""):
+            # a header with no rows of the same length
+            return httpx.Response(200, json=[["GEO_ID", "NAME"], ["0400000US09"]])
+        return healthy.handle_request(request)
+
+    urls = [
+        f"https://api.census.gov/data/2023/acs/acs5?get=group({table})&ucgid=0400000US09"
+        for table in ["B19013A", "B19013B"]
+    ]
+
+    async def run():
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await fetch_tidy_batch_async(
+                urls, client=client, executor=executor, max_workers=1
+            )
+
+    with pytest.raises(BatchFetchError) as error:
+        asyncio.run(run())
+
+    assert [e.variables for e in error.value.failed_endpoints] == [["group(B19013B)"]]
+    assert list(error.value.frames) == [CensusAPIEndpoint.from_url(urls[0]).url_no_key]
+
+
+def test_blocking_wrappers_run_inside_an_event_loop(mocker):
+    cache = VariableCache()
+    cache.put(2023, "acs/acs5", variables_to_polars(VARIABLES, datetime.now()))
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", cache)
+    endpoint = CensusAPIEndpoint.from_url(
+        "https://api.census.gov/data/2023/acs/acs5?get=group(B19013A)&ucgid=0400000US09"
+    )
+
+    async def notebook_cell():
+        return prefetch([endpoint])
+
+    assert asyncio.run(notebook_cell()) == {}
+    assert endpoint.labels["name"].to_list() == ["B19013A_001E"]
+
+
+def test_batch_reports_endpoints_that_fail_to_resolve(mocker):
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", VariableCache())
+    # table datasets take their concept from the group's labels, so a
+    # mistyped group has none
+    urls = [
+        f"https://api.census.gov/data/2023/acs/acs5/subject?get=group({table})&ucgid=0400000US09"
+        for table in ["B19013A", "B99999"]
+    ]
+    good, bad = [CensusAPIEndpoint.from_url(url).url_no_key for url in urls]
+
+    async def run(fetch):
+        async with httpx.AsyncClient(transport=census_transport([])) as client:
+            return await fetch(as_endpoints(urls), client=client)
+
+    failures = asyncio.run(run(prefetch_async))
+    assert list(failures) == [bad]
+    assert isinstance(failures[bad], ValueError)
+
+    with pytest.raises(BatchFetchError) as error:
+        asyncio.run(run(fetch_tidy_batch_async))
+    assert list(error.value.frames) == [good]
+    assert list(error.value.failures) == [bad]
+
+
+@pytest.mark.parametrize("coalesce", [False, True])
+def test_batch_keeps_metadata_the_cache_evicts(mocker, coalesce):
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", VariableCache(maxsize=2))
+    blocking = mocker.patch.object(transport, "request")
+    urls = [
+        f"https://api.census.gov/data/{year}/acs/acs5?get=group(B19013A)&ucgid=0400000US09"
+        for year in range(2020, 2024)
+    ]
+    calls = []
+
+    async def run():
+        async with httpx.AsyncClient(transport=census_transport(calls)) as client:
+            return await fetch_tidy_batch_async(
+                urls, client=client, concat=False, coalesce=coalesce
+            )
+
+    assert len(asyncio.run(run())) == len(urls)
+    assert sum(call.endswith("/variables") for call in calls) == len(urls)
+    assert blocking.call_count == 0
+
+
+def test_fetch_tidy_batch_of_no_endpoints():
+    assert asyncio.run(fetch_tidy_batch_async([])).schema == TIDY_SCHEMA
+    assert asyncio.run(fetch_tidy_batch_async([], concat=False)) == {}
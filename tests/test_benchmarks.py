@@ -0,0 +1,46 @@
+import json
+
+import polars as pl
+
+from benchmarks.fixtures import SCENARIOS, record_fixtures
+from benchmarks.run import main, run_benchmarks
+from src.dataops.models import CensusAPIEndpoint
+
+
+def test_benchmarks_run_every_stage_offline(tmp_path):
+    results = run_benchmarks(scale=0.001, cache_dir=tmp_path)
+
+    assert results.height == len(SCENARIOS) * 5
+    assert results["stage"].unique(maintain_order=True).to_list() == [
+        "decode",
+        "parse",
+        "labels",
+        "tidy",
+        "end_to_end",
+    ]
+    assert (results["rows"] > 0).all()
+    assert (results["peak_rss_mb"] > 0).all()
+
+
+def test_benchmarks_flag_regressions(tmp_path):
+    results_path = tmp_path / "results.json"
+    args = ["--scenario", "pseudo", "--scale", "0.1", "--cache-dir", str(tmp_path)]
+    assert main(args + ["--json", str(results_path)]) == 0
+
+    baseline = pl.DataFrame(json.loads(results_path.read_text()))
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(
+        json.dumps(baseline.with_columns(seconds=pl.lit(1e-9)).to_dicts())
+    )
+    assert main(args + ["--baseline", str(baseline_path)]) == 1
+
+
+def test_fixtures_are_rerecorded_at_a_new_scale(tmp_path):
+    pseudo = [scenario for scenario in SCENARIOS if scenario.name == "pseudo"]
+    url = CensusAPIEndpoint.from_url(pseudo[0].url).url_no_key
+
+    small = record_fixtures(tmp_path, pseudo, scale=0.1)
+    assert len(json.loads(small.get(url))) == 16 + 1
+
+    full = record_fixtures(tmp_path, pseudo, scale=1.0)
+    assert len(json.loads(full.get(url))) == 169 + 1
@@ -0,0 +1,57 @@
+import polars as pl
+import pytest
+
+from src.dataops.brfss import column_spec, read_brfss, scan_brfss
+from src.dataops.codebook import CODEBOOK_SCHEMA
+
+
+def variable(name, start, end, type, values):
+    column = f"{start}-{end}" if end > start else str(start)
+    return [
+        (name, "Section", name, column, start, end, type, value, label)
+        for value, label in values
+    ]
+
+
+CODEBOOK = pl.DataFrame(
+    [
+        *variable("_STATE", 1, 2, "Num", [("1", "Alabama"), ("9", "Connecticut")]),
+        *variable("SEQNO", 3, 8, "Char", [("2023000001 - 2023012345", "Sequence")]),
+        *variable(
+            "SEXVAR", 9, 9, "Num", [("1", "Male"), ("2", "Female"), ("BLANK", "Missing")]
+        ),
+        *variable(
+            "CHILDREN", 10, 11, "Num",
+            [("1 - 87", "Number of children"), ("88", "None"), ("99", "Refused")],
+        ),
+    ],
+    schema=CODEBOOK_SCHEMA,
+    orient="row",
+)  # fmt: skip
+
+
+def test_read_brfss_slices_labels_and_projects(tmp_path):
+    path = tmp_path / "LLCP2023.ASC"
+    path.write_bytes(b"09ABC123102\r\n01XYZ789 88\r\n09QRS456299\r\n")
+
+    assert column_spec(CODEBOOK)["width"].to_list() == [2, 6, 1, 2]
+
+    data = read_brfss(path, CODEBOOK)
+    assert data.columns == ["_STATE", "SEQNO", "SEXVAR", "CHILDREN"]
+    assert data.rows() == [
+        ("Connecticut", "ABC123", "Male", 2.0),
+        ("Alabama", "XYZ789", "Missing", 88.0),
+        ("Connecticut", "QRS456", "Female", 99.0),
+    ]
+    assert data.schema["SEXVAR"] == pl.Enum(["Male", "Female", "Missing"])
+
+    codes = read_brfss(path, CODEBOOK, columns=["SEXVAR", "_STATE"], labels=False)
+    assert codes.rows() == [(1.0, 9.0), (None, 1.0), (2.0, 9.0)]
+
+    lazy = scan_brfss(path, CODEBOOK).filter(pl.col("_STATE") == "Connecticut")
+    assert lazy.select("CHILDREN").collect()["CHILDREN"].to_list() == [2, 99]
+
+    assert scan_brfss(path, CODEBOOK).head(2).collect().rows() == data.head(2).rows()
+
+    with pytest.raises(ValueError, match="AGE"):
+        scan_brfss(path, CODEBOOK, columns=["AGE"])
@@ -0,0 +1,178 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import polars as pl
+import pytest
+import requests
+
+from src.dataops import transport
+from src.dataops.cache import OfflineCacheMissError, ResponseCache, VariableCache
+from src.dataops.models import CensusAPIEndpoint
+
+
+def test_variable_cache_fetches_once():
+    cache = VariableCache()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return pl.DataFrame({"name": ["B19013A_001E"]})
+
+    first = cache.get_or_fetch(2023, "acs/acs5", fetch)
+    second = cache.get_or_fetch(2023, "/acs/acs5/", fetch)
+
+    assert len(calls) == 1
+    assert first.equals(second)
+
+
+def test_variable_cache_fetches_different_datasets_concurrently():
+    cache = VariableCache()
+    both_fetching = threading.Barrier(2, timeout=5)
+
+    def fetch():
+        # fails with BrokenBarrierError if the fetches run one at a time
+        both_fetching.wait()
+        return pl.DataFrame({"name": ["B01001_001E"]})
+
+    with ThreadPoolExecutor(2) as pool:
+        futures = [
+            pool.submit(cache.get_or_fetch, 2023, dataset, fetch)
+            for dataset in ["acs/acs5", "acs/acs1"]
+        ]
+        assert all(future.result().height == 1 for future in futures)
+
+
+def test_variable_cache_lru_and_ttl():
+    cache = VariableCache(maxsize=1, ttl=timedelta(seconds=0.05))
+    cache.put(2022, "acs/acs5", pl.DataFrame({"name": ["a"]}))
+    cache.put(2023, "acs/acs5", pl.DataFrame({"name": ["b"]}))
+
+    assert cache.get(2022, "acs/acs5") is None
+    assert cache.get(2023, "acs/acs5") is not None
+
+    time.sleep(0.1)
+    assert cache.get(2023, "acs/acs5") is None
+
+
+def test_variable_cache_disk_tier(tmp_path):
+    frame = pl.DataFrame({"name": ["S2701_C01_001E"], "concept": ["Health"]})
+    VariableCache(cache_dir=tmp_path).put(2021, "acs/acs5/subject", frame)
+
+    # a fresh cache, as in a later run, reads it back from disk
+    cache = VariableCache(cache_dir=tmp_path, ttl=timedelta(hours=1))
+    assert cache.get(2021, "acs/acs5/subject").equals(frame)
+
+    path = tmp_path / "2021" / "acs__acs5__subject.parquet"
+    stale = time.time() - timedelta(hours=2).total_seconds()
+    os.utime(path, (stale, stale))
+    assert (
+        VariableCache(cache_dir=tmp_path, ttl=timedelta(hours=1)).get(
+            2021, "acs/acs5/subject"
+        )
+        is None
+    )
+
+    cache.put(2021, "acs/acs5/subject", frame)
+    cache.invalidate(dataset="acs/acs5/subject")
+    assert cache.get(2021, "acs/acs5/subject") is None
+    assert not path.exists()
+
+
+def test_variable_cache_treats_unreadable_files_as_misses(tmp_path):
+    frame = pl.DataFrame({"name": ["S2701_C01_001E"], "concept": ["Health"]})
+    VariableCache(cache_dir=tmp_path).put(2021, "acs/acs5/subject", frame)
+    assert [path.name for path in tmp_path.rglob("*")] == [
+        "2021",
+        "acs__acs5__subject.parquet",
+    ]
+
+    # as if another run were still writing it
+    path = tmp_path / "2021" / "acs__acs5__subject.parquet"
+    path.write_bytes(path.read_bytes()[:20])
+
+    cache = VariableCache(cache_dir=tmp_path)
+    assert cache.get(2021, "acs/acs5/subject") is None
+    assert cache.get_or_fetch(2021, "acs/acs5/subject", lambda: frame).equals(frame)
+    assert VariableCache(cache_dir=tmp_path).get(2021, "acs/acs5/subject").equals(frame)
+
+
+def test_endpoints_share_variable_download(mocker):
+    download = mocker.patch.object(
+        CensusAPIEndpoint,
+        "download_variable_labels",
+        return_value=pl.DataFrame(
+            {"name": ["B19013A_001E", "B19013B_001E"], "concept": ["a", "b"]}
+        ),
+    )
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", VariableCache())
+
+    for table in ["B19013A", "B19013B"]:
+        endpoint = CensusAPIEndpoint.from_url(
+            f"https://api.census.gov/data/2023/acs/acs5?get=group({table})&ucgid=0400000US09"
+        )
+        assert endpoint.fetch_variable_labels().height == 1
+
+    assert download.call_count == 1
+
+
+def test_response_cache_round_trip_and_eviction(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=200)
+    first = b'[["NAME","B19013A_001E"],["Connecticut","91000"]]'
+
+    cache.put("https://api.census.gov/data/2023/acs/acs5?get=a", first)
+    assert cache.get("https://api.census.gov/data/2023/acs/acs5?get=a") == first
+    assert cache.get("https://api.census.gov/data/2023/acs/acs5?get=b") is None
+
+    # random bytes don't compress, so the older entry has to go
+    old = time.time() - 60
+    os.utime(cache.path("https://api.census.gov/data/2023/acs/acs5?get=a"), (old, old))
+    cache.put("https://api.census.gov/data/2023/acs/acs5?get=b", os.urandom(150))
+    assert cache.get("https://api.census.gov/data/2023/acs/acs5?get=a") is None
+    assert cache.get("https://api.census.gov/data/2023/acs/acs5?get=b") is not None
+
+
+def test_response_cache_replays_endpoint_offline(tmp_path, mocker):
+    endpoint = CensusAPIEndpoint.from_url(
+        "https://api.census.gov/data/2023/acs/acs5?get=NAME,B19013A_001E&for=state:09&key=secret"
+    )
+    response = requests.Response()
+    response.status_code = 200
+    response._content = (
+        b'[["NAME","B19013A_001E","state"],["Connecticut","91000","09"]]'
+    )
+    request = mocker.patch.object(transport, "request", return_value=response)
+
+    mocker.patch.object(CensusAPIEndpoint, "response_cache", ResponseCache(tmp_path))
+    recorded = endpoint.fetch_data_to_polars()
+    assert request.call_count == 1
+
+    mocker.patch.object(
+        CensusAPIEndpoint, "response_cache", ResponseCache(tmp_path, offline=True)
+    )
+    replayed = endpoint.fetch_data_to_polars()
+    assert request.call_count == 1
+    assert replayed.drop("date_pulled").equals(recorded.drop("date_pulled"))
+    assert endpoint.response_cache.get(endpoint.url_no_key) is not None
+    assert all(b"secret" not in path.read_bytes() for path in tmp_path.rglob("*.gz"))
+
+    other = endpoint.model_copy(update={"geography": "for:state:48"})
+    with pytest.raises(OfflineCacheMissError):
+        other.fetch_data_to_polars()
+
+
+def test_response_cache_is_configured_from_settings(tmp_path):
+    check = (
+        "from src.dataops.models import CensusAPIEndpoint as E; "
+        "print(E.response_cache.cache_dir, E.response_cache.offline)"
+    )
+    env = {**os.environ, "RESPONSE_CACHE_DIR": str(tmp_path), "CENSUS_OFFLINE": "1"}
+    output = subprocess.run(
+        [sys.executable, "-c", check], env=env, capture_output=True, text=True
+    )
+    assert output.stdout.split() == [str(tmp_path), "True"]
+    assert CensusAPIEndpoint.response_cache is None
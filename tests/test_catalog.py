@@ -0,0 +1,61 @@
+import polars as pl
+import pytest
+
+from src.dataops.catalog import EndpointCatalog
+from src.dataops.models import CensusAPIEndpoint
+
+URLS = [
+    "https://api.census.gov/data/2023/acs/acs5?get=group(B19013H)&ucgid=pseudo(0400000US09$0600000)",
+    "https://api.census.gov/data/2023/acs/acs5?get=NAME,B01001_001E&for=county:*&in=state:09",
+    "https://api.census.gov/data/2023/acs/acs5?get=NAME%2CB01001_001E&for=county%3A%2A&in=state%3A09&key=abc",
+    "https://api.census.gov/data/2023/acs/acs5/subject/?get=group(S2701)&ucgid=0400000US09",
+    "https://api.census.gov/data/2020/dec/dhc?get=group(P1)&for=state:*",
+    "https://api.census.gov/data/2023/acs/acs5?get=group(B01001)&for=county:*&in=state:09",
+]
+
+
+def test_catalog_matches_from_url(monkeypatch):
+    monkeypatch.setenv("CENSUS_API_KEY", "env-key")
+    catalog = EndpointCatalog.from_urls(URLS)
+
+    expected = [CensusAPIEndpoint.from_url(url) for url in URLS]
+    assert catalog.to_endpoints() == expected
+    assert catalog.frame["url_no_key"].to_list() == [e.url_no_key for e in expected]
+    assert catalog.frame["table_type"].to_list() == [e.table_type for e in expected]
+    assert catalog.frame["api_key"].to_list()[1:3] == ["env-key", "abc"]
+
+
+def test_catalog_collects_invalid_urls():
+    urls = [
+        URLS[0],
+        "https://api.census.gov/data/1990/dec/sf1?get=P1&for=state:*",
+        "https://api.census.gov/data/2023/acs/acs5?for=state:*",
+        "https://api.census.gov/data/2023/acs/acs5?get=NAME",
+        "not a url",
+    ]
+
+    with pytest.raises(ValueError, match="4 invalid census api urls"):
+        EndpointCatalog.from_urls(urls)
+
+    catalog = EndpointCatalog.from_urls(urls, strict=False)
+    assert len(catalog) == 1
+    assert catalog.errors["url"].to_list() == urls[1:]
+
+
+def test_catalog_groups_and_finds_repeated_requests():
+    catalog = EndpointCatalog.from_portal(
+        pl.DataFrame({"endpoint": [{"url": url} for url in URLS]})
+    )
+
+    assert [key for key, _ in catalog.group_by_dataset()] == [
+        (2023, "acs/acs5"),
+        (2023, "acs/acs5/subject"),
+        (2020, "dec/dhc"),
+    ]
+    assert catalog.duplicates()["url"].to_list() == URLS[1:3]
+    assert len(catalog.unique()) == len(URLS) - 1
+
+    overlaps = catalog.overlaps()
+    assert overlaps.select("variable", "variable_other").rows() == [
+        ("B01001_001E", "group(B01001)")
+    ]
@@ -0,0 +1,49 @@
+import io
+import zipfile
+
+from src.dataops.codebook import CODEBOOK_SCHEMA, read_codebook
+
+# two variables as laid out by the SAS html report of an LLCP codebook
+CODEBOOK = b"""<html><head>
+<meta http-equiv="Content-type" content="text/html; charset=windows-1252">
+</head><body>
+<table class="systitleandfootercontainer"><tr><td>BRFSS 2023 Codebook</td></tr></table>
+<div class="branch"><a name="IDX"></a>
+<table class="table" summary="Procedure Report: Report"><thead>
+<tr><td class="l m linecontent" colspan="5">Label: State FIPS Code<br>Section&#160;Name: Record
+Identification<br>Column: 1-2<br>Type of Variable: Num<br>SAS&#160;Variable&#160;Name: _STATE<br>Question: State FIPS Code</td></tr>
+<tr><th class="c header">Value</th><th class="c header">Value Label</th><th class="c header">Frequency</th></tr>
+</thead><tbody>
+<tr><td class="c data">1</td><td class="data">Alabama</td><td class="r data">7,528</td></tr>
+<tr><td class="c data">9</td><td class="data">Connecticut</td><td class="r data">9,821</td></tr>
+</tbody></table></div>
+<div class="branch"><a name="IDX1"></a>
+<table class="table" summary="Procedure Report: Report"><thead>
+<tr><td class="l m linecontent" colspan="5">Label: Sex of Respondent<br>Section&#160;Name: Demographics<br>Column: 90<br>Type of Variable: Num<br>SAS&#160;Variable&#160;Name: SEXVAR<br>Question: Are you <i>male</i> or female?</td></tr>
+</thead><tbody>
+<tr><td class="c data">1</td><td class="data">Male</td></tr>
+<tr><td class="c data">2</td><td class="data">Female &#8212; <b>not</b> male</td></tr>
+</tbody></table></div>
+</body></html>"""
+
+
+def test_read_codebook_from_html_and_zip(tmp_path):
+    path = tmp_path / "USCODE23_LLCP.HTML"
+    path.write_bytes(CODEBOOK)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zipped:
+        zipped.writestr("readme.txt", "not the codebook")
+        zipped.writestr("USCODE23_LLCP.HTML", CODEBOOK)
+
+    codebook = read_codebook(path)
+
+    assert codebook.schema == CODEBOOK_SCHEMA
+    assert codebook.rows() == [
+        ("State FIPS Code", "Record Identification", "_STATE", "1-2", 1, 2, "Num", "1", "Alabama"),
+        ("State FIPS Code", "Record Identification", "_STATE", "1-2", 1, 2, "Num", "9", "Connecticut"),
+        ("Sex of Respondent", "Demographics", "SEXVAR", "90", 90, 90, "Num", "1", "Male"),
+        ("Sex of Respondent", "Demographics", "SEXVAR", "90", 90, 90, "Num", "2", "Female — not male"),
+    ]  # fmt: skip
+    assert read_codebook(CODEBOOK).equals(codebook)
+    assert read_codebook(archive.getvalue()).equals(codebook)
+    assert read_codebook(archive).equals(codebook)
@@ -0,0 +1,57 @@
+import io
+import json
+
+import requests
+
+from src.dataops import instrumentation, transport
+from src.dataops.models import CensusAPIEndpoint
+
+URL = "https://api.census.gov/data/2023/acs/acs5?get=NAME,B01001_001E&ucgid=0400000US09,0400000US44"
+
+
+def test_recording_times_request_decode_and_parse(mocker):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(
+        [
+            ["NAME", "B01001_001E", "ucgid"],
+            ["Connecticut", "3617176", "0400000US09"],
+            ["Rhode Island", "1095962", "0400000US44"],
+        ]
+    ).encode()
+    mocker.patch.object(transport.requests.Session, "request", return_value=response)
+    endpoint = CensusAPIEndpoint.from_url(URL)
+
+    with instrumentation.recording() as recorder:
+        data = endpoint.fetch_data_to_polars()
+
+    spans = recorder.frame()
+    assert spans["stage"].to_list() == ["http", "decode", "parse"]
+    assert spans["url"].unique().to_list() == [endpoint.url_no_key]
+    assert spans.filter(stage="http")["bytes"].item() == len(response.content)
+    assert spans.filter(stage="http")["retries"].item() == 0
+    assert spans.filter(stage="parse")["rows"].item() == data.height
+
+    summary = recorder.summary()
+    assert summary.endpoints["spans"].to_list() == [3]
+    assert summary.endpoints["bytes"].to_list() == [len(response.content)]
+    assert not instrumentation.enabled()
+
+
+def test_spans_nest_and_record_errors():
+    buffer = io.StringIO()
+    sink = instrumentation.add_sink(instrumentation.JsonLinesSink(buffer))
+    try:
+        with instrumentation.span("outer") as outer:
+            try:
+                with instrumentation.span("inner", url="u"):
+                    raise ValueError("bad")
+            except ValueError:
+                pass
+    finally:
+        instrumentation.remove_sink(sink)
+
+    inner, emitted = [json.loads(line) for line in buffer.getvalue().splitlines()]
+    assert inner["parent_id"] == outer.span_id == emitted["span_id"]
+    assert inner["error"] == "ValueError: bad"
+    assert instrumentation.span("off") is instrumentation.span("other")
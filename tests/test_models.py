@@ -1,4 +1,20 @@
-from src.dataops.models import CensusAPIEndpoint
+from datetime import datetime
+
+import polars as pl
+
+from src.dataops.cache import VariableCache
+from src.dataops.models import (
+    COMPACT_TIDY_SCHEMA,
+    LONG_COLUMNS,
+    LONG_SCHEMA,
+    CensusAPIEndpoint,
+    VariableIndex,
+    records_to_long,
+    sink_tidy_parquet,
+    split_endpoint_dimension,
+    tidy_batch,
+    variables_to_polars,
+)
 
 
 def test_from_url_multi_geo():
@@ -34,3 +50,279 @@ def test_from_url_subject():
         cls.url_no_key
         == "https://api.census.gov/data/2021/acs/acs5/subject?get=group%28S2701%29&ucgid=0400000US09"
     )
+
+
+def test_records_to_long_multi_row():
+    data = [
+        ["NAME", "B19013A_001E", "B19013A_001M", "GEO_ID", "state"],
+        ["Connecticut", "90000", "500", "0400000US09", "09"],
+        ["Texas", "70000", None, "0400000US48", "48"],
+    ]
+    df = records_to_long(data, date_pulled=datetime(2025, 1, 1))
+
+    assert df.columns == LONG_COLUMNS
+    assert df.height == 6
+    assert df["headers"].to_list() == ["B19013A_001E", "B19013A_001M", "state"] * 2
+    assert df["records"].to_list() == ["90000", "500", "09", "70000", None, "48"]
+    assert df["geo_id"].to_list() == ["0400000US09"] * 3 + ["0400000US48"] * 3
+    assert df["geo_name"].to_list() == ["Connecticut"] * 3 + ["Texas"] * 3
+    assert df["ucgid"].unique().to_list() == ["unknown"]
+
+
+def test_records_to_long_geography_only():
+    data = [["GEO_ID", "NAME", "ucgid"], ["0400000US09", "Connecticut", "0400000US09"]]
+    df = records_to_long(data, date_pulled=datetime(2025, 1, 1))
+
+    assert df.schema == LONG_SCHEMA
+    assert df.is_empty()
+
+
+def test_variables_to_polars_layouts():
+    rows = [
+        ["name", "label", "concept", "predicateType", "group", "limit"],
+        ["B19013A_001E", "Estimate!!Median", "Income", "int", "B19013A", "0"],
+        ["NAME", "Geographic Area Name", "", "string", "N/A", "0"],
+    ]
+    mapping = {
+        "variables": {
+            "B19013A_001E": {
+                "label": "Estimate!!Median",
+                "concept": "Income",
+                "predicateType": "int",
+                "group": "B19013A",
+                "limit": 0,
+            },
+            "NAME": {
+                "label": "Geographic Area Name",
+                "concept": "",
+                "predicateType": "string",
+                "group": "N/A",
+                "limit": 0,
+            },
+        }
+    }
+    date_pulled = datetime(2025, 1, 1)
+
+    from_rows = variables_to_polars(rows, date_pulled=date_pulled)
+    from_mapping = variables_to_polars(mapping, date_pulled=date_pulled)
+
+    assert from_rows.columns == rows[0] + ["date_pulled"]
+    assert from_rows.equals(from_mapping)
+
+
+def test_concept_is_resolved_once_and_never_fetched_implicitly(mocker):
+    url = "https://api.census.gov/data/2023/acs/acs5/subject?get=group(S2701)&ucgid=0400000US09"
+    endpoint = CensusAPIEndpoint.from_url(url)
+    labels = pl.DataFrame(
+        {
+            "name": ["S2701_C01_001E", "B01001_001E"],
+            "concept": ["Health Insurance", "Sex by Age"],
+        }
+    )
+    fetch = mocker.patch.object(
+        CensusAPIEndpoint, "fetch_all_variable_labels", return_value=labels
+    )
+
+    repr(endpoint)
+    assert endpoint.model_dump()["concept"] is None
+    assert endpoint.labels is None
+    fetch.assert_not_called()
+
+    assert endpoint.resolve() is endpoint
+    endpoint.resolve()
+    endpoint.fetch_variable_labels()
+
+    fetch.assert_called_once()
+    assert endpoint.concept == "Health Insurance"
+    assert endpoint.labels["name"].to_list() == ["S2701_C01_001E"]
+    assert "Health Insurance" in repr(endpoint)
+    assert endpoint == CensusAPIEndpoint.from_url(url).resolve()
+
+
+def fake_census(mocker) -> list[str]:
+    """Patches `get_json` with one tract row per request, recording urls."""
+    calls = []
+    variables = [
+        ["name", "label", "concept"],
+        ["B01001_001E", "Estimate!!Total:", "Sex by Age"],
+    ]
+
+    def get_json(self, url, cache_url):
+        calls.append(cache_url)
+        if cache_url.endswith("/variables"):
+            return variables
+        return [
+            ["GEO_ID", "NAME", "B01001_001E", "ucgid"],
+            [
+                "1400000US09001010100",
+                "Tract 101",
+                str(self.year),
+                "1400000US09001010100",
+            ],
+        ]
+
+    mocker.patch.object(CensusAPIEndpoint, "get_json", get_json)
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", VariableCache())
+    return calls
+
+
+def test_lazy_tidy_data_defers_the_data_request(mocker):
+    calls = fake_census(mocker)
+    url = "https://api.census.gov/data/2023/acs/acs5?get=group(B01001)&ucgid=1400000US09001010100"
+
+    plan = CensusAPIEndpoint.from_url(url).fetch_tidy_data(lazy=True)
+    assert isinstance(plan, pl.LazyFrame)
+    assert [call.endswith("/variables") for call in calls] == [True]
+
+    eager = CensusAPIEndpoint.from_url(url).fetch_tidy_data()
+    assert plan.collect().drop("date_pulled").equals(eager.drop("date_pulled"))
+    assert len(calls) == 3
+
+
+def test_sink_tidy_parquet_partitions_by_dataset_and_year(mocker, tmp_path):
+    fake_census(mocker)
+    endpoints = [
+        CensusAPIEndpoint.from_url(
+            f"https://api.census.gov/data/{year}/acs/acs5?get=group(B01001)&ucgid=1400000US09001010100"
+        )
+        for year in [2021, 2022, 2023]
+    ]
+
+    sink_tidy_parquet(endpoints, tmp_path)
+
+    assert sorted(p.parent.name for p in tmp_path.glob("*/*/*.parquet")) == [
+        "year=2021",
+        "year=2022",
+        "year=2023",
+    ]
+    tidy = pl.scan_parquet(tmp_path / "**/*.parquet", hive_partitioning=True).collect()
+    assert tidy.sort("year")["value"].to_list() == [2021, 2022, 2023]
+    assert tidy["dataset"].unique().to_list() == ["acs/acs5"]
+
+
+def test_tidy_batch_matches_tidy_data_per_endpoint(mocker):
+    labels = pl.DataFrame(
+        {
+            "name": ["B01001_001E", "B01001_002E", "B19013_001E"],
+            "label": ["Estimate!!Total:", "Estimate!!Total:!!Male:", "Estimate"],
+            "concept": ["Sex by Age", "Sex by Age", "Median Household Income"],
+        }
+    )
+    mocker.patch.object(
+        CensusAPIEndpoint, "fetch_all_variable_labels", return_value=labels
+    )
+    date_pulled = datetime(2024, 1, 1)
+    sex_by_age = CensusAPIEndpoint.from_url(
+        "https://api.census.gov/data/2023/acs/acs5/detail?get=group(B01001)&for=state:*"
+    )
+    income = CensusAPIEndpoint.from_url(
+        "https://api.census.gov/data/2022/acs/acs5/detail?get=group(B19013)&for=state:*"
+    )
+    data = {
+        sex_by_age.url_no_key: records_to_long(
+            [
+                ["NAME", "B01001_001E", "B01001_002E", "state"],
+                ["Connecticut", "3600000", "-666666666", "09"],
+                ["Rhode Island", "1100000", "540000", "44"],
+            ],
+            date_pulled,
+        ),
+        # starts with a header missing from the labels, whose name and
+        # concept must not be carried over from the previous endpoint
+        income.url_no_key: records_to_long(
+            [["state", "NAME", "B19013_001E"], ["09", "Connecticut", "91000"]],
+            date_pulled,
+        ),
+    }
+
+    batched = tidy_batch([sex_by_age, income], data)
+
+    expected = pl.concat(
+        [
+            endpoint.resolve().tidy_data(endpoint.labels, data[endpoint.url_no_key])
+            for endpoint in [sex_by_age, income]
+        ]
+    )
+    assert batched.equals(expected)
+    assert batched["row_id"].to_list() == [0, 1, 2, 3, 4, 0, 1]
+    assert batched.filter(pl.col("year") == 2022)["concept"].to_list() == [
+        None,
+        "median household income",
+    ]
+
+
+def test_compact_tidy_schema_and_endpoint_dimension():
+    endpoint = CensusAPIEndpoint.from_url(
+        "https://api.census.gov/data/2023/acs/acs5/detail?get=B19025_001E,B19025_001M&for=state:*"
+    )
+    labels = pl.DataFrame(
+        {
+            "name": ["B19025_001E", "B19025_001M"],
+            "label": ["Estimate!!Aggregate household income", "Margin of Error"],
+            "concept": ["Aggregate Household Income"] * 2,
+        }
+    )
+    long = records_to_long(
+        [
+            ["NAME", "B19025_001E", "B19025_001M", "state"],
+            ["California", "1234567891234", "5678", "06"],
+        ],
+        datetime(2024, 1, 1),
+    )
+
+    tidy = endpoint.tidy_data(labels, long)
+    compact = endpoint.tidy_data(labels, long, compact=True)
+
+    assert compact.schema == COMPACT_TIDY_SCHEMA
+    assert compact["value"][0] == 1234567891234  # lost as Float32
+    assert tidy["value"][0] != 1234567891234
+    assert compact["value_type"].to_list() == ["estimate", "margin_of_error", "other"]
+    assert compact.select(pl.col(pl.Categorical).cast(pl.String)).equals(
+        tidy.select(compact.select(pl.col(pl.Categorical)).columns)
+    )
+
+    facts, endpoints = split_endpoint_dimension(compact)
+    assert endpoints.height == 1
+    assert "full_url" not in facts.columns and "concept" not in facts.columns
+    restored = facts.join(endpoints, on="endpoint_id").select(compact.columns)
+    assert restored.equals(compact)
+    assert split_endpoint_dimension(tidy)[1]["endpoint_id"].equals(
+        endpoints["endpoint_id"]
+    )
+
+
+def test_variable_index_matches_groups_names_and_prefixes_exactly():
+    labels = pl.DataFrame(
+        {
+            "name": [
+                "NAME",
+                "B19013_001E",
+                "B19013_001M",
+                "B19013A_001E",
+                "B19013A_001M",
+                "S2701_C01_001E",
+            ],
+            "group": ["N/A", "B19013", "B19013", "B19013A", "B19013A", "S2701"],
+        }
+    )
+    index = VariableIndex.for_labels(labels)
+    assert VariableIndex.for_labels(labels) is index
+
+    def names(variables):
+        return index.lookup(variables)["name"].to_list()
+
+    # a group no longer matches the groups it is a prefix of
+    assert names(["group(B19013)"]) == ["B19013_001E", "B19013_001M"]
+    assert names(["NAME", "B19013A_001M", "B19013A_001E"]) == [
+        "NAME",
+        "B19013A_001E",
+        "B19013A_001M",
+    ]
+    assert names(["B19013*"]) == labels["name"][1:5].to_list()
+    assert names(["group(B99999)", "B99999_001E"]) == []
+
+    # without a group column, groups fall back to the table id
+    endpoint = CensusAPIEndpoint.from_url(
+        "https://api.census.gov/data/2023/acs/acs5/subject?get=group(S2701)&ucgid=0400000US09"
+    )
+    assert endpoint.filter_variable_labels(labels.drop("group")).height == 1
@@ -0,0 +1,137 @@
+import asyncio
+
+import httpx
+import polars as pl
+
+from src.dataops.batch import fetch_tidy_batch_async
+from src.dataops.cache import VariableCache
+from src.dataops.models import CensusAPIEndpoint
+from src.dataops.planner import plan_requests
+
+TABLES = [f"B19013{race}" for race in "ABCDEFGHI"]
+
+VARIABLES = [
+    ["name", "label", "concept", "group", "attributes"],
+    ["GEO_ID", "Geography", None, "N/A", "NAME"],
+    ["NAME", "Geographic Area Name", None, "N/A", None],
+] + [
+    [
+        f"{table}_001{kind}",
+        f"{label}!!Median household income",
+        f"Median Household Income ({table})",
+        table,
+        f"{table}_001{kind}A",
+    ]
+    for table in TABLES
+    for kind, label in [("E", "Estimate"), ("M", "Margin of Error")]
+]
+
+
+def census_server(calls: list[str]) -> httpx.MockTransport:
+    """Answers data requests for explicit variables or a single group()."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(str(request.url))
+        if request.url.path.endswith("/variables"):
+            return httpx.Response(200, json=VARIABLES)
+
+        columns = request.url.params["get"].split(",")
+        if columns[0].startswith("group("):
+            table = columns[0][len("group(") : -1]
+            columns = ["GEO_ID", "NAME"] + [
+                f"{table}_001{suffix}" for suffix in ["E", "EA", "M", "MA"]
+            ]
+
+        def value(column: str) -> str | None:
+            if column == "GEO_ID":
+                return "0400000US09"
+            if column == "NAME":
+                return "Connecticut"
+            if column.endswith("A"):
+                return None
+            return str(sum(map(ord, column)))
+
+        return httpx.Response(
+            200,
+            json=[
+                columns + ["ucgid"],
+                [value(column) for column in columns] + ["0400000US09"],
+            ],
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def endpoints() -> list[CensusAPIEndpoint]:
+    return [
+        CensusAPIEndpoint.from_url(
+            f"https://api.census.gov/data/2023/acs/acs5?get={get}&ucgid=0400000US09"
+        )
+        for get in [f"group({table})" for table in TABLES] + ["NAME,B19013A_001E"]
+    ]
+
+
+def fetch(coalesce: bool, calls: list[str]) -> dict[str, pl.DataFrame]:
+    async def run():
+        async with httpx.AsyncClient(transport=census_server(calls)) as client:
+            return await fetch_tidy_batch_async(
+                endpoints(), concat=False, client=client, coalesce=coalesce
+            )
+
+    return asyncio.run(run())
+
+
+def test_plan_packs_endpoints_within_the_variable_limit(mocker):
+    cache = VariableCache()
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", cache)
+    cache.put(
+        2023, "acs/acs5", pl.DataFrame(VARIABLES[1:], schema=VARIABLES[0], orient="row")
+    )
+
+    plan = plan_requests(endpoints())
+    assert len(plan) == 1
+    assert len(plan[0].members) == len(TABLES) + 1
+    # GEO_ID and NAME once, then E, EA, M, MA for each table
+    assert len(plan[0].endpoint.variables) == 2 + 4 * len(TABLES)
+
+    plan = plan_requests(endpoints(), max_variables=10)
+    assert [len(request.endpoint.variables) for request in plan] == [10, 10, 10, 10, 1]
+    # the leftover group is requested unchanged
+    assert plan[-1].endpoint.variables == ["group(B19013I)"]
+    assert sum(len(request.members) for request in plan) == len(TABLES) + 1
+
+
+def test_plan_expands_groups_without_group_metadata(mocker):
+    cache = VariableCache()
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", cache)
+    # the /variables layout with only name, label and concept
+    variables = [row[:3] for row in VARIABLES[1:]] + [
+        [f"{table}_001{kind}A", "Annotation", None] for table in TABLES for kind in "EM"
+    ]
+    cache.put(
+        2023,
+        "acs/acs5",
+        pl.DataFrame(variables, schema=VARIABLES[0][:3], orient="row"),
+    )
+
+    plan = plan_requests(endpoints()[:2])
+    assert len(plan) == 1
+    assert plan[0].endpoint.variables == ["GEO_ID", "NAME"] + [
+        f"{table}_001{suffix}"
+        for table in TABLES[:2]
+        for suffix in ["E", "EA", "M", "MA"]
+    ]
+
+
+def test_coalesced_batch_matches_separate_requests(mocker):
+    mocker.patch.object(CensusAPIEndpoint, "variable_cache", VariableCache())
+    separate_calls, coalesced_calls = [], []
+
+    separate = fetch(False, separate_calls)
+    coalesced = fetch(True, coalesced_calls)
+
+    assert len(separate_calls) == len(TABLES) + 2
+    assert len(coalesced_calls) == 1  # metadata is already cached
+    assert set(coalesced) == set(separate)
+    for url, frame in separate.items():
+        assert coalesced[url].drop("date_pulled").equals(frame.drop("date_pulled"))
@@ -0,0 +1,160 @@
+import polars as pl
+import requests
+
+from src.dataops import portal, transport
+from src.dataops.models import ApplicationSettings
+
+SETTINGS = ApplicationSettings(domain="data.ct.gov", source_id="abcd-1234")
+
+ROWS = pl.DataFrame(
+    {
+        "endpoint": [f"https://api.census.gov/data/{i}" for i in range(5)],
+        "dataset": ["acs/acs5", "acs/acs1", "acs/acs5", "dec/dhc", "acs/acs5"],
+        "year": ["2019", "2020", "2021", "2022", "2023"],
+    }
+)
+
+
+def fake_csv_portal(mocker, rows: pl.DataFrame) -> list[dict]:
+    calls = []
+
+    def fake_request(method, url, session=None, params=None, **kwargs):
+        calls.append(params)
+        page = rows
+        if "$select" in params:
+            page = page.select(params["$select"].split(","))
+        offset = params.get("$offset", 0)
+        page = page.slice(offset, params["$limit"])
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = page.write_csv().encode()
+        return response
+
+    mocker.patch.object(transport, "request", side_effect=fake_request)
+    return calls
+
+
+def test_scan_data_pages_lazily(mocker):
+    calls = fake_csv_portal(mocker, ROWS)
+
+    lf = portal.fetch_data(settings=SETTINGS, stream=True, page_size=2)
+    assert isinstance(lf, pl.LazyFrame)
+    assert calls == []
+
+    df = lf.collect()
+    assert df.equals(ROWS)
+    # one single-row request for the schema, then the pages
+    assert [call.get("$offset") for call in calls] == [None, 0, 2, 4]
+    assert all(call["$order"] == ":id" for call in calls[1:])
+
+
+def test_scan_data_pushes_down_projection_and_filters(mocker):
+    calls = fake_csv_portal(mocker, ROWS)
+
+    df = (
+        portal.scan_data(settings=SETTINGS, page_size=2)
+        .filter(pl.col("dataset") == "acs/acs5")
+        .select("year")
+        .collect()
+    )
+
+    assert df["year"].to_list() == ["2019", "2021", "2023"]
+    assert set(calls[-1]["$select"].split(",")) == {"dataset", "year"}
+
+    calls.clear()
+    assert (
+        portal.scan_data(settings=SETTINGS, page_size=2).head(1).collect().height == 1
+    )
+    assert [call.get("$offset") for call in calls] == [None, 0]
+
+
+def test_scan_data_leaves_out_an_empty_select(mocker):
+    calls = fake_csv_portal(mocker, ROWS)
+    # call the page source directly, as polars would with no columns
+    mocker.patch.object(portal, "register_io_source", lambda pages, schema: pages)
+
+    pages = portal.scan_data(settings=SETTINGS, page_size=10)
+    assert sum(page.height for page in pages([], None, None, None)) == ROWS.height
+    assert "$select" not in calls[-1]
+
+
+def fake_publish_portal(mocker) -> list[tuple[str, pl.DataFrame]]:
+    sent = []
+
+    def fake_request(method, url, session=None, data=None, **kwargs):
+        batch = pl.read_csv(data, infer_schema=False)
+        sent.append((method, batch))
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = (
+            b'{"Rows Created": %d, "Rows Updated": 0, "Errors": 0}' % batch.height
+        )
+        return response
+
+    mocker.patch.object(transport, "request", side_effect=fake_request)
+    return sent
+
+
+def test_replace_data_in_batches(mocker):
+    sent = fake_publish_portal(mocker)
+
+    report = portal.replace_data(
+        ROWS, target="efgh-5678", settings=SETTINGS, batch_size=2, max_workers=2
+    )
+
+    assert [method for method, _ in sent] == ["PUT", "POST", "POST"]
+    assert pl.concat(batch for _, batch in sent).sort("year").equals(ROWS)
+    assert report.rows == report.rows_created == 5
+    assert report.batches == 3
+    assert report.rows_per_second > 0
+
+
+def test_replace_data_single_request(mocker):
+    sent = fake_publish_portal(mocker)
+
+    report = portal.replace_data(ROWS, target="efgh-5678", settings=SETTINGS)
+
+    assert [method for method, _ in sent] == ["PUT"]
+    assert report.rows == 5
+
+
+def test_publish_delta_sends_only_changes(mocker):
+    published = portal.with_row_hash(ROWS.rename({"endpoint": "id"}), key="id")
+    # id 1 changes, id 4 disappears, id 5 is new
+    new = pl.concat(
+        [
+            ROWS.rename({"endpoint": "id"}).head(4),
+            pl.DataFrame({"id": ["new"], "dataset": ["acs/acs5"], "year": ["2024"]}),
+        ]
+    ).with_columns(
+        pl.when(pl.col("id").str.ends_with("/1"))
+        .then(pl.lit("2021"))
+        .otherwise(pl.col("year"))
+        .alias("year")
+    )
+    sent = []
+
+    def fake_request(method, url, session=None, params=None, data=None, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        if method == "GET":
+            page = published.select(params["$select"].split(","))
+            response._content = (
+                page.slice(params.get("$offset", 0)).write_csv().encode()
+            )
+        else:
+            sent.append(pl.read_csv(data, infer_schema=False))
+            response._content = b"{}"
+        return response
+
+    mocker.patch.object(transport, "request", side_effect=fake_request)
+
+    report = portal.publish_delta(new, key="id", target="efgh-5678", settings=SETTINGS)
+
+    upserts, deletes = sent
+    assert upserts["id"].to_list() == [ROWS["endpoint"][1], "new"]
+    assert "row_hash" in upserts.columns
+    assert deletes.to_dicts() == [{"id": ROWS["endpoint"][4], ":deleted": "true"}]
+    assert report.rows == 3
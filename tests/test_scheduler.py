@@ -0,0 +1,91 @@
+import json
+from datetime import datetime
+
+import polars as pl
+import requests
+
+from src.dataops import transport
+from src.dataops.models import TIDY_SCHEMA, CensusAPIEndpoint
+from src.dataops.scheduler import FreshnessScheduler
+from src.dataops.warehouse import TidyWarehouse
+
+
+def census_catalog(modified: dict[tuple[int, str], str]):
+    """A fake `transport.request` serving `/data.json` and variables HEADs."""
+
+    def request(method, url, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        if url.endswith("data.json"):
+            response._content = json.dumps(
+                {
+                    "dataset": [
+                        {
+                            "c_vintage": year,
+                            "c_dataset": dataset.split("/"),
+                            "modified": stamp,
+                        }
+                        for (year, dataset), stamp in modified.items()
+                    ]
+                }
+            ).encode()
+        else:
+            response.headers["ETag"] = '"variables-v1"'
+        return response
+
+    return request
+
+
+def pulled(endpoint: CensusAPIEndpoint) -> pl.DataFrame:
+    """A single tidy row for the endpoint."""
+    row = {
+        "dataset": endpoint.dataset,
+        "year": endpoint.year,
+        "full_url": endpoint.url_no_key,
+        "date_pulled": datetime(2025, 1, 1),
+    }
+    return pl.DataFrame([row], schema=TIDY_SCHEMA)
+
+
+def test_scheduler_skips_unchanged_endpoints(tmp_path, mocker):
+    endpoints = [
+        CensusAPIEndpoint.from_url(url)
+        for url in [
+            "https://api.census.gov/data/2022/acs/acs5?get=group(B01001)&ucgid=0400000US09",
+            "https://api.census.gov/data/2023/acs/acs5?get=group(B01001)&ucgid=0400000US09",
+            "https://api.census.gov/data/2023/pep/charv?get=POP&ucgid=0400000US09",
+        ]
+    ]
+    modified = {(2022, "acs/acs5"): "2023-12-07", (2023, "acs/acs5"): "2024-12-12"}
+    request = mocker.patch.object(
+        transport, "request", side_effect=census_catalog(modified)
+    )
+    fetch = mocker.patch.object(
+        CensusAPIEndpoint,
+        "fetch_tidy_data",
+        autospec=True,
+        side_effect=lambda self, shard: pulled(self),
+    )
+    scheduler = FreshnessScheduler(tmp_path / "state.parquet")
+    warehouse = TidyWarehouse(tmp_path / "warehouse")
+
+    assert scheduler.run(endpoints, warehouse).height == 3
+    assert scheduler.state["version"].to_list() == [
+        "2023-12-07",
+        "2024-12-12",
+        '"variables-v1"',
+    ]
+    # the catalog is read once, only the unlisted dataset is HEAD-checked
+    assert [call.args[0] for call in request.call_args_list] == ["GET", "HEAD"]
+
+    # nothing changed upstream: a no-op
+    assert scheduler.run(endpoints, warehouse).is_empty()
+    assert fetch.call_count == 3
+
+    # a new 2023 release only refetches the 2023 acs endpoint
+    modified[(2023, "acs/acs5")] = "2025-01-30"
+    assert scheduler.run(endpoints, warehouse)["url_no_key"].to_list() == [
+        endpoints[1].url_no_key
+    ]
+    assert fetch.call_count == 4
+    assert warehouse.scan().collect().height == 3
@@ -0,0 +1,125 @@
+import asyncio
+
+import httpx
+
+from src.dataops import sharding
+from src.dataops.models import CensusAPIEndpoint
+from src.dataops.sharding import fetch_sharded, fetch_sharded_async, plan_shards
+
+COUNTIES = ["001", "003", "005"]
+
+
+def census_server(calls: list[httpx.URL]) -> httpx.MockTransport:
+    """Two tracts per county of state 09, by `for`/`in` or by ucgid."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url)
+        params = request.url.params
+
+        if params.get("for") == "county:*":
+            assert params["in"] == "state:09"
+            rows = [["NAME", "state", "county"]]
+            # a repeated parent must not be fetched twice
+            rows += [[f"County {c}", "09", c] for c in COUNTIES + COUNTIES[:1]]
+            return httpx.Response(200, json=rows)
+
+        if params.get("ucgid") == "pseudo(0400000US09$0500000)":
+            rows = [["GEO_ID", "ucgid"]]
+            rows += [[f"0500000US09{c}"] * 2 for c in COUNTIES]
+            return httpx.Response(200, json=rows)
+
+        if "ucgid" in params:
+            county = params["ucgid"][len("pseudo(0500000US09") :][:3]
+            return httpx.Response(
+                200,
+                json=[["GEO_ID", "B01001_001E", "ucgid"]]
+                + [
+                    [f"1400000US09{county}{t}", "100", f"1400000US09{county}{t}"]
+                    for t in ["000100", "000200"]
+                ],
+            )
+
+        state, county = [part.split(":")[1] for part in params["in"].split(" ")]
+        return httpx.Response(
+            200,
+            json=[["NAME", "B01001_001E", "state", "county", "tract"]]
+            + [[f"Tract {t}", "100", state, county, t] for t in ["000100", "000200"]],
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def fetch(url: str, calls: list[httpx.URL]):
+    async def run():
+        async with httpx.AsyncClient(transport=census_server(calls)) as client:
+            return await fetch_sharded_async(
+                CensusAPIEndpoint.from_url(url), client=client
+            )
+
+    return asyncio.run(run())
+
+
+def test_plan_shards_recognizes_geographies():
+    def plan(url):
+        return plan_shards(CensusAPIEndpoint.from_url(url))
+
+    base = "https://api.census.gov/data/2023/acs/acs5?get=NAME"
+    assert plan(f"{base}&for=tract:*").discovery.geography == "for:state:*"
+    assert plan(f"{base}&for=tract:*&in=state:09").discovery.within == "state:09"
+    assert plan(f"{base}&for=block%20group:*&in=state:09&in=county:*") is not None
+    assert plan(f"{base}&for=tract:*&in=state:09%20county:001") is None
+    assert plan(f"{base}&for=county:*") is None
+    assert plan(f"{base}&ucgid=0400000US09") is None
+    assert (
+        plan(f"{base}&ucgid=pseudo(0100000US$1400000)").discovery.geography
+        == "ucgid:pseudo(0100000US$0400000)"
+    )
+
+
+def test_tracts_are_fetched_per_county():
+    calls = []
+    frame = fetch(
+        "https://api.census.gov/data/2023/acs/acs5?get=NAME,B01001_001E&for=tract:*&in=state:09",
+        calls,
+    )
+
+    assert len(calls) == 1 + len(COUNTIES)
+    assert {call.params["in"] for call in calls[1:]} == {
+        f"state:09 county:{c}" for c in COUNTIES
+    }
+    # B01001_001E, state, county and tract for two tracts per county
+    assert frame.height == len(COUNTIES) * 2 * 4
+    assert frame.filter(headers="tract")["records"].n_unique() == 2
+    assert (
+        frame.filter(headers="county")["records"].unique().sort().to_list() == COUNTIES
+    )
+
+
+def test_pseudo_ucgid_is_fetched_per_county():
+    calls = []
+    frame = fetch(
+        "https://api.census.gov/data/2023/acs/acs5?get=GEO_ID,B01001_001E&ucgid=pseudo(0400000US09$1400000)",
+        calls,
+    )
+
+    assert len(calls) == 1 + len(COUNTIES)
+    assert frame.height == len(COUNTIES) * 2
+    assert frame["geo_id"].n_unique() == frame.height
+
+
+def test_fetch_sharded_runs_inside_an_event_loop(mocker):
+    calls = []
+    mocker.patch.object(
+        sharding,
+        "_client",
+        lambda *args: httpx.AsyncClient(transport=census_server(calls)),
+    )
+    endpoint = CensusAPIEndpoint.from_url(
+        "https://api.census.gov/data/2023/acs/acs5?get=NAME,B01001_001E&for=tract:*&in=state:09"
+    )
+
+    async def notebook_cell():
+        return fetch_sharded(endpoint)
+
+    assert asyncio.run(notebook_cell()).height == len(COUNTIES) * 2 * 4
+    assert len(calls) == 1 + len(COUNTIES)
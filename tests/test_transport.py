@@ -0,0 +1,131 @@
+import pytest
+import requests
+
+from src.dataops import transport
+from src.dataops.models import ApplicationSettings
+from src.dataops.transport import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ConnectionPool,
+    RequestFailedError,
+    RetryPolicy,
+    TransientRequestError,
+    parse_retry_after,
+)
+
+URL = "https://api.census.gov/data/2023/acs/acs5?get=NAME&for=state:09"
+
+
+def make_response(status_code: int, headers: dict | None = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = b"[]"
+    return response
+
+
+def test_request_retries_transient_errors(mocker):
+    sleep = mocker.patch.object(transport.time, "sleep")
+    session = mocker.Mock()
+    session.request.side_effect = [
+        make_response(503),
+        make_response(429, {"Retry-After": "7"}),
+        make_response(200),
+    ]
+
+    response = transport.request(
+        "GET", URL, session=session, policy=RetryPolicy(), breaker=CircuitBreaker()
+    )
+
+    assert response.status_code == 200
+    assert session.request.call_count == 3
+    assert sleep.call_args_list[-1] == mocker.call(7.0)
+
+
+def test_request_raises_typed_errors(mocker):
+    mocker.patch.object(transport.time, "sleep")
+    session = mocker.Mock()
+    session.request.return_value = make_response(404)
+
+    with pytest.raises(RequestFailedError) as error:
+        transport.request("GET", URL, session=session, breaker=CircuitBreaker())
+    assert not isinstance(error.value, TransientRequestError)
+    assert error.value.status_code == 404
+    assert session.request.call_count == 1
+
+    session.request.return_value = make_response(503)
+    with pytest.raises(TransientRequestError) as error:
+        transport.request(
+            "GET",
+            URL,
+            session=session,
+            policy=RetryPolicy(max_attempts=3),
+            breaker=CircuitBreaker(),
+        )
+    assert error.value.attempts == 3
+
+
+def test_circuit_breaker_fails_fast(mocker):
+    mocker.patch.object(transport.time, "sleep")
+    session = mocker.Mock()
+    session.request.side_effect = requests.ConnectionError("refused")
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    with pytest.raises(CircuitOpenError):
+        transport.request(
+            "GET", URL, session=session, policy=RetryPolicy(), breaker=breaker
+        )
+    assert session.request.call_count == 2
+
+    with pytest.raises(CircuitOpenError):
+        transport.request("GET", URL, session=session, breaker=breaker)
+    assert session.request.call_count == 2
+
+
+def test_retry_policy_delay():
+    policy = RetryPolicy(backoff_base=1, backoff_max=10, jitter=False)
+
+    assert [policy.delay(attempt) for attempt in range(1, 6)] == [1, 2, 4, 8, 10]
+    assert policy.delay(1, retry_after=30) == 10
+    assert 0 <= RetryPolicy(backoff_base=1).delay(3) <= 4
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+
+
+def test_connection_pool_reuses_sessions_and_clients(mocker):
+    settings = ApplicationSettings(
+        domain="data.ct.gov", socrata_token="token", http_pool_size=4, http2=False
+    )
+    pool = ConnectionPool.from_settings(settings)
+    mocker.patch.object(transport, "connection_pool", pool)
+    send = mocker.patch.object(
+        requests.Session, "request", autospec=True, return_value=make_response(200)
+    )
+
+    transport.request("GET", URL, breaker=CircuitBreaker())
+    transport.request("GET", URL, breaker=CircuitBreaker())
+    assert {id(call.args[0]) for call in send.call_args_list} == {id(pool.session)}
+    assert send.call_args.kwargs["timeout"] == pool.timeout
+    assert pool.session.get_adapter(URL)._pool_maxsize == 4
+
+    client = pool.socrata(settings)
+    assert pool.socrata(settings.model_copy()) is client
+    assert client.session.headers["X-App-token"] == "token"
+    assert client.session.get_adapter("https://data.ct.gov")._pool_maxsize == 4
+
+    session = pool.session
+    pool.close()
+    assert pool.session is not session
+    assert pool.socrata(settings) is not client
+
+
+def test_shared_pool_is_configured_from_settings(mocker, monkeypatch):
+    monkeypatch.setenv("HTTP_POOL_SIZE", "3")
+    monkeypatch.setenv("HTTP_TIMEOUT", "12.5")
+    mocker.patch.object(transport, "connection_pool", None)
+
+    pool = transport.shared_pool()
+    assert (pool.pool_size, pool.timeout) == (3, 12.5)
+    assert transport.shared_pool() is pool
+    assert pool.async_client().timeout.read == 12.5
@@ -0,0 +1,119 @@
+from datetime import datetime
+
+import polars as pl
+import pytest
+
+from src.dataops.models import TIDY_SCHEMA, CensusAPIEndpoint, compact_tidy
+from src.dataops.warehouse import WAREHOUSE_SCHEMA, TidyWarehouse
+
+
+def tidy(
+    dataset: str, year: int, geo: str, values: list[float], url: str | None = None
+) -> pl.DataFrame:
+    url = url or f"https://api.census.gov/data/{year}/{dataset}?ucgid={geo}"
+    return pl.DataFrame(
+        {
+            "row_id": range(len(values)),
+            "dataset": dataset,
+            "year": year,
+            "concept": "sex by age",
+            "geo_id": geo,
+            "ucgid": geo,
+            "geo_name": "Connecticut",
+            "variable_id": [f"B01001_{i + 1:03d}E" for i in range(len(values))],
+            "variable_name": "total",
+            "value": values,
+            "value_type": "estimate",
+            "full_url": url,
+            "date_pulled": datetime(year, 1, 1),
+        },
+        schema=TIDY_SCHEMA,
+    )
+
+
+def test_warehouse_upserts_appends_and_scans(tmp_path):
+    warehouse = TidyWarehouse(tmp_path)
+    assert warehouse.scan().collect().schema == WAREHOUSE_SCHEMA
+
+    warehouse.write(
+        pl.concat(
+            [
+                tidy("acs/acs5", 2022, "0400000US09", [1, 2]),
+                tidy("acs/acs5", 2023, "0400000US09", [3, 4]),
+                tidy("dec/dhc", 2020, "0400000US09", [5]),
+            ]
+        )
+    )
+    assert (tmp_path / "dataset=acs%2Facs5" / "year=2023").is_dir()
+    assert warehouse.pulls()["rows"].to_list() == [2, 2, 1]
+
+    # a second pull of 2023 replaces the first, unless appended
+    warehouse.write(tidy("acs/acs5", 2023, "0400000US09", [30, 40, 50]))
+    warehouse.write(tidy("acs/acs5", 2023, "0400000US44", [6]), mode="append")
+    assert warehouse.manifest.height == 4
+    assert len(list(tmp_path.glob("*/*/*.parquet"))) == 4
+
+    scanned = warehouse.scan(dataset="acs/acs5", year=2023).collect()
+    assert scanned.schema == WAREHOUSE_SCHEMA
+    assert sorted(scanned["value"].to_list()) == [6, 30, 40, 50]
+
+    lazy = warehouse.scan().filter(pl.col("year") < 2023, pl.col("value") > 1)
+    assert sorted(lazy.collect()["value"].to_list()) == [2, 5]
+
+    assert warehouse.delete(scanned["full_url"].unique()) == 4
+    assert warehouse.scan().collect().height == 3
+
+
+def test_warehouse_sync_skips_stored_pulls(tmp_path, mocker):
+    endpoints = [
+        CensusAPIEndpoint.from_url(
+            f"https://api.census.gov/data/{year}/acs/acs5?get=group(B01001)&ucgid=0400000US09"
+        )
+        for year in [2022, 2023]
+    ]
+    fetch = mocker.patch.object(
+        CensusAPIEndpoint,
+        "fetch_tidy_data",
+        autospec=True,
+        side_effect=lambda self, shard: tidy(
+            self.dataset, self.year, "0400000US09", [1], url=self.url_no_key
+        ),
+    )
+    warehouse = TidyWarehouse(tmp_path)
+
+    warehouse.sync(endpoints[:1])
+    entries = warehouse.sync(endpoints)
+
+    assert fetch.call_count == 2
+    assert entries["url_no_key"].to_list() == [endpoints[1].url_no_key]
+    assert warehouse.sync(endpoints, refresh=True).height == 2
+    assert warehouse.scan().collect().height == 2
+
+
+def test_warehouse_stores_compact_frames_as_tidy(tmp_path):
+    warehouse = TidyWarehouse(tmp_path)
+    warehouse.write(tidy("acs/acs5", 2022, "0400000US09", [1, 2]))
+    compact = tidy("acs/acs5", 2023, "0400000US09", [3, 4]).with_columns(
+        variable_id=pl.Series(["B01001_001E", "B01001_001EA"]),
+        value_type=pl.Series(["estimate", "EA"]),
+    )
+    compact = compact_tidy(compact).with_columns(
+        value=pl.Series([1234567891234, 4], dtype=pl.Float64)
+    )
+    warehouse.write(compact)
+
+    scanned = warehouse.scan().collect().sort("year", "row_id")
+    assert scanned.schema == WAREHOUSE_SCHEMA
+    assert scanned["value"].to_list() == [1, 2, 1234567891234, 4]
+    assert scanned["value_type"].to_list()[2:] == ["estimate", "EA"]
+
+
+def test_warehouse_keeps_old_pull_when_manifest_write_fails(tmp_path, mocker):
+    warehouse = TidyWarehouse(tmp_path)
+    warehouse.write(tidy("acs/acs5", 2023, "0400000US09", [1, 2]))
+
+    mocker.patch.object(warehouse, "_write_manifest", side_effect=OSError("full"))
+    with pytest.raises(OSError):
+        warehouse.write(tidy("acs/acs5", 2023, "0400000US09", [3, 4]))
+
+    assert warehouse.scan().collect()["value"].to_list() == [1, 2]